@@ -0,0 +1,100 @@
+from datetime import datetime
+
+import rollups
+from profile_cache import profiles
+import tracing
+
+# Data paths behind the app views, kept free of Tk/Flet so the benchmark and
+# other headless callers run exactly the code the UI runs.
+
+EXPORT_FIELDS = ['id', 'activity_type', 'activity_detail', 'amount', 'co2_impact', 'description', 'timestamp', 'display_name', 'user_id']
+
+
+def recent_logs(store, user_id=None, limit=200):
+    return list(store.query_logs(user_id=user_id, order='desc', limit=limit))
+
+
+# Summary tab ranges -> number of months (None = everything on record)
+SUMMARY_RANGES = {'12 months': 12, '5 years': 60, 'All time': None}
+
+
+def monthly_totals(store, user_id=None):
+    # {'YYYY-MM': kg} straight from the rollups, whatever the range
+    return store.monthly_totals(user_id)
+
+
+@tracing.traced('agg.monthly_series', 'agg')
+def monthly_series(totals, now=None, months=12):
+    # ordered labels/values for the last `months` calendar months
+    now = now or datetime.now()
+    if months is None:
+        first = min((k for k, v in totals.items() if v), default=None)
+        if first is None:
+            months = 12
+        else:
+            y, m = int(first[:4]), int(first[5:7])
+            months = max((now.year - y) * 12 + now.month - m + 1, 1)
+    labels = rollups.month_keys(now, months)
+    values = [round(totals.get(m, 0), 2) for m in labels]
+    return labels, values
+
+
+def leaderboard_totals(store):
+    totals = store.user_totals()
+    return totals, sum(totals.values())
+
+
+@tracing.traced('agg.leaderboard_rows', 'agg')
+def leaderboard_rows(store, totals, current_user=None):
+    # (uid, display_name, kg) rows; names come through the shared profile
+    # cache, which batches the misses
+    label_map = {}
+    lookup = []
+    for uid in totals.keys():
+        if uid == 'default_user':
+            label_map[uid] = 'Anonymous'
+        elif current_user and uid == current_user.get('uid'):
+            label_map[uid] = f"You ({current_user.get('email')})"
+        else:
+            lookup.append(uid)
+    try:
+        names = profiles.display_names(store, lookup)
+    except Exception:
+        names = {}
+    for uid in lookup:
+        label_map[uid] = names.get(uid) or uid
+    return [(uid, label_map.get(uid, uid), kg) for uid, kg in totals.items()]
+
+
+def export_rows(store, page_size=1000):
+    # every log, newest first, with the owner's display name; pages through
+    # the store and resolves names one page at a time so memory stays flat
+    for_page = []
+    for item in store.scan_logs(order='desc', page_size=page_size):
+        for_page.append(item)
+        if len(for_page) >= page_size:
+            yield from _export_page(store, for_page)
+            for_page = []
+    if for_page:
+        yield from _export_page(store, for_page)
+
+
+def _export_page(store, logs):
+    try:
+        names = profiles.display_names(store, [d.get('user_id', '') for _, d in logs])
+    except Exception:
+        names = {}
+    for doc_id, d in logs:
+        ts = d.get('timestamp')
+        uid = d.get('user_id', '')
+        yield {
+            'id': doc_id,
+            'activity_type': d.get('activity_type'),
+            'activity_detail': d.get('activity_detail'),
+            'amount': d.get('amount'),
+            'co2_impact': d.get('co2_impact'),
+            'description': d.get('description'),
+            'timestamp': ts.strftime('%Y-%m-%d %H:%M:%S') if hasattr(ts, 'strftime') else '',
+            'display_name': names.get(uid, '') if uid else '',
+            'user_id': uid,
+        }
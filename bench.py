@@ -0,0 +1,284 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import aggregations
+import csv_export
+from emissions import ACTIVITY_DETAILS, ACTIVITY_EMISSIONS, calculate_co2_impact
+from profile_cache import profiles
+import rollups
+from storage import LogStore, SqliteStore
+from weekly_window import DailyWindow
+
+# Benchmarks for the data paths behind the app views, run against a local
+# SQLite store filled with a synthetic dataset:
+#
+#   python bench.py --logs 100000 --users 1000
+#   python bench.py --logs 1000000 --users 10000 --db /tmp/bench.db --compare bench_results/old.json
+#
+# Each path reports median/min latency, documents read and peak traced
+# memory. Results are written as JSON; --compare exits non-zero when a path's
+# median latency regressed by more than --threshold against an earlier run.
+
+# relative frequency of each activity and a typical amount for it
+ACTIVITY_MIX = {
+    'Car (per mile)': (30, 12.0),
+    'Bus (per mile)': (8, 6.0),
+    'Train (per mile)': (5, 20.0),
+    'Bike (per mile)': (6, 4.0),
+    'Walk (per mile)': (6, 1.5),
+    'Electric Vehicle (per mile)': (4, 15.0),
+    'Beef Meal': (7, 1.0),
+    'Chicken Meal': (10, 1.0),
+    'Vegetarian Meal': (8, 1.0),
+    'Vegan Meal': (4, 1.0),
+    'Electricity (per kWh)': (9, 10.0),
+    'Natural Gas (per therm)': (3, 2.0),
+}
+DESCRIPTIONS = ['', '', '', 'Morning commute', 'Lunch', 'Weekend trip', 'Home office', 'Groceries']
+
+
+def _activity_type(detail):
+    for t, details in ACTIVITY_DETAILS.items():
+        if detail in details:
+            return t
+    return 'Energy'
+
+
+def user_ids(n_users):
+    return [f'user{i:06d}' for i in range(n_users)]
+
+
+def generate_logs(n_logs, n_users, days=400, seed=0, now=None):
+    # (doc_id, data) pairs; a few heavy users log far more than the rest
+    rng = random.Random(seed)
+    now = now or datetime.now()
+    uids = user_ids(n_users)
+    weights = [rng.paretovariate(1.2) for _ in uids]
+    details = [d for d in ACTIVITY_MIX if d in ACTIVITY_EMISSIONS]
+    detail_weights = [ACTIVITY_MIX[d][0] for d in details]
+    span = days * 86400
+    batch = 10000
+    for start in range(0, n_logs, batch):
+        count = min(batch, n_logs - start)
+        owners = rng.choices(uids, weights=weights, k=count)
+        picks = rng.choices(details, weights=detail_weights, k=count)
+        for i in range(count):
+            detail = picks[i]
+            typical = ACTIVITY_MIX[detail][1]
+            amount = 1.0 if typical == 1.0 else round(rng.lognormvariate(0, 0.6) * typical, 1)
+            yield f'log{start + i:09d}', {
+                'activity_type': _activity_type(detail),
+                'activity_detail': detail,
+                'amount': amount,
+                'description': rng.choice(DESCRIPTIONS),
+                'co2_impact': calculate_co2_impact(detail, amount),
+                'timestamp': now - timedelta(seconds=rng.random() * span),
+                'user_id': owners[i],
+            }
+
+
+def populate(store, n_logs, n_users, days=400, seed=0):
+    rng = random.Random(seed + 1)
+    for uid in user_ids(n_users):
+        # most users have set a display name
+        if rng.random() < 0.8:
+            store.set_profile(uid, {'display_name': f'Eco {uid[4:]}', 'weekly_goal_kg': 50})
+    return store.add_logs(generate_logs(n_logs, n_users, days, seed))
+
+
+class CountingStore:
+    # counts documents handed back by the wrapped store
+    def __init__(self, store):
+        self.store = store
+        self.reads = 0
+
+    def __getattr__(self, name):
+        return getattr(self.store, name)
+
+    def query_logs(self, *args, **kwargs):
+        for item in self.store.query_logs(*args, **kwargs):
+            self.reads += 1
+            yield item
+
+    def page_logs(self, *args, **kwargs):
+        page, cursor = self.store.page_logs(*args, **kwargs)
+        self.reads += len(page)
+        return page, cursor
+
+    def scan_logs(self, *args, **kwargs):
+        # route the store's paging through the counting page_logs
+        return LogStore.scan_logs(self, *args, **kwargs)
+
+    def get_profiles(self, uids):
+        # Firestore bills a read per requested document, found or not
+        self.reads += len(uids)
+        return self.store.get_profiles(uids)
+
+    def log_columns(self, *args, **kwargs):
+        cols = self.store.log_columns(*args, **kwargs)
+        self.reads += len(cols)
+        return cols
+
+    def user_totals(self):
+        totals = self.store.user_totals()
+        self.reads += len(totals)
+        return totals
+
+    def monthly_totals(self, user_id=None):
+        # one rollup document per scope (the community scope is sharded)
+        self.reads += 1 if user_id else rollups.GLOBAL_SHARDS
+        return self.store.monthly_totals(user_id)
+
+    def daily_totals(self, since, user_id=None):
+        # one daily rollup document per scope and calendar year
+        years = datetime.now().year - since.year + 1
+        self.reads += years * (1 if user_id else rollups.GLOBAL_SHARDS)
+        return self.store.daily_totals(since, user_id)
+
+
+def _export(store, path):
+    csv_export.export_single(store, path)
+
+
+def _leaderboard(store):
+    totals, _ = aggregations.leaderboard_totals(store)
+    return aggregations.leaderboard_rows(store, totals)
+
+
+def bench_paths(export_path, now):
+    return {
+        'load_logs': lambda s: aggregations.recent_logs(s, None, 200),
+        # seeding the signed-in user's window; later updates cost no reads
+        'update_weekly_progress': lambda s: DailyWindow(user_ids(1)[0]).seed(s, now).total(),
+        'load_summary': lambda s: aggregations.monthly_series(aggregations.monthly_totals(s), now),
+        'load_leaderboard': _leaderboard,
+        'export_csv': lambda s: _export(s, export_path),
+    }
+
+
+def run_path(store, fn, repeat):
+    timings = []
+    reads = 0
+    for _ in range(repeat):
+        profiles.invalidate()
+        counting = CountingStore(store)
+        gc.collect()
+        t0 = time.perf_counter()
+        fn(counting)
+        timings.append(time.perf_counter() - t0)
+        reads = counting.reads
+    # separate traced run so tracemalloc overhead doesn't skew the timings
+    profiles.invalidate()
+    gc.collect()
+    tracemalloc.start()
+    fn(CountingStore(store))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'median_ms': round(statistics.median(timings) * 1000, 3),
+        'min_ms': round(min(timings) * 1000, 3),
+        'docs_read': reads,
+        'peak_mem_bytes': peak,
+    }
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for name, cur in results.items():
+        old = (baseline.get('results') or {}).get(name)
+        if not old or not old.get('median_ms'):
+            continue
+        ratio = cur['median_ms'] / old['median_ms']
+        cur['vs_baseline'] = round(ratio, 3)
+        if ratio > 1 + threshold:
+            regressions.append((name, old['median_ms'], cur['median_ms'], ratio))
+    return regressions
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Benchmark EcoTrack aggregation paths on a synthetic local dataset')
+    ap.add_argument('--logs', type=int, default=100000, help='number of logs to generate')
+    ap.add_argument('--users', type=int, default=1000, help='number of users')
+    ap.add_argument('--days', type=int, default=400, help='spread logs over this many past days')
+    ap.add_argument('--seed', type=int, default=42)
+    ap.add_argument('--db', default=':memory:', help='SQLite file to use (reused if it already holds logs)')
+    ap.add_argument('--regenerate', action='store_true', help='rebuild the dataset even if --db already has logs')
+    ap.add_argument('--repeat', type=int, default=3)
+    ap.add_argument('--paths', default='', help='comma-separated subset of paths to run')
+    ap.add_argument('--out', default=None, help='results JSON (default bench_results/bench-<time>.json)')
+    ap.add_argument('--compare', default=None, help='earlier results JSON to check for regressions')
+    ap.add_argument('--threshold', type=float, default=0.2, help='allowed median slowdown before flagging (0.2 = 20%%)')
+    args = ap.parse_args(argv)
+
+    if args.regenerate and args.db != ':memory:' and os.path.exists(args.db):
+        os.remove(args.db)
+    store = SqliteStore(args.db)
+    existing = store.conn.execute('SELECT COUNT(*) FROM logs').fetchone()[0]
+    if existing:
+        print(f'Using existing dataset in {args.db}: {existing} logs')
+    else:
+        t0 = time.perf_counter()
+        n = populate(store, args.logs, args.users, args.days, args.seed)
+        print(f'Generated {n} logs for {args.users} users in {time.perf_counter() - t0:.1f}s')
+
+    now = datetime.now()
+    export_path = os.path.join(os.path.dirname(os.path.abspath(args.out or __file__)), '.bench_export.csv')
+    paths = bench_paths(export_path, now)
+    wanted = [p.strip() for p in args.paths.split(',') if p.strip()] or list(paths)
+    results = {}
+    try:
+        for name in wanted:
+            if name not in paths:
+                print(f'Unknown path: {name}')
+                return 2
+            results[name] = r = run_path(store, paths[name], args.repeat)
+            print(f"{name:<24} median {r['median_ms']:>10.1f} ms  min {r['min_ms']:>10.1f} ms  "
+                  f"reads {r['docs_read']:>9}  peak {r['peak_mem_bytes'] / 1e6:>8.1f} MB")
+    finally:
+        if os.path.exists(export_path):
+            os.remove(export_path)
+
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'dataset': {
+            'logs': store.conn.execute('SELECT COUNT(*) FROM logs').fetchone()[0],
+            'users': args.users,
+            'days': args.days,
+            'seed': args.seed,
+            'db': args.db,
+        },
+        'repeat': args.repeat,
+        'results': results,
+    }
+    status = 0
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        for name, old, cur, ratio in compare(results, baseline, args.threshold):
+            print(f'REGRESSION {name}: {old:.1f} ms -> {cur:.1f} ms ({ratio:.2f}x)')
+            status = 1
+        report['baseline'] = args.compare
+
+    out = args.out or os.path.join('bench_results', f"bench-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    if os.path.dirname(out):
+        os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f'Results written to {out}')
+    store.close()
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,115 @@
+from array import array
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import tracing
+
+# Columnar view of a set of logs for vectorised aggregation: int64 epoch
+# seconds, float64 absolute CO2 and dictionary-encoded int32 user codes,
+# sorted by time. Group-bys are np.bincount calls and day buckets are found
+# with np.searchsorted over the sorted timestamps, so the per-row Python
+# work is limited to decoding.
+#
+# Logs without a timestamp keep the UNTIMED epoch, which sorts them first:
+# they count towards the per-user sums and the day buckets skip them.
+
+UNTIMED = np.iinfo(np.int64).min
+
+
+def _epoch(ts):
+    if ts is None:
+        return None
+    if hasattr(ts, 'timestamp'):
+        return int(ts.timestamp())
+    return int(ts)
+
+
+class LogColumns:
+    def __init__(self, ts, co2, user_codes, users):
+        order = np.argsort(ts, kind='stable')
+        self.ts = np.ascontiguousarray(ts[order], dtype=np.int64)
+        self.co2 = np.ascontiguousarray(co2[order], dtype=np.float64)
+        self.user = np.ascontiguousarray(user_codes[order], dtype=np.int32)
+        self.users = list(users)
+        self._untimed = int(np.searchsorted(self.ts, UNTIMED, side='right'))
+
+    def __len__(self):
+        return len(self.ts)
+
+    @classmethod
+    @tracing.traced('decode.columns', 'decode')
+    def from_rows(cls, rows):
+        # rows of (epoch_seconds, co2_impact, user_id)
+        ts = array('q')
+        co2 = array('d')
+        ucodes = array('i')
+        users = {}
+        for epoch, kg, uid in rows:
+            ts.append(UNTIMED if epoch is None else int(epoch))
+            co2.append(abs(kg or 0.0))
+            uid = uid or 'Unknown'
+            code = users.get(uid)
+            if code is None:
+                code = users[uid] = len(users)
+            ucodes.append(code)
+        return cls(np.frombuffer(ts, dtype=np.int64), np.frombuffer(co2, dtype=np.float64),
+                   np.frombuffer(ucodes, dtype=np.int32), users)
+
+    @classmethod
+    def from_logs(cls, logs):
+        # logs as (doc_id, data) pairs from a store
+        def _rows():
+            for _, d in logs:
+                try:
+                    kg = float(d.get('co2_impact', 0) or 0)
+                except (TypeError, ValueError):
+                    kg = 0.0
+                yield _epoch(d.get('timestamp')), kg, d.get('user_id', 'Unknown')
+        return cls.from_rows(_rows())
+
+    def sum_by_user(self):
+        sums = np.bincount(self.user, weights=self.co2, minlength=len(self.users))
+        counts = np.bincount(self.user, minlength=len(self.users))
+        return {uid: (float(sums[i]), int(counts[i])) for i, uid in enumerate(self.users)}
+
+    def _bucket_sums(self, edges, keys, codes=None):
+        # edges: ascending epoch starts of each bucket (local time), plus the end
+        idx = np.searchsorted(edges, self.ts, side='right') - 1
+        ok = (idx >= 0) & (idx < len(keys))
+        if codes is None:
+            sums = np.bincount(idx[ok], weights=self.co2[ok], minlength=len(keys))
+            return {k: float(sums[i]) for i, k in enumerate(keys) if sums[i]}
+        # group by (code, bucket) without materialising a codes x buckets grid
+        flat = codes[ok].astype(np.int64) * len(keys) + idx[ok]
+        pairs, inverse = np.unique(flat, return_inverse=True)
+        sums = np.bincount(inverse.ravel(), weights=self.co2[ok])
+        out = {}
+        for pair, kg in zip(pairs.tolist(), sums.tolist()):
+            code, i = divmod(pair, len(keys))
+            out.setdefault(code, {})[keys[i]] = kg
+        return out
+
+    def _day_edges(self):
+        first = datetime.fromtimestamp(int(self.ts[self._untimed]))
+        last = datetime.fromtimestamp(int(self.ts[-1]))
+        cur = first.replace(hour=0, minute=0, second=0, microsecond=0)
+        keys = []
+        edges = []
+        while cur <= last:
+            keys.append(cur.strftime('%Y-%m-%d'))
+            edges.append(int(cur.timestamp()))
+            cur = cur + timedelta(days=1)
+        edges.append(int(cur.timestamp()))
+        return np.array(edges, dtype=np.int64), keys
+
+    @tracing.traced('agg.sum_by_day', 'agg')
+    def sum_by_day(self, by_user=False):
+        # {'YYYY-MM-DD': kg} in local time, or {uid: {day: kg}} when by_user
+        if self._untimed == len(self.ts):
+            return {}
+        edges, keys = self._day_edges()
+        if not by_user:
+            return self._bucket_sums(edges, keys)
+        per_code = self._bucket_sums(edges, keys, self.user)
+        return {self.users[c]: days for c, days in per_code.items()}
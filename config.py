@@ -0,0 +1,35 @@
+import os
+import json
+
+# Settings come from firebase_config.json next to the app, with ECOTRACK_*
+# environment variables taking precedence.
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'firebase_config.json')
+
+_cache = None
+
+
+def load_config():
+    global _cache
+    if _cache is None:
+        cfg = {}
+        if os.path.exists(CONFIG_PATH):
+            try:
+                with open(CONFIG_PATH, 'r', encoding='utf-8') as f:
+                    cfg = json.load(f) or {}
+            except Exception:
+                cfg = {}
+        _cache = cfg
+    return _cache
+
+
+def get(key, env=None, default=None):
+    if env and os.environ.get(env) not in (None, ''):
+        return os.environ[env]
+    return load_config().get(key, default)
+
+
+def get_bool(key, env=None, default=False):
+    val = get(key, env, default)
+    if isinstance(val, str):
+        return val.strip().lower() not in ('', '0', 'false', 'no', 'off')
+    return bool(val)
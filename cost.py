@@ -0,0 +1,195 @@
+import atexit
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import config
+
+# Firestore document reads, writes and deletes, attributed to the logical
+# operation that caused them and totalled for the session.
+#
+#   with cost.operation('leaderboard.refresh'):
+#       totals = store.user_totals()
+#
+# FirestoreStore, user_stats, rollups and the replicas call record() where
+# they touch Firestore; the local SQLite backends are free and record
+# nothing. Anything outside an operation is booked to '(other)'. Worker
+# threads book to the caller's operation under attach(op), which counts
+# their reads without adding a run of its own.
+#
+# Operations can have a read budget (DEFAULT_BUDGETS, overridden by
+# 'cost_budgets' / ECOTRACK_COST_BUDGETS as a JSON object). A run over
+# budget is logged, and over_budget(name) stays true until a run comes in
+# under it, so callers can serve a cached or cheaper path in the meantime.
+#
+# summary() / export() give per-operation totals for capacity planning;
+# --cost-out PATH writes the summary on exit.
+
+DEFAULT_BUDGETS = {
+    'leaderboard.refresh': 1000,
+    'logs.page': 1000,
+    'summary.refresh': 100,
+    'weekly.refresh': 500,
+    'weekly.seed': 50,
+}
+OTHER = '(other)'
+
+_local = threading.local()
+_lock = threading.Lock()
+_ops = {}
+_session = {'reads': 0, 'writes': 0, 'deletes': 0}
+_started = time.time()
+_budgets = None
+
+
+def budgets():
+    global _budgets
+    if _budgets is None:
+        merged = dict(DEFAULT_BUDGETS)
+        extra = config.get('cost_budgets', 'ECOTRACK_COST_BUDGETS')
+        if isinstance(extra, str):
+            try:
+                extra = json.loads(extra)
+            except ValueError:
+                extra = None
+        if isinstance(extra, dict):
+            merged.update(extra)
+        _budgets = merged
+    return _budgets
+
+
+def budget(name):
+    return budgets().get(name)
+
+
+def _totals(name):
+    t = _ops.get(name)
+    if t is None:
+        t = _ops[name] = {'runs': 0, 'reads': 0, 'writes': 0, 'deletes': 0, 'max_reads': 0,
+                          'over_budget_runs': 0, 'over_budget': False}
+    return t
+
+
+class Operation:
+    def __init__(self, name):
+        self.name = name
+        self.reads = 0
+        self.writes = 0
+        self.deletes = 0
+
+    def __enter__(self):
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        stack.append(self)
+        return self
+
+    def __exit__(self, *exc):
+        _local.stack.pop()
+        limit = budget(self.name)
+        over = limit is not None and self.reads > limit
+        with _lock:
+            t = _totals(self.name)
+            t['runs'] += 1
+            t['reads'] += self.reads
+            t['writes'] += self.writes
+            t['deletes'] += self.deletes
+            t['max_reads'] = max(t['max_reads'], self.reads)
+            t['over_budget'] = over
+            if over:
+                t['over_budget_runs'] += 1
+        if over:
+            print(f'[EcoTrack] {self.name} read {self.reads} documents (budget {limit})')
+        return False
+
+
+def operation(name):
+    return Operation(name)
+
+
+def current():
+    stack = getattr(_local, 'stack', None)
+    return stack[-1] if stack else None
+
+
+@contextmanager
+def attach(op):
+    # book this thread's records to `op`, an operation running on another
+    # thread; its run is finalised there, not here
+    if op is None:
+        yield None
+        return
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    stack.append(op)
+    try:
+        yield op
+    finally:
+        stack.pop()
+
+
+def record(reads=0, writes=0, deletes=0):
+    op = current()
+    with _lock:
+        _session['reads'] += reads
+        _session['writes'] += writes
+        _session['deletes'] += deletes
+        if op is None:
+            t = _totals(OTHER)
+            t['reads'] += reads
+            t['writes'] += writes
+            t['deletes'] += deletes
+        else:
+            # under the lock: attached threads share one operation
+            op.reads += reads
+            op.writes += writes
+            op.deletes += deletes
+
+
+def over_budget(name):
+    with _lock:
+        t = _ops.get(name)
+        return bool(t and t['over_budget'])
+
+
+def summary():
+    with _lock:
+        ops = {name: dict(t, budget=budget(name)) for name, t in _ops.items()}
+        session = dict(_session)
+    session['seconds'] = time.time() - _started
+    return {'session': session, 'operations': ops}
+
+
+def reset():
+    with _lock:
+        _ops.clear()
+        for k in _session:
+            _session[k] = 0
+
+
+def export(path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(summary(), f, indent=2)
+
+
+def add_arguments(parser):
+    # --cost-out is read from sys.argv at import; argparse CLIs accept it too
+    parser.add_argument('--cost-out', metavar='PATH', help='write Firestore usage per operation on exit')
+
+
+def _cost_out():
+    # --cost-out PATH or --cost-out=PATH, read before argparse runs
+    args = sys.argv[1:]
+    for i, arg in enumerate(args):
+        if arg == '--cost-out' and i + 1 < len(args):
+            return args[i + 1]
+        if arg.startswith('--cost-out='):
+            return arg.split('=', 1)[1] or None
+    return None
+
+
+if _cost_out():
+    atexit.register(export, _cost_out())
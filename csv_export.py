@@ -0,0 +1,99 @@
+import csv
+import os
+import time
+from collections import OrderedDict
+
+import aggregations
+
+# Streaming CSV export. Rows are written as pages arrive from the store, so
+# memory stays flat however many logs there are; the per-user mode keeps at
+# most `max_open` files open and reopens evicted ones in append mode.
+
+PROGRESS_INTERVAL = 0.5
+
+
+def safe_name(s):
+    s = s or ''
+    name = ''.join(c for c in s if c.isalnum() or c in (' ', '-', '_')).rstrip()
+    name = name.replace(' ', '_') or 'user'
+    return name
+
+
+class Progress:
+    def __init__(self, callback):
+        self.callback = callback
+        self.rows = 0
+        self.started = time.monotonic()
+        self._last = 0.0
+
+    def tick(self, n=1, force=False):
+        self.rows += 0 if force else n
+        if not self.callback:
+            return
+        now = time.monotonic()
+        if force or now - self._last >= PROGRESS_INTERVAL:
+            self._last = now
+            elapsed = max(now - self.started, 1e-9)
+            self.callback(self.rows, elapsed, self.rows / elapsed)
+
+
+def export_single(store, path, progress=None, page_size=1000):
+    # write every log to one CSV; returns the number of rows
+    meter = Progress(progress)
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=aggregations.EXPORT_FIELDS)
+        writer.writeheader()
+        for row in aggregations.export_rows(store, page_size):
+            writer.writerow(row)
+            meter.tick()
+    meter.tick(force=True)
+    return meter.rows
+
+
+class _FilePool:
+    # LRU pool of open per-user CSV writers
+    def __init__(self, folder, max_open):
+        self.folder = folder
+        self.max_open = max_open
+        self.paths = {}
+        self._open = OrderedDict()
+
+    def writer(self, uid, display):
+        entry = self._open.get(uid)
+        if entry is not None:
+            self._open.move_to_end(uid)
+            return entry[1]
+        path = self.paths.get(uid)
+        fresh = path is None
+        if fresh:
+            path = os.path.join(self.folder, f"{safe_name(display or uid)}_{uid[:8] if uid else 'anon'}.csv")
+            self.paths[uid] = path
+        f = open(path, 'w' if fresh else 'a', newline='', encoding='utf-8')
+        writer = csv.DictWriter(f, fieldnames=aggregations.EXPORT_FIELDS)
+        if fresh:
+            writer.writeheader()
+        self._open[uid] = (f, writer)
+        while len(self._open) > self.max_open:
+            _, (old, _) = self._open.popitem(last=False)
+            old.close()
+        return writer
+
+    def close(self):
+        while self._open:
+            _, (f, _) = self._open.popitem(last=False)
+            f.close()
+
+
+def export_per_user(store, folder, progress=None, page_size=1000, max_open=64):
+    # one CSV per user in `folder`; returns (rows, files)
+    meter = Progress(progress)
+    pool = _FilePool(folder, max_open)
+    try:
+        for row in aggregations.export_rows(store, page_size):
+            uid = row.get('user_id') or 'unknown'
+            pool.writer(uid, row.get('display_name')).writerow(row)
+            meter.tick()
+    finally:
+        pool.close()
+    meter.tick(force=True)
+    return meter.rows, len(pool.paths)
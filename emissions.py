@@ -0,0 +1,97 @@
+import json
+
+import numpy as np
+
+import config
+
+# Carbon footprint reference data (kg CO2), shared by both apps.
+#
+# Factors are versioned: FACTOR_VERSIONS maps a version number to the factors
+# that version introduced or changed. To change a factor, add a version with
+# just that entry rather than editing an old one, then run
+# recompute_impacts.py to rewrite the logs it affects. Logs record the
+# version they were computed with in `factor_version`.
+#
+# A JSON file of further versions ({"2": {"Beef Meal": 7.0}, ...}) can be
+# layered on top with 'emission_factors' / ECOTRACK_EMISSION_FACTORS.
+FACTOR_VERSIONS = {1: {
+    "Car (per mile)": 0.404,
+    "Bus (per mile)": 0.089,
+    "Train (per mile)": 0.041,
+    "Bike (per mile)": 0.0,
+    "Walk (per mile)": 0.0,
+    "Electric Vehicle (per mile)": 0.15,
+    "Beef Meal": 6.61,
+    "Chicken Meal": 2.33,
+    "Vegetarian Meal": 1.0,
+    "Vegan Meal": 0.68,
+    "Electricity (per kWh)": 0.92,
+    "Natural Gas (per therm)": 5.3,
+}}
+
+# activity type -> details offered in the entry forms
+ACTIVITY_DETAILS = {
+    "Transport": [
+        "Car (per mile)", "Bus (per mile)", "Train (per mile)",
+        "Bike (per mile)", "Walk (per mile)", "Electric Vehicle (per mile)",
+    ],
+    "Meal": ["Beef Meal", "Chicken Meal", "Vegetarian Meal", "Vegan Meal"],
+    "Energy": ["Electricity (per kWh)", "Natural Gas (per therm)"],
+}
+
+
+class FactorTable:
+    def __init__(self, versions):
+        self.versions = {int(v): dict(f) for v, f in versions.items()}
+        self.version = max(self.versions)
+        self.rates = self.rates_at(self.version)
+        # dictionary-encoded rates for impacts(); code 0 is "unknown", rate 0
+        self._codes = {detail: i + 1 for i, detail in enumerate(self.rates)}
+        self._rate_array = np.array([0.0] + list(self.rates.values()), dtype=np.float64)
+
+    def rates_at(self, version):
+        rates = {}
+        for v in sorted(self.versions):
+            if v > version:
+                break
+            rates.update(self.versions[v])
+        return rates
+
+    def changed_since(self, version):
+        # details whose factor differs between `version` and the current one
+        old = self.rates_at(version)
+        return sorted(d for d, rate in self.rates.items() if old.get(d) != rate)
+
+    def impact(self, detail, amount):
+        return round(self.rates.get(detail, 0) * amount, 2)
+
+    def impacts(self, details, amounts):
+        # impact() for whole columns at once; returns a float64 array
+        codes = np.fromiter((self._codes.get(d, 0) for d in details), dtype=np.int32, count=len(details))
+        kg = self._rate_array[codes] * np.asarray(amounts, dtype=np.float64)
+        out = np.round(kg, 2)
+        # np.round and round() can disagree on values sitting on a half
+        # cent; redo those the scalar way so both paths always agree
+        scaled = kg * 100
+        for i in np.flatnonzero(np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6):
+            out[i] = round(float(kg[i]), 2)
+        return out
+
+
+def _load_factors():
+    versions = dict(FACTOR_VERSIONS)
+    path = config.get("emission_factors", "ECOTRACK_EMISSION_FACTORS")
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            versions.update({int(v): factors for v, factors in json.load(f).items()})
+    return FactorTable(versions)
+
+
+# loaded once per process
+FACTORS = _load_factors()
+ACTIVITY_EMISSIONS = FACTORS.rates
+FACTOR_VERSION = FACTORS.version
+
+
+def calculate_co2_impact(activity, amount):
+    return FACTORS.impact(activity, amount)
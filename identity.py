@@ -0,0 +1,151 @@
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import config
+import tracing
+
+# Firebase Auth over its REST API (email/password sign-up and sign-in, and
+# ID-token refresh through the secure-token endpoint). All calls share one
+# requests.Session, so the TLS connection is reused between them, and every
+# call has a timeout. Blocking: the desktop app runs these on its loader
+# threads.
+#
+# Signed-in users are plain dicts: {'uid', 'email', 'idToken',
+# 'refreshToken', 'expires_at'}. ID tokens last an hour; refresh_in() says
+# when to call refresh() so a new one is in hand REFRESH_MARGIN seconds
+# before the old one expires.
+#
+# The network layer is injectable: pass a session (anything with a
+# requests-style post()), or point 'auth_emulator_host' /
+# FIREBASE_AUTH_EMULATOR_HOST at the Auth emulator or any local stand-in
+# serving the same paths.
+
+IDENTITY_URL = 'https://identitytoolkit.googleapis.com/v1'
+TOKEN_URL = 'https://securetoken.googleapis.com/v1'
+# (connect, read) seconds
+TIMEOUT = (5, 15)
+RETRIES = 3
+REFRESH_MARGIN = 300
+
+# Firebase error codes worth a plainer message
+MESSAGES = {
+    'EMAIL_EXISTS': 'An account with this email already exists',
+    'EMAIL_NOT_FOUND': 'Wrong email or password',
+    'INVALID_PASSWORD': 'Wrong email or password',
+    'INVALID_LOGIN_CREDENTIALS': 'Wrong email or password',
+    'INVALID_EMAIL': 'That email address is not valid',
+    'WEAK_PASSWORD': 'Password should be at least 6 characters',
+    'USER_DISABLED': 'This account has been disabled',
+    'TOO_MANY_ATTEMPTS_TRY_LATER': 'Too many attempts; try again later',
+    'TOKEN_EXPIRED': 'Your session has expired; please sign in again',
+    'INVALID_REFRESH_TOKEN': 'Your session has expired; please sign in again',
+    'USER_NOT_FOUND': 'This account no longer exists',
+}
+
+
+class AuthError(Exception):
+    # code is Firebase's error code when there is one; transient errors
+    # (no connection, 429, 5xx) are worth retrying later
+    def __init__(self, message, code=None, transient=False):
+        super().__init__(message)
+        self.code = code
+        self.transient = transient
+
+
+def make_session(retries=RETRIES):
+    # keep-alive session; only failures where the request never reached
+    # Firebase, or that it asked us to retry, are retried, since a sign-up
+    # must not run twice
+    retry = Retry(total=retries, connect=retries, read=0, status=retries,
+                  status_forcelist=(429, 503), allowed_methods=frozenset(['POST']),
+                  backoff_factor=0.5, raise_on_status=False)
+    session = requests.Session()
+    session.mount('https://', HTTPAdapter(max_retries=retry, pool_maxsize=4))
+    session.mount('http://', HTTPAdapter(max_retries=retry, pool_maxsize=4))
+    return session
+
+
+class IdentityClient:
+    def __init__(self, api_key, session=None, emulator_host=None, timeout=TIMEOUT, clock=time.time):
+        self.api_key = api_key
+        self.timeout = timeout
+        self.clock = clock
+        self._session = session
+        self._lock = threading.Lock()
+        host = emulator_host or config.get('auth_emulator_host', 'FIREBASE_AUTH_EMULATOR_HOST')
+        if host:
+            self.identity_url = f'http://{host}/identitytoolkit.googleapis.com/v1'
+            self.token_url = f'http://{host}/securetoken.googleapis.com/v1'
+        else:
+            self.identity_url, self.token_url = IDENTITY_URL, TOKEN_URL
+
+    @property
+    def session(self):
+        with self._lock:
+            if self._session is None:
+                self._session = make_session()
+            return self._session
+
+    def _post(self, url, **kw):
+        try:
+            r = self.session.post(url, params={'key': self.api_key}, timeout=self.timeout, **kw)
+        except requests.RequestException as ex:
+            raise AuthError(f'Could not reach the sign-in service ({ex.__class__.__name__})', transient=True)
+        try:
+            data = r.json()
+        except ValueError:
+            data = {}
+        if r.status_code == 200:
+            return data
+        # e.g. {'error': {'message': 'WEAK_PASSWORD : Password should be ...'}}
+        raw = ((data.get('error') or {}).get('message') or '') if isinstance(data, dict) else ''
+        code = raw.split(' : ')[0].strip() or None
+        message = MESSAGES.get(code) or raw or f'Sign-in service returned HTTP {r.status_code}'
+        raise AuthError(message, code, transient=r.status_code == 429 or r.status_code >= 500)
+
+    def _user(self, data, email):
+        return {
+            'uid': data['localId'],
+            'email': data.get('email') or email,
+            'idToken': data['idToken'],
+            'refreshToken': data.get('refreshToken'),
+            'expires_at': self.clock() + int(data.get('expiresIn') or 3600),
+        }
+
+    def sign_up(self, email, password):
+        with tracing.span('auth.sign_up', 'net'):
+            data = self._post(f'{self.identity_url}/accounts:signUp',
+                              json={'email': email, 'password': password, 'returnSecureToken': True})
+        return self._user(data, email)
+
+    def sign_in(self, email, password):
+        with tracing.span('auth.sign_in', 'net'):
+            data = self._post(f'{self.identity_url}/accounts:signInWithPassword',
+                              json={'email': email, 'password': password, 'returnSecureToken': True})
+        return self._user(data, email)
+
+    def refresh(self, user):
+        # the same user with a new ID token (and possibly a new refresh token)
+        if not user.get('refreshToken'):
+            raise AuthError(MESSAGES['TOKEN_EXPIRED'], 'TOKEN_EXPIRED')
+        with tracing.span('auth.refresh', 'net'):
+            data = self._post(f'{self.token_url}/token',
+                              data={'grant_type': 'refresh_token', 'refresh_token': user['refreshToken']})
+        return dict(user,
+                    idToken=data['id_token'],
+                    refreshToken=data.get('refresh_token') or user['refreshToken'],
+                    expires_at=self.clock() + int(data.get('expires_in') or 3600))
+
+    def refresh_in(self, user):
+        # seconds until `user`'s token should be refreshed (0 when due)
+        return max(0.0, (user.get('expires_at') or 0) - REFRESH_MARGIN - self.clock())
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
@@ -0,0 +1,78 @@
+import bisect
+import time
+
+# Search index over the last-loaded leaderboard rows (uid, display_name, kg).
+# Queries of three or more characters are matched as substrings through a
+# trigram index; shorter queries match word prefixes through a sorted token
+# list. Both orderings ('Total' and 'Name') are precomputed so filtering and
+# re-sorting on a keystroke never touches Firestore.
+
+DEFAULT_TTL_SECONDS = 60
+
+
+def _trigrams(s):
+    return {s[i:i + 3] for i in range(len(s) - 2)}
+
+
+def _tokens(s):
+    out = {s}
+    for sep in (' ', '@', '.', '_', '-', '(', ')'):
+        s = s.replace(sep, ' ')
+    out.update(t for t in s.split() if t)
+    return out
+
+
+class LeaderboardIndex:
+    def __init__(self, rows=(), ttl=DEFAULT_TTL_SECONDS):
+        self.ttl = ttl
+        self.rows = list(rows)
+        self.loaded_at = time.monotonic()
+        self._keys = [((r[1] or '').lower(), (r[0] or '').lower()) for r in self.rows]
+        self._grams = {}
+        tokens = []
+        for i, (name, uid) in enumerate(self._keys):
+            for g in _trigrams(name) | _trigrams(uid):
+                self._grams.setdefault(g, []).append(i)
+            for t in _tokens(name) | _tokens(uid):
+                tokens.append((t, i))
+        tokens.sort()
+        self._tokens = tokens
+        self._token_keys = [t for t, _ in tokens]
+        by_total = sorted(range(len(self.rows)), key=lambda i: self.rows[i][2], reverse=True)
+        by_name = sorted(range(len(self.rows)), key=lambda i: self._keys[i][0])
+        self._order = {'Total': by_total, 'Name': by_name}
+        self._rank = {}
+        for k, order in self._order.items():
+            rank = [0] * len(order)
+            for pos, i in enumerate(order):
+                rank[i] = pos
+            self._rank[k] = rank
+
+    def is_stale(self):
+        return (time.monotonic() - self.loaded_at) > self.ttl
+
+    def _match(self, term):
+        if len(term) >= 3:
+            grams = sorted(_trigrams(term), key=lambda g: len(self._grams.get(g, ())))
+            cand = set(self._grams.get(grams[0], ()))
+            for g in grams[1:]:
+                if not cand:
+                    break
+                cand.intersection_update(self._grams.get(g, ()))
+            return {i for i in cand if term in self._keys[i][0] or term in self._keys[i][1]}
+        # short queries: prefix match on name / uid words
+        lo = bisect.bisect_left(self._token_keys, term)
+        hi = bisect.bisect_left(self._token_keys, term + '\uffff')
+        return {i for _, i in self._tokens[lo:hi]}
+
+    def search(self, term='', sort_by='Total', limit=None):
+        term = (term or '').strip().lower()
+        order = self._order.get(sort_by) or self._order['Total']
+        if not term:
+            ids = order if limit is None else order[:limit]
+        else:
+            rank = self._rank.get(sort_by) or self._rank['Total']
+            ids = sorted(self._match(term), key=rank.__getitem__)
+            if limit is not None:
+                ids = ids[:limit]
+        return [self.rows[i] for i in ids]
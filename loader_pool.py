@@ -0,0 +1,76 @@
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+# Shared background loader for the desktop views. Every load has a key (one
+# per view); at most one load per key runs at a time. Requests that arrive
+# while a load is in flight collapse into a single follow-up run (newer
+# requests replace older queued ones), and each request bumps the key's
+# generation so results from superseded runs are dropped instead of
+# overwriting newer UI state.
+#
+#   pool.submit('logs', fetch, apply)
+#
+# fetch() runs on a worker thread; apply(result) is handed to `dispatch`
+# (the Tk event loop in the app) and only runs if no newer request for the
+# same key has been made since.
+
+DEFAULT_WORKERS = 3
+
+
+class LoaderPool:
+    def __init__(self, dispatch=None, workers=DEFAULT_WORKERS):
+        self.dispatch = dispatch or (lambda fn: fn())
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='loader')
+        self._lock = threading.Lock()
+        self._generation = {}
+        self._running = set()
+        self._queued = {}
+
+    def submit(self, key, fetch, apply=None):
+        # returns the generation assigned to this request
+        with self._lock:
+            gen = self._generation.get(key, 0) + 1
+            self._generation[key] = gen
+            if key in self._running:
+                self._queued[key] = (fetch, apply)
+                return gen
+            self._running.add(key)
+        self._executor.submit(self._run, key, gen, fetch, apply)
+        return gen
+
+    def is_current(self, key, gen):
+        with self._lock:
+            return self._generation.get(key) == gen
+
+    def cancel(self, key):
+        # drop any queued run and invalidate the in-flight one
+        with self._lock:
+            self._queued.pop(key, None)
+            self._generation[key] = self._generation.get(key, 0) + 1
+
+    def _run(self, key, gen, fetch, apply):
+        try:
+            if self.is_current(key, gen):
+                result = fetch()
+                if apply is not None and self.is_current(key, gen):
+                    self.dispatch(lambda: self._apply(key, gen, apply, result))
+        except Exception:
+            traceback.print_exc()
+        finally:
+            with self._lock:
+                nxt = self._queued.pop(key, None)
+                if nxt is None:
+                    self._running.discard(key)
+                else:
+                    gen = self._generation.get(key, 0)
+            if nxt is not None:
+                self._executor.submit(self._run, key, gen, *nxt)
+
+    def _apply(self, key, gen, apply, result):
+        # runs on the dispatch thread; a newer request may have landed meanwhile
+        if self.is_current(key, gen):
+            apply(result)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,263 @@
+import argparse
+import csv
+import hashlib
+import json
+import math
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+
+from csv_export import Progress
+from emissions import ACTIVITY_DETAILS, ACTIVITY_EMISSIONS, FACTOR_VERSION, calculate_co2_impact
+from storage import BATCH_WRITES_PER_ENTRY, open_store
+import tracing
+import user_stats
+
+# Bulk import of activity logs from CSV (the columns export_csv writes) or
+# NDJSON (one object per line with the same keys):
+#
+#   python log_import.py history.csv
+#   python log_import.py history.ndjson --workers 8 --backend sqlite --db ecotrack.db
+#
+# Rows are validated and co2_impact is recomputed from the emission factors,
+# exactly as the entry forms do. Valid rows are written in chunks of one
+# WriteBatch each (storage.add_logs), with at most `workers` chunks in flight.
+#
+# Progress is checkpointed next to the source file as rows are committed; an
+# interrupted import picks up from there when run again. Every row gets a
+# stable doc id (its `id` column, or a hash of the row), so rows committed
+# after the last checkpoint are skipped rather than duplicated on resume.
+
+# logs per chunk: as many as fit in one 500-write WriteBatch
+CHUNK_ROWS = user_stats.BATCH_SIZE // BATCH_WRITES_PER_ENTRY
+DEFAULT_WORKERS = 4
+RETRIES = 3
+TIMESTAMP_FORMATS = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d')
+MAX_REPORTED_ERRORS = 20
+
+_TYPE_OF = {detail: t for t, details in ACTIVITY_DETAILS.items() for detail in details}
+
+
+def read_rows(path):
+    # raw rows as dicts; .ndjson/.jsonl files are read as JSON lines
+    if os.path.splitext(path)[1].lower() in ('.ndjson', '.jsonl'):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        with open(path, 'r', newline='', encoding='utf-8-sig') as f:
+            yield from csv.DictReader(f)
+
+
+def _timestamp(value):
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value)
+    value = (value or '').strip()
+    for fmt in TIMESTAMP_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError(f'bad timestamp {value!r}')
+
+
+def to_log(raw):
+    # (doc_id, data) for one raw row; raises ValueError when it can't be imported
+    detail = (raw.get('activity_detail') or '').strip()
+    if detail not in ACTIVITY_EMISSIONS:
+        raise ValueError(f'unknown activity_detail {detail!r}')
+    activity_type = (raw.get('activity_type') or '').strip() or _TYPE_OF.get(detail, 'Energy')
+    if detail in _TYPE_OF and activity_type != _TYPE_OF[detail]:
+        raise ValueError(f'activity_type {activity_type!r} does not match {detail!r}')
+    try:
+        amount = float(raw.get('amount'))
+    except (TypeError, ValueError):
+        raise ValueError(f"bad amount {raw.get('amount')!r}")
+    if not math.isfinite(amount) or amount < 0:
+        raise ValueError(f'bad amount {amount!r}')
+    user_id = str(raw.get('user_id') or '').strip()
+    if not user_id:
+        raise ValueError('missing user_id')
+    data = {
+        'activity_type': activity_type,
+        'activity_detail': detail,
+        'amount': amount,
+        'description': str(raw.get('description') or ''),
+        'co2_impact': calculate_co2_impact(detail, amount),
+        'factor_version': FACTOR_VERSION,
+        'timestamp': _timestamp(raw.get('timestamp')),
+        'user_id': user_id,
+    }
+    doc_id = str(raw.get('id') or '').strip()
+    if not doc_id or '/' in doc_id:
+        key = json.dumps([data[k] for k in ('user_id', 'activity_detail', 'amount', 'description')] + [data['timestamp'].isoformat()])
+        doc_id = hashlib.sha1(key.encode('utf-8')).hexdigest()[:20]
+    return doc_id, data
+
+
+def checkpoint_path(path):
+    return path + '.import-checkpoint'
+
+
+def _source_id(path):
+    st = os.stat(path)
+    return {'source': os.path.abspath(path), 'size': st.st_size, 'mtime': st.st_mtime}
+
+
+def load_checkpoint(path):
+    try:
+        with open(checkpoint_path(path), 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    # a file that changed since is imported from the start
+    if {k: state.get(k) for k in ('source', 'size', 'mtime')} != _source_id(path):
+        return None
+    return state
+
+
+def _save_checkpoint(path, state):
+    tmp = checkpoint_path(path) + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(tmp, checkpoint_path(path))
+
+
+def _write_chunk(write, chunk):
+    for attempt in range(RETRIES):
+        try:
+            return write(chunk)
+        except Exception:
+            if attempt == RETRIES - 1:
+                raise
+            time.sleep(2 ** attempt)
+
+
+def import_logs(store, path, workers=DEFAULT_WORKERS, chunk_rows=CHUNK_ROWS, progress=None, on_error=None, restart=False):
+    # import `path` into `store`; returns {'rows', 'written', 'rejected', 'skipped', 'seconds'}
+    state = None if restart else load_checkpoint(path)
+    state = state or dict(_source_id(path), rows=0, written=0, rejected=0)
+    skip = state['rows']
+    # stores that can overwrite by id (SQLite) replay a chunk without error
+    write = getattr(store, 'put_logs', None) or store.add_logs
+    meter = Progress(progress)
+    started = time.monotonic()
+    # chunks finish out of order; the checkpoint only moves past a chunk
+    # once every chunk before it has committed too
+    inflight = {}
+    finished = {}
+    next_seq = [0]
+
+    def _advance():
+        while next_seq[0] in finished:
+            rows, written, rejected = finished.pop(next_seq[0])
+            state['rows'] += rows
+            state['written'] += written
+            state['rejected'] += rejected
+            next_seq[0] += 1
+        _save_checkpoint(path, state)
+
+    def _collect(block):
+        done, _ = wait(inflight, return_when=FIRST_COMPLETED) if block else (
+            [f for f in inflight if f.done()], None)
+        for fut in done:
+            seq, rows, rejected = inflight.pop(fut)
+            written = fut.result()
+            finished[seq] = (rows, written, rejected)
+            meter.tick(written)
+        if done:
+            _advance()
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='import') as pool:
+        try:
+            seq = 0
+            chunk, rows, rejected = [], 0, 0
+            for n, raw in enumerate(read_rows(path), 1):
+                if n <= skip:
+                    continue
+                rows += 1
+                try:
+                    chunk.append(to_log(raw))
+                except (ValueError, TypeError, AttributeError) as ex:
+                    rejected += 1
+                    if on_error is not None:
+                        on_error(n, ex)
+                if len(chunk) >= chunk_rows:
+                    inflight[pool.submit(_write_chunk, write, chunk)] = (seq, rows, rejected)
+                    seq += 1
+                    chunk, rows, rejected = [], 0, 0
+                    # bounded: never more than `workers` chunks queued behind the running ones
+                    while len(inflight) >= 2 * workers:
+                        _collect(True)
+                    _collect(False)
+            if rows:
+                inflight[pool.submit(_write_chunk, write, chunk)] = (seq, rows, rejected)
+            while inflight:
+                _collect(True)
+        except BaseException:
+            # keep what has landed, then stop
+            for fut in list(inflight):
+                fut.cancel()
+            for fut in list(inflight):
+                if not fut.cancelled():
+                    try:
+                        finished[inflight[fut][0]] = (inflight[fut][1], fut.result(), inflight[fut][2])
+                    except Exception:
+                        pass
+            _advance()
+            raise
+    meter.tick(force=True)
+    return {'rows': state['rows'], 'written': state['written'], 'rejected': state['rejected'],
+            'skipped': skip, 'seconds': time.monotonic() - started}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Import EcoTrack activity logs from CSV or NDJSON')
+    ap.add_argument('path', help='CSV with the export columns, or .ndjson/.jsonl')
+    ap.add_argument('--backend', default=None, help="storage backend (default: config 'backend')")
+    ap.add_argument('--db', default=None, help='SQLite file for the sqlite backend')
+    ap.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='chunks committed in parallel')
+    ap.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS, help='logs per chunk')
+    ap.add_argument('--restart', action='store_true', help='ignore the checkpoint and start from the first row')
+    tracing.add_arguments(ap)
+    args = ap.parse_args(argv)
+
+    errors = [0]
+
+    def on_error(n, ex):
+        errors[0] += 1
+        if errors[0] <= MAX_REPORTED_ERRORS:
+            print(f'row {n}: {ex}', file=sys.stderr)
+        elif errors[0] == MAX_REPORTED_ERRORS + 1:
+            print('(further row errors not shown)', file=sys.stderr)
+
+    def progress(rows, elapsed, rate):
+        print(f'\r{rows} logs written ({rate:,.0f} rows/s)', end='', flush=True)
+
+    store = open_store(args.backend, args.db)
+    state = load_checkpoint(args.path)
+    if state and not args.restart:
+        print(f"Resuming after row {state['rows']} ({state['written']} logs already written)")
+    try:
+        result = import_logs(store, args.path, args.workers, args.chunk_rows, progress, on_error, args.restart)
+    except KeyboardInterrupt:
+        print(f'\nInterrupted; run again to resume from {checkpoint_path(args.path)}')
+        return 130
+    finally:
+        store.close()
+    rate = (result['rows'] - result['skipped']) / max(result['seconds'], 1e-9)
+    print(f"\nImported {result['written']} logs, rejected {result['rejected']} rows "
+          f"in {result['seconds']:.1f}s ({rate:,.0f} rows/s)")
+    if os.path.exists(checkpoint_path(args.path)):
+        os.remove(checkpoint_path(args.path))
+    return 1 if result['rejected'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
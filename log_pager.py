@@ -0,0 +1,69 @@
+import threading
+
+# Newest-first, keyset-paginated view of the logs for one filter (everyone,
+# or a single user). Pages come from LogStore.page_logs, which continues
+# after the (timestamp, doc id) of the previous page's last row. Fetched
+# pages are kept, so scrolling back or returning to a filter costs no
+# re-read; drop the pager after a write.
+#
+# If the first ordered page fails (on Firestore this is usually a missing
+# composite index for user_id + timestamp) the pager falls back to a single
+# bounded read of the newest DEGRADED_LIMIT logs and sets `degraded` so the
+# UI can say what it is showing. If even that can't be ordered, it reads any
+# DEGRADED_LIMIT logs and sorts them locally; `partial` is then set when
+# older or newer logs may be missing from the list.
+
+PAGE_SIZE = 200
+DEGRADED_LIMIT = 500
+
+
+def _sort_key(item):
+    ts = item[1].get('timestamp')
+    return ts.timestamp() if hasattr(ts, 'timestamp') else 0
+
+
+class LogPager:
+    def __init__(self, store, user_id=None, page_size=PAGE_SIZE):
+        self.store = store
+        self.user_id = user_id
+        self.page_size = page_size
+        self.pages = []
+        self.done = False
+        self.degraded = False
+        self.partial = False
+        self.error = None
+        self._cursor = None
+        self._lock = threading.Lock()
+
+    def page(self, i):
+        # page i (0-based), fetching forward as needed; [] past the end
+        with self._lock:
+            while len(self.pages) <= i and not self.done:
+                self._fetch_next()
+            return self.pages[i] if i < len(self.pages) else []
+
+    def _fetch_next(self):
+        try:
+            page, cursor = self.store.page_logs(user_id=self.user_id, order='desc', limit=self.page_size, cursor=self._cursor)
+        except Exception as ex:
+            if self.pages:
+                # keep what we have; the next scroll retries this page
+                raise
+            self._fetch_degraded(ex)
+            return
+        self.pages.append(page)
+        self._cursor = cursor
+        self.done = cursor is None
+
+    def _fetch_degraded(self, ex):
+        self.degraded = True
+        self.error = ex
+        try:
+            docs = list(self.store.query_logs(user_id=self.user_id, order='desc', limit=DEGRADED_LIMIT))
+        except Exception:
+            # unordered, so not necessarily the newest logs
+            docs = list(self.store.query_logs(user_id=self.user_id, limit=DEGRADED_LIMIT))
+            docs.sort(key=_sort_key, reverse=True)
+            self.partial = len(docs) >= DEGRADED_LIMIT
+        self.pages.append(docs)
+        self.done = True
@@ -0,0 +1,145 @@
+import bisect
+import threading
+
+import cost
+import user_stats
+
+# In-process replicas of Firestore collections kept current by a single
+# on_snapshot listener each. Snapshot callbacks arrive on a Firestore worker
+# thread and only apply the changed documents, so a refresh costs the number
+# of changes rather than the size of the collection. `version` is bumped on
+# every applied snapshot; the UI polls it from the Tk thread.
+
+
+def to_epoch(ts):
+    if ts is None:
+        return None
+    if hasattr(ts, 'timestamp'):
+        try:
+            return ts.timestamp()
+        except Exception:
+            return None
+    return None
+
+
+def _local_dt(ts):
+    if hasattr(ts, 'astimezone'):
+        try:
+            return ts.astimezone()
+        except Exception:
+            pass
+    return ts
+
+
+class CollectionReplica:
+    def __init__(self, query):
+        self.query = query
+        self.docs = {}
+        self.version = 0
+        self.ready = threading.Event()
+        self._lock = threading.RLock()
+        self._watch = None
+
+    def start(self):
+        if self._watch is None:
+            self._watch = self.query.on_snapshot(self._on_snapshot)
+        return self
+
+    def stop(self):
+        if self._watch is not None:
+            try:
+                self._watch.unsubscribe()
+            except Exception:
+                pass
+            self._watch = None
+
+    def _on_snapshot(self, docs, changes, read_time):
+        # listeners are billed one read per changed document
+        cost.record(reads=len(changes))
+        with self._lock:
+            for change in changes:
+                doc = change.document
+                if change.type.name == 'REMOVED':
+                    old = self.docs.pop(doc.id, None)
+                    if old is not None:
+                        self._unapply(doc.id, old)
+                    continue
+                old = self.docs.get(doc.id)
+                if old is not None:
+                    self._unapply(doc.id, old)
+                new = doc.to_dict() or {}
+                self.docs[doc.id] = new
+                self._apply(doc.id, new)
+            self.version += 1
+        self.ready.set()
+
+    # subclasses keep derived aggregates current from these two hooks
+    def _apply(self, doc_id, data):
+        pass
+
+    def _unapply(self, doc_id, data):
+        pass
+
+
+class LogsReplica(CollectionReplica):
+    # replica of the logs written since `since` (the Summary tab's window)
+    def __init__(self, db, since):
+        super().__init__(db.collection('logs').where('timestamp', '>=', since))
+        self.since = since
+        self._order = []
+        self._keys = {}
+        self._months = {}
+
+    def _apply(self, doc_id, data):
+        key = (to_epoch(data.get('timestamp')) or 0.0, doc_id)
+        bisect.insort(self._order, key)
+        self._keys[doc_id] = key
+        self._bucket(data, 1)
+
+    def _unapply(self, doc_id, data):
+        key = self._keys.pop(doc_id, None)
+        if key is not None:
+            i = bisect.bisect_left(self._order, key)
+            if i < len(self._order) and self._order[i] == key:
+                del self._order[i]
+        self._bucket(data, -1)
+
+    def _bucket(self, data, sign):
+        dt = _local_dt(data.get('timestamp'))
+        if not hasattr(dt, 'strftime'):
+            return
+        kg = sign * user_stats.log_impact(data)
+        ym = dt.strftime('%Y-%m')
+        self._months[ym] = self._months.get(ym, 0) + kg
+
+    def latest(self, limit=200, user_id=None):
+        # newest-first (doc_id, data) pairs, optionally for a single user
+        out = []
+        with self._lock:
+            for _, doc_id in reversed(self._order):
+                d = self.docs[doc_id]
+                if user_id and d.get('user_id') != user_id:
+                    continue
+                out.append((doc_id, d))
+                if limit and len(out) >= limit:
+                    break
+        return out
+
+    def month_totals(self):
+        with self._lock:
+            return dict(self._months)
+
+
+class UserStatsReplica(CollectionReplica):
+    # replica of user_stats feeding the leaderboard
+    def __init__(self, db):
+        super().__init__(db.collection(user_stats.STATS_COLLECTION))
+
+    def totals(self):
+        out = {}
+        with self._lock:
+            for doc_id, d in self.docs.items():
+                if (d.get('log_count') or 0) <= 0:
+                    continue
+                out[d.get('user_id') or doc_id] = max(float(d.get('total_kg') or 0), 0.0)
+        return out
@@ -1,30 +1,88 @@
+# first, so --profile-startup can time the imports below
+import startup_profile
+import asyncio
+import functools
+import time
 import flet as ft
-import firebase_admin
-from firebase_admin import credentials, firestore
 from datetime import datetime, timedelta
 
-# Initialize Firebase
-cred = credentials.Certificate("serviceAccountKey.json")
-firebase_admin.initialize_app(cred)
-db = firestore.client()
-
-# Carbon footprint reference data (kg CO2)
-ACTIVITY_EMISSIONS = {
-    "Car (per mile)": 0.404,
-    "Bus (per mile)": 0.089,
-    "Train (per mile)": 0.041,
-    "Bike (per mile)": 0.0,
-    "Walk (per mile)": 0.0,
-    "Electric Vehicle (per mile)": 0.15,
-    "Beef Meal": 6.61,
-    "Chicken Meal": 2.33,
-    "Vegetarian Meal": 1.0,
-    "Vegan Meal": 0.68,
-    "Electricity (per kWh)": 0.92,
-    "Natural Gas (per therm)": 5.3,
-}
-
-def main(page: ft.Page):
+from emissions import FACTOR_VERSION, calculate_co2_impact
+from storage import open_store
+import cost
+import tracing
+
+startup_profile.mark("imports")
+
+# Storage backend (Firestore by default, SQLite via config "backend"),
+# connected on first use so the page is drawn before Firestore is set up
+store = open_store(lazy=True)
+
+# while weekly.refresh is over budget the weekly total comes from the daily
+# rollups; the full scan is retried this often so the flag can clear
+WEEKLY_RESCAN_SECONDS = 600
+
+# activity type -> icon on the log cards
+ICONS = {"Transport": "🚗", "Meal": "🍽️", "Energy": "⚡"}
+
+
+def card_fields(log_data):
+    # what a log card shows: (icon, detail, subtitle, time)
+    timestamp = log_data['timestamp']
+    time_str = timestamp.strftime("%b %d, %I:%M %p") if hasattr(timestamp, 'strftime') else "Recent"
+    description = log_data.get('description', '')
+    subtitle = f"{log_data['amount']} units • {log_data['co2_impact']} kg CO2"
+    if description:
+        subtitle = f"{description} • {subtitle}"
+    return ICONS.get(log_data.get('activity_type', ''), "🌿"), log_data['activity_detail'], subtitle, time_str
+
+
+class LogCard:
+    # One log's card in the dashboard list, keyed by its document id. The
+    # controls are built once; show() only sets the texts whose value
+    # changed, so an unchanged card adds nothing to the next page.update().
+    def __init__(self, doc_id, log_data, on_edit, on_delete):
+        self.on_edit = on_edit
+        self.on_delete = on_delete
+        self.texts = [
+            ft.Text("", size=32),
+            ft.Text("", weight="w500"),
+            ft.Text("", size=12, color="grey"),
+            ft.Text("", size=11, color="grey"),
+        ]
+        self.actions = ft.Row()
+        self.control = ft.Container(
+            content=ft.Row([
+                self.texts[0],
+                ft.Column([self.texts[1], self.texts[2]], expand=True),
+                ft.Column([self.texts[3], self.actions], horizontal_alignment=ft.CrossAxisAlignment.END),
+            ]),
+            padding=15,
+            bgcolor="white",
+            border_radius=8,
+        )
+        self.data = None
+        self.show(log_data)
+        self.bind(doc_id)
+
+    def show(self, log_data):
+        self.data = log_data
+        for text, value in zip(self.texts, card_fields(log_data)):
+            if text.value != value:
+                text.value = value
+
+    def bind(self, doc_id):
+        # a log still being saved has no id yet, so nothing to edit or delete by
+        self.doc_id = doc_id
+        self.control.key = doc_id
+        if doc_id:
+            self.actions.controls = [
+                ft.TextButton("✏️ Edit", on_click=functools.partial(self.on_edit, doc_id)),
+                ft.TextButton("🗑️ Delete", on_click=functools.partial(self.on_delete, doc_id)),
+            ]
+        else:
+            self.actions.controls = [ft.Text("Saving…", size=11, color="grey")]
+
+async def main(page: ft.Page):
     page.title = "🌍 EcoTrack - Carbon Footprint Dashboard"
     page.theme_mode = ft.ThemeMode.LIGHT
     page.padding = 20
@@ -92,68 +150,119 @@ def main(page: ft.Page):
     weekly_goal_text = ft.Text("", size=14, color="#2E7D32")
     total_saved_text = ft.Text("Total CO2 Saved This Week: 0 kg", size=18, weight="bold", color="#1B5E20")
     
-    def calculate_co2_impact(activity, amount):
-        emission_rate = ACTIVITY_EMISSIONS.get(activity, 0)
-        return round(emission_rate * amount, 2)
-
     def show_snackbar(message):
-        page.snack_bar = ft.SnackBar(ft.Text(message))
-        page.snack_bar.open = True
-        page.update()
+        snack = ft.SnackBar(ft.Text(message))
+        if hasattr(page, "show_dialog"):
+            page.show_dialog(snack)
+        else:
+            page.snack_bar = snack
+            page.snack_bar.open = True
+            page.update()
+
+    # Store calls block, so handlers run them on worker threads
+    # (asyncio.to_thread) and await them; independent refreshes run together
+    # with asyncio.gather. Each view counts its refreshes, and a result that
+    # arrives after a newer refresh started is dropped.
+    refreshes = {"logs": 0, "weekly": 0, "leaderboard": 0}
+    weekly_total = [0.0]
+    weekly_scanned = [0.0]
+    # doc id -> LogCard for the logs on screen
+    cards = {}
+
+    def read_form():
+        # the log fields from the form, or None when the amount is not a number
+        try:
+            amount = float(amount_input.value)
+        except ValueError:
+            show_snackbar("❌ Please enter a valid number")
+            return None
+        return {
+            "activity_type": activity_type.value,
+            "activity_detail": activity_detail.value,
+            "amount": amount,
+            "description": description_input.value or "",
+            "co2_impact": calculate_co2_impact(activity_detail.value, amount),
+            "factor_version": FACTOR_VERSION,
+        }
+
+    def this_week(log_data):
+        timestamp = log_data.get('timestamp')
+        # epoch seconds, since Firestore timestamps are timezone-aware
+        return hasattr(timestamp, 'timestamp') and timestamp.timestamp() >= (datetime.now() - timedelta(days=7)).timestamp()
+
+    def bump_weekly(old=None, new=None):
+        # apply a local write to the weekly total until the next refresh
+        if old is not None and this_week(old):
+            weekly_total[0] -= abs(old.get('co2_impact', 0))
+        if new is not None and this_week(new):
+            weekly_total[0] += abs(new.get('co2_impact', 0))
+        render_weekly(max(weekly_total[0], 0))
+
+    async def write(call, *args, saved=None):
+        # run a store write, then reload the views it touches; after a failed
+        # write the reload also rolls back the optimistic change
+        try:
+            result = await asyncio.to_thread(call, *args)
+        except Exception as ex:
+            show_snackbar(f"❌ Could not save: {ex}")
+        else:
+            if saved is not None:
+                saved(result)
+        await asyncio.gather(load_logs(), update_weekly_progress())
 
-    def add_log(e):
+    def position(card):
+        # index of the card's control in the list; controls compare by value,
+        # so list.index() could match another card showing the same log
+        for i, control in enumerate(log_list.controls):
+            if control is card.control:
+                return i
+        return None
+
+    def adopt(card, doc_id):
+        # the optimistic card becomes the saved log's card, so the reload reuses it
+        card.bind(doc_id)
+        cards[doc_id] = card
+
+    async def add_log(e):
         if activity_detail.value and amount_input.value:
-            try:
-                amount = float(amount_input.value)
-                co2_impact = calculate_co2_impact(activity_detail.value, amount)
-                
-                data = {
-                    "activity_type": activity_type.value,
-                    "activity_detail": activity_detail.value,
-                    "amount": amount,
-                    "description": description_input.value or "",
-                    "co2_impact": co2_impact,
-                    "timestamp": datetime.now(),
-                    "user_id": "default_user"
-                }
-                db.collection("logs").add(data)
-                
-                amount_input.value = ""
-                description_input.value = ""
-                load_logs()
-                update_weekly_progress()
-                show_snackbar("✅ Log added successfully!")
-                page.update()
-            except ValueError:
-                show_snackbar("❌ Please enter a valid number")
-
-    def update_log(e):
-        if editing_doc_id[0] and activity_detail.value and amount_input.value:
-            try:
-                amount = float(amount_input.value)
-                co2_impact = calculate_co2_impact(activity_detail.value, amount)
-                
-                data = {
-                    "activity_type": activity_type.value,
-                    "activity_detail": activity_detail.value,
-                    "amount": amount,
-                    "description": description_input.value or "",
-                    "co2_impact": co2_impact,
-                }
-                db.collection("logs").document(editing_doc_id[0]).update(data)
-                
-                editing_doc_id[0] = None
-                amount_input.value = ""
-                description_input.value = ""
-                add_btn.text = "Add Log"
-                add_btn.on_click = add_log
-                
-                load_logs()
-                update_weekly_progress()
-                show_snackbar("✅ Log updated!")
-                page.update()
-            except ValueError:
-                show_snackbar("❌ Please enter a valid number")
+            data = read_form()
+            if data is None:
+                return
+            data["timestamp"] = datetime.now()
+            data["user_id"] = "default_user"
+
+            # show it at once; it gets its doc id once the write lands
+            card = LogCard(None, data, edit_clicked, delete_log)
+            log_list.controls.insert(0, card.control)
+            bump_weekly(new=data)
+            amount_input.value = ""
+            description_input.value = ""
+            page.update()
+            show_snackbar("✅ Log added successfully!")
+
+            await write(store.add_log, data, saved=lambda doc_id: adopt(card, doc_id))
+
+    async def update_log(e):
+        doc_id = editing_doc_id[0]
+        if doc_id and activity_detail.value and amount_input.value:
+            data = read_form()
+            if data is None:
+                return
+
+            editing_doc_id[0] = None
+            amount_input.value = ""
+            description_input.value = ""
+            add_btn.text = "Add Log"
+            add_btn.on_click = add_log
+            card = cards.get(doc_id)
+            if card is not None:
+                old = card.data
+                card.show(dict(old, **data))
+                bump_weekly(old, card.data)
+            page.update()
+            show_snackbar("✅ Log updated!")
+
+            await write(store.update_log, doc_id, data)
 
     def edit_log(doc_id, log_data):
         editing_doc_id[0] = doc_id
@@ -166,63 +275,72 @@ def main(page: ft.Page):
         add_btn.on_click = update_log
         page.update()
 
-    def load_logs():
-        log_list.controls.clear()
-        docs = db.collection("logs").order_by("timestamp", direction=firestore.Query.DESCENDING).limit(50).stream()
-        
-        for doc in docs:
-            log_data = doc.to_dict()
-            doc_id = doc.id
-            
-            timestamp = log_data['timestamp']
-            time_str = timestamp.strftime("%b %d, %I:%M %p") if hasattr(timestamp, 'strftime') else "Recent"
-            
-            icon_map = {"Transport": "🚗", "Meal": "🍽️", "Energy": "⚡"}
-            icon = icon_map.get(log_data.get('activity_type', ''), "🌿")
-            
-            description = log_data.get('description', '')
-            subtitle = f"{log_data['amount']} units • {log_data['co2_impact']} kg CO2"
-            if description:
-                subtitle = f"{description} • {subtitle}"
-            
-            log_card = ft.Container(
-                content=ft.Row([
-                    ft.Text(icon, size=32),
-                    ft.Column([
-                        ft.Text(log_data['activity_detail'], weight="w500"),
-                        ft.Text(subtitle, size=12, color="grey"),
-                    ], expand=True),
-                    ft.Column([
-                        ft.Text(time_str, size=11, color="grey"),
-                        ft.Row([
-                            ft.TextButton("✏️ Edit", on_click=lambda e, id=doc_id, data=log_data: edit_log(id, data)),
-                            ft.TextButton("🗑️ Delete", on_click=lambda e, id=doc_id: delete_log(id)),
-                        ]),
-                    ], horizontal_alignment=ft.CrossAxisAlignment.END),
-                ]),
-                padding=15,
-                bgcolor="white",
-                border_radius=8,
-            )
-            log_list.controls.append(log_card)
+    def edit_clicked(doc_id, e=None):
+        card = cards.get(doc_id)
+        if card is not None:
+            edit_log(doc_id, card.data)
+
+    def fetch_logs():
+        with cost.operation("logs.page"):
+            return list(store.query_logs(order="desc", limit=50))
+
+    @tracing.traced("flet.render_logs", "render")
+    def render_logs(docs):
+        # diff against the cards on screen: reuse them by doc id and patch
+        # what changed; only new logs get new cards
+        shown = {}
+        for doc_id, log_data in docs:
+            card = cards.get(doc_id)
+            if card is None:
+                card = LogCard(doc_id, log_data, edit_clicked, delete_log)
+            else:
+                card.show(log_data)
+            shown[doc_id] = card
+        controls = [card.control for card in shown.values()]
+        if len(controls) != len(log_list.controls) or any(a is not b for a, b in zip(controls, log_list.controls)):
+            log_list.controls[:] = controls
+        cards.clear()
+        cards.update(shown)
         page.update()
 
-    def delete_log(doc_id):
-        db.collection("logs").document(doc_id).delete()
-        load_logs()
-        update_weekly_progress()
-        show_snackbar("🗑️ Log deleted")
+    @tracing.traced("flet.load_logs", "render")
+    async def load_logs():
+        refreshes["logs"] += 1
+        seq = refreshes["logs"]
+        docs = await asyncio.to_thread(fetch_logs)
+        if seq == refreshes["logs"]:
+            render_logs(docs)
+
+    async def delete_log(doc_id, e=None):
+        card = cards.pop(doc_id, None)
+        if card is not None:
+            i = position(card)
+            if i is not None:
+                del log_list.controls[i]
+            bump_weekly(old=card.data)
         page.update()
+        show_snackbar("🗑️ Log deleted")
+
+        await write(store.delete_log, doc_id)
     
-    def update_weekly_progress():
+    def fetch_weekly():
         week_ago = datetime.now() - timedelta(days=7)
-        docs = db.collection("logs").where("timestamp", ">=", week_ago).stream()
         
         total_saved = 0
-        for doc in docs:
-            log_data = doc.to_dict()
-            total_saved += abs(log_data.get('co2_impact', 0))
-        
+        if cost.over_budget("weekly.refresh") and time.monotonic() - weekly_scanned[0] < WEEKLY_RESCAN_SECONDS:
+            # the last scan read too many logs; the daily rollups cost a read per scope
+            with cost.operation("weekly.rollups"):
+                # daily buckets: today plus the six days before, like weekly_window.DailyWindow
+                first_day = (datetime.now() - timedelta(days=6)).replace(hour=0, minute=0, second=0, microsecond=0)
+                total_saved = sum(store.daily_totals(first_day).values())
+        else:
+            weekly_scanned[0] = time.monotonic()
+            with cost.operation("weekly.refresh"):
+                for _, log_data in store.query_logs(since=week_ago):
+                    total_saved += abs(log_data.get('co2_impact', 0))
+        return total_saved
+
+    def render_weekly(total_saved):
         weekly_goal = 50
         progress = min(total_saved / weekly_goal, 1.0) if weekly_goal > 0 else 0
         
@@ -230,24 +348,28 @@ def main(page: ft.Page):
         total_saved_text.value = f"Total CO2 Impact This Week: {round(total_saved, 2)} kg"
         weekly_goal_text.value = f"Weekly Goal: {round(total_saved, 2)} / {weekly_goal} kg ({round(progress * 100)}%)"
         page.update()
+
+    @tracing.traced("flet.weekly_progress", "render")
+    async def update_weekly_progress():
+        refreshes["weekly"] += 1
+        seq = refreshes["weekly"]
+        total_saved = await asyncio.to_thread(fetch_weekly)
+        if seq == refreshes["weekly"]:
+            weekly_total[0] = total_saved
+            render_weekly(total_saved)
     
     leaderboard_list = ft.Column(spacing=10)
     leaderboard_scroll = ft.Container(content=leaderboard_list, height=400)
     community_total_text = ft.Text("", size=24, weight="bold", color="#1B5E20")
     
-    def load_leaderboard(e=None):
+    def fetch_leaderboard():
+        # per-user totals are maintained incrementally in user_stats
+        with cost.operation("leaderboard.refresh"):
+            return store.user_totals()
+
+    def render_leaderboard(user_totals):
         leaderboard_list.controls.clear()
-        
-        all_docs = db.collection("logs").stream()
-        total_community_impact = 0
-        user_totals = {}
-        
-        for doc in all_docs:
-            log_data = doc.to_dict()
-            impact = abs(log_data.get('co2_impact', 0))
-            total_community_impact += impact
-            user_id = log_data.get('user_id', 'Unknown')
-            user_totals[user_id] = user_totals.get(user_id, 0) + impact
+        total_community_impact = sum(user_totals.values())
         
         community_total_text.value = f"🌍 Total Community Impact: {round(total_community_impact, 2)} kg CO2"
         
@@ -274,6 +396,14 @@ def main(page: ft.Page):
             )
         
         page.update()
+
+    @tracing.traced("flet.load_leaderboard", "render")
+    async def load_leaderboard(e=None):
+        refreshes["leaderboard"] += 1
+        seq = refreshes["leaderboard"]
+        user_totals = await asyncio.to_thread(fetch_leaderboard)
+        if seq == refreshes["leaderboard"]:
+            render_leaderboard(user_totals)
     
     add_btn = ft.Button("Add Log", on_click=add_log, width=150, height=50, bgcolor="#4CAF50", color="white")
     update_activity_detail(None)
@@ -361,9 +491,20 @@ def main(page: ft.Page):
     tabs_row = ft.Row([dashboard_btn, community_btn], spacing=10)
 
     page.add(tabs_row, ft.Divider(), main_body)
+    startup_profile.mark("page shown")
     
-    load_logs()
-    update_weekly_progress()
-    load_leaderboard()
+    await asyncio.gather(load_logs(), update_weekly_progress(), load_leaderboard())
+    startup_profile.mark("first data shown")
+    if startup_profile.enabled:
+        startup_profile.report(extra=[("storage init", store.init_seconds)])
+
+    # with the local cache, pull what changed since the last session and redraw
+    if hasattr(await asyncio.to_thread(store.get), "sync"):
+        try:
+            if any((await asyncio.to_thread(store.sync)).values()):
+                await asyncio.gather(load_logs(), update_weekly_progress(), load_leaderboard())
+        except Exception as ex:
+            print(f"[EcoTrack] cache sync failed: {ex!r}")
+            show_snackbar(f"Could not sync the local cache: {ex}")
 
 ft.run(main)
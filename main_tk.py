@@ -1,24 +1,52 @@
+# first, so --profile-startup can time the imports below
+import startup_profile
 import threading
+import sys
+import time
 import tkinter as tk
 from tkinter import messagebox, simpledialog
 import ttkbootstrap as tb
 from tkinter import ttk
 from datetime import datetime, timedelta
 
-# Firebase
-import firebase_admin
-from firebase_admin import credentials, firestore
-import requests
-import os
-import json
 import csv
 from tkinter import filedialog
 
-# plotting
-import matplotlib
-matplotlib.use('Agg')
-from matplotlib.figure import Figure
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+import config
+import cost
+from storage import CachedStore, FirestoreStore, open_store
+from identity import AuthError, IdentityClient
+from emissions import ACTIVITY_DETAILS, FACTOR_VERSION, calculate_co2_impact
+import aggregations
+import csv_export
+import summary_chart
+import tracing
+from leaderboard_index import LeaderboardIndex
+from profile_cache import profiles
+from logs_replica import LogsReplica, UserStatsReplica
+from loader_pool import LoaderPool
+from virtual_tree import VirtualTree
+from log_pager import DEGRADED_LIMIT, LogPager
+from weekly_window import DailyWindow
+from write_journal import WriteJournal
+
+startup_profile.mark('imports')
+
+# matplotlib is imported on first use (by the summary loader, off the Tk
+# thread) rather than before the window can appear
+_plotting = None
+
+
+def plotting():
+    global _plotting
+    if _plotting is None:
+        import matplotlib
+        matplotlib.use('Agg')
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        _plotting = (Figure, FigureCanvasTkAgg)
+        startup_profile.mark('plotting loaded')
+    return _plotting
 
 
 # Simple Tooltip helper for Tk widgets
@@ -71,13 +99,17 @@ class Tooltip:
                 pass
             self.tw = None
 
-# Initialize Firebase
-cred = credentials.Certificate('serviceAccountKey.json')
-firebase_admin.initialize_app(cred)
-db = firestore.client()
+# Storage backend (Firestore by default, SQLite via config 'backend'),
+# connected on first use so the window shows first
+store = open_store(lazy=True)
 
 APP_TITLE = "EcoTrack - Desktop (Tkinter)"
 WEEKLY_GOAL_KG = 50
+# while leaderboard refreshes run over their read budget, a result this
+# recent is shown again instead of being re-read
+LEADERBOARD_REUSE_SECONDS = 300
+# wait before retrying a token refresh that failed for want of a connection
+TOKEN_RETRY_SECONDS = 60
 
 class EcoTrackApp(tb.Window):
     def __init__(self):
@@ -123,11 +155,46 @@ class EcoTrackApp(tb.Window):
         self.current_user = None
         self.api_key = None
         self.user_goal = WEEKLY_GOAL_KG
+        self.realtime = False
+        self.logs_replica = None
+        self.stats_replica = None
+        self._replica_poll_id = None
+        # background loads share a few workers; results are applied on the Tk thread
+        self.loader = LoaderPool(dispatch=lambda fn: self.after(0, fn))
+        # fetched log pages per filter, and (token, pager, pages shown) for the current view
+        self._log_pagers = {}
+        self._logs_paging = None
+        self._logs_more_pending = False
+        # the signed-in user's last 7 days, seeded from the daily rollups and
+        # then kept current by local writes; own_logs maps recent doc ids of
+        # theirs to (timestamp, co2) so edits and deletes can be undone
+        self.week = None
+        self._week_user = None
+        self._own_logs = {}
+        # (loaded at, community total, index) of the last leaderboard load
+        self._leaderboard_cache = None
+        # writes are journaled to disk and applied to the UI at once; a
+        # background flusher commits them to the store in batches
+        self.journal = WriteJournal(store, config.get('journal_path', 'ECOTRACK_JOURNAL_PATH', 'ecotrack_journal.db'),
+                                    on_flushed=lambda n: self.after(0, self._after_flush),
+                                    on_error=lambda ex, wait: self.after(0, lambda: self._show_journal_error(ex, wait)),
+                                    on_dead=lambda entries: self.after(0, self._show_dead_letters))
         self._load_firebase_config()
+        # shared keep-alive session for sign-in and token refresh
+        self.identity = IdentityClient(self.api_key)
+        self._token_refresh_id = None
 
         self._build_ui()
+        self.protocol('WM_DELETE_WINDOW', self.on_close)
+        self._seed_week()
         self.load_logs_async()
         self.load_leaderboard_async()
+        # with the local cache the views above render from disk; pull what
+        # changed since the last session, then keep syncing in the background
+        self._sync_cache_async()
+        # send anything still queued from the last session
+        self.journal.start()
+        self._show_dead_letters()
 
     def _build_ui(self):
         # Header
@@ -175,6 +242,12 @@ class EcoTrackApp(tb.Window):
         self._build_community()
         self._build_summary()
         self._build_profile()
+        # hidden until asked for: Ctrl+Shift+D, or start with --trace
+        self.diag_frame = None
+        self.bind_all('<Control-Shift-D>', lambda e: self.show_diagnostics())
+        self.bind_all('<Control-Shift-d>', lambda e: self.show_diagnostics())
+        if tracing.enabled:
+            self.show_diagnostics(select=False)
 
     def _build_dashboard(self):
         frame = ttk.Frame(self.nb)
@@ -269,10 +342,12 @@ class EcoTrackApp(tb.Window):
         self.tree.column('uid', width=0, stretch=False)
         # add vertical scrollbar
         self.tree.pack(fill='both', expand=True, side='left')
-        vsb = ttk.Scrollbar(tree_frame, orient='vertical', command=self.tree.yview)
-        self.tree.configure(yscrollcommand=vsb.set)
+        vsb = ttk.Scrollbar(tree_frame, orient='vertical')
         vsb.pack(side='left', fill='y')
         self.tree.bind('<<TreeviewSelect>>', self.on_tree_select)
+        # only the rows around the viewport exist as Treeview items
+        self.log_view = VirtualTree(self.tree, vsb)
+        self.log_view.on_end = self.load_more_logs
 
         btns = ttk.Frame(tree_frame)
         btns.pack(fill='y', side='right', padx=6, pady=6)
@@ -296,6 +371,8 @@ class EcoTrackApp(tb.Window):
         footer.pack(fill='x', side='bottom')
         self.status_label = ttk.Label(footer, text='Ready', style='SubHeader.TLabel')
         self.status_label.pack(side='left', padx=8)
+        # shown while the journal holds writes the store rejected
+        self.failed_btn = tb.Button(footer, text='⚠ Failed changes', command=self.show_failed_changes, bootstyle='warning-link')
 
     def _build_community(self):
         frame = ttk.Frame(self.nb)
@@ -314,13 +391,14 @@ class EcoTrackApp(tb.Window):
         search_entry.pack(side='left')
         # debounce search-as-you-type
         search_entry.bind('<KeyRelease>', self._on_leaderboard_key)
-        tb.Button(ctrl, text='Search', command=self.load_leaderboard_async, bootstyle='outline-primary').pack(side='left', padx=6)
+        tb.Button(ctrl, text='Search', command=self._search_leaderboard, bootstyle='outline-primary').pack(side='left', padx=6)
         tb.Button(ctrl, text='Clear', command=self._clear_leaderboard_search, bootstyle='outline-secondary').pack(side='left', padx=6)
         Tooltip(search_entry, 'Type to filter leaderboard (search-as-you-type)')
         ttk.Label(ctrl, text='Sort:').pack(side='left', padx=(8,4))
         self.leaderboard_sort_var = tk.StringVar(value='Total')
         self.leaderboard_sort = ttk.Combobox(ctrl, values=['Total','Name'], textvariable=self.leaderboard_sort_var, state='readonly', width=8)
         self.leaderboard_sort.pack(side='left')
+        self.leaderboard_sort.bind('<<ComboboxSelected>>', self._search_leaderboard)
         tb.Button(top, text='Refresh', command=self.load_leaderboard_async, bootstyle='primary').pack(side='right')
         tb.Button(top, text='Export', command=self.export_leaderboard_csv, bootstyle='outline-secondary').pack(side='right', padx=(6,0))
 
@@ -382,20 +460,28 @@ class EcoTrackApp(tb.Window):
             self.leaderboard_search_var.set('')
         except Exception:
             pass
-        self.load_leaderboard_async()
+        self._search_leaderboard()
+
+    def _search_leaderboard(self, e=None):
+        # filter locally; only go back to Firestore when the cached rows are stale
+        index = getattr(self, 'leaderboard_index', None)
+        if index is None or index.is_stale():
+            self.load_leaderboard_async()
+        else:
+            self._render_leaderboard()
 
     def _on_leaderboard_key(self, e=None):
-        # debounce: schedule load after short delay
+        # debounce: local filtering is cheap, so only coalesce key bursts
         try:
             if hasattr(self, '_search_after_id') and self._search_after_id:
                 self.after_cancel(self._search_after_id)
         except Exception:
             pass
         try:
-            self._search_after_id = self.after(400, self.load_leaderboard_async)
+            self._search_after_id = self.after(50, self._search_leaderboard)
         except Exception:
             # fallback
-            self.load_leaderboard_async()
+            self._search_leaderboard()
 
     def _build_summary(self):
         frame = ttk.Frame(self.nb)
@@ -404,67 +490,51 @@ class EcoTrackApp(tb.Window):
 
         top = ttk.Frame(frame)
         top.pack(fill='x', padx=10, pady=8)
-        ttk.Label(top, text='Monthly CO2 (last 12 months)', font=('Segoe UI', 11, 'bold')).pack(side='left')
+        ttk.Label(top, text='Monthly CO2', font=('Segoe UI', 11, 'bold')).pack(side='left')
         tb.Button(top, text='Refresh', command=self.load_summary_async, bootstyle='primary').pack(side='right')
+        # every range is served from the monthly rollups, so longer ones cost the same
+        self.summary_range_var = tk.StringVar(value='12 months')
+        summary_range = ttk.Combobox(top, values=list(aggregations.SUMMARY_RANGES), textvariable=self.summary_range_var, state='readonly', width=10)
+        summary_range.pack(side='right', padx=6)
+        summary_range.bind('<<ComboboxSelected>>', lambda e: self.load_summary_async())
 
         self.summary_canvas_frame = ttk.Frame(frame)
         self.summary_canvas_frame.pack(fill='both', expand=True, padx=10, pady=6)
+        # created on first show, once matplotlib is loaded
+        self.summary_chart = None
 
     def load_summary_async(self):
-        threading.Thread(target=self.load_summary, daemon=True).start()
-
-    def load_summary(self):
-        # aggregate last 12 months by year-month
-        now = datetime.now()
-        start = (now.replace(day=1) - timedelta(days=365)).replace(day=1)
-        docs = db.collection('logs').where('timestamp', '>=', start).stream()
-        totals = {}
-        for doc in docs:
-            d = doc.to_dict()
-            ts = d.get('timestamp')
-            if not ts:
-                continue
-            if hasattr(ts, 'astimezone'):
-                dt = ts.astimezone()
-            else:
-                dt = ts
-            ym = dt.strftime('%Y-%m')
-            totals[ym] = totals.get(ym, 0) + abs(d.get('co2_impact', 0))
-
-        # build ordered last 12 months labels
-        labels = []
-        values = []
-        for i in range(11, -1, -1):
-            m = (now.replace(day=1) - timedelta(days=30*i)).strftime('%Y-%m')
-            labels.append(m)
-            values.append(round(totals.get(m, 0), 2))
-
         try:
-            self.status_label.config(text='Loading summary...')
+            months = aggregations.SUMMARY_RANGES.get(self.summary_range_var.get(), 12)
         except Exception:
-            pass
-        # draw chart with cleaner palette
-        fig = Figure(figsize=(8,3.2), dpi=100, facecolor='#F8FCFB')
-        ax = fig.add_subplot(111, facecolor='#F8FCFB')
-        bars = ax.bar(labels, values, color='#2b8cbe', edgecolor='#08519c')
-        ax.set_ylabel('kg CO2')
-        ax.set_xticklabels(labels, rotation=45, ha='right')
-        ax.grid(axis='y', linestyle='--', alpha=0.4)
-        ax.set_ylim(0, max(values) * 1.15 if values else 1)
-        fig.tight_layout(pad=1.0)
+            months = 12
+        self._set_status('Loading summary...')
+        self.loader.submit('summary', lambda: self._fetch_summary(months), self._show_summary)
+
+    def _fetch_summary(self, months):
+        # monthly totals come from the rollups (or the live replica for the
+        # last year); the series and axis labels are prepared here, off the Tk thread
+        plotting()
+        if months == 12 and self._replica_ready(self.logs_replica):
+            totals = self.logs_replica.month_totals()
+        else:
+            with cost.operation('summary.refresh'):
+                totals = aggregations.monthly_totals(store)
+        return summary_chart.prepare(totals, datetime.now(), months)
+
+    def _show_summary(self, prepared):
+        # the chart is built once and updated in place
+        if self.summary_chart is None:
+            self.summary_chart = summary_chart.SummaryChart(self.summary_canvas_frame, plotting())
+        self.summary_chart.show(prepared)
+        self._set_status('Ready')
+
+    def _set_status(self, text):
         try:
-            self.status_label.config(text='Ready')
+            self.status_label.config(text=text)
         except Exception:
             pass
 
-        # clear previous
-        for child in self.summary_canvas_frame.winfo_children():
-            child.destroy()
-
-        canvas = FigureCanvasTkAgg(fig, master=self.summary_canvas_frame)
-        canvas.draw()
-        canvas.get_tk_widget().pack(fill='both', expand=True)
-
     def _build_profile(self):
         frame = ttk.Frame(self.nb)
         frame.pack(fill='both', expand=True)
@@ -493,14 +563,93 @@ class EcoTrackApp(tb.Window):
             pass
 
 
+    # --- Diagnostics (hidden tab) ---
+    def show_diagnostics(self, select=True):
+        if self.diag_frame is None:
+            self._build_diagnostics()
+        if select:
+            self.nb.select(self.diag_frame)
+
+    def _build_diagnostics(self):
+        frame = ttk.Frame(self.nb)
+        frame.pack(fill='both', expand=True)
+        self.nb.add(frame, text='Diagnostics')
+        self.diag_frame = frame
+
+        top = ttk.Frame(frame)
+        top.pack(fill='x', padx=10, pady=8)
+        self.trace_var = tk.BooleanVar(value=tracing.enabled)
+        ttk.Checkbutton(top, text='Record spans', variable=self.trace_var,
+                        command=lambda: tracing.enable(self.trace_var.get())).pack(side='left')
+        tb.Button(top, text='Export Trace', command=self.export_trace, bootstyle='primary').pack(side='right')
+        tb.Button(top, text='Export Costs', command=self.export_costs, bootstyle='primary').pack(side='right', padx=6)
+        tb.Button(top, text='Reset', command=self._reset_diagnostics, bootstyle='secondary').pack(side='right', padx=6)
+        self.cost_label = ttk.Label(frame, text='')
+        self.cost_label.pack(fill='x', padx=10)
+
+        cols = ('operation', 'calls', 'p50', 'p95', 'max', 'docs', 'bytes')
+        self.diag_tree = ttk.Treeview(frame, columns=cols, show='headings')
+        for c, title in zip(cols, ('Operation', 'Calls', 'p50 ms', 'p95 ms', 'Max ms', 'Docs', 'Bytes')):
+            self.diag_tree.heading(c, text=title)
+            self.diag_tree.column(c, width=90, anchor='e')
+        self.diag_tree.column('operation', width=260, anchor='w')
+        self.diag_tree.pack(fill='both', expand=True, padx=10, pady=6)
+        self._refresh_diagnostics()
+
+    def _refresh_diagnostics(self):
+        # this session's latency per operation; repaints while the tab is open
+        try:
+            if self.nb.select() == str(self.diag_frame):
+                self.diag_tree.delete(*self.diag_tree.get_children())
+                for r in tracing.stats():
+                    self.diag_tree.insert('', 'end', values=(r['name'], r['count'], f"{r['p50_ms']:.1f}", f"{r['p95_ms']:.1f}",
+                                                             f"{r['max_ms']:.1f}", r['docs'], r['bytes']))
+                self.cost_label.config(text=self._cost_text())
+        except Exception:
+            pass
+        self.after(1000, self._refresh_diagnostics)
+
+    def _cost_text(self):
+        # session Firestore usage, and the operations currently over budget
+        summary = cost.summary()
+        s = summary['session']
+        text = f"Firestore this session: {s['reads']} reads, {s['writes']} writes, {s['deletes']} deletes"
+        over = sorted(name for name, t in summary['operations'].items() if t['over_budget'])
+        if over:
+            text += ' | over budget: ' + ', '.join(over)
+        return text
+
+    def _reset_diagnostics(self):
+        tracing.reset()
+        cost.reset()
+        try:
+            self.diag_tree.delete(*self.diag_tree.get_children())
+        except Exception:
+            pass
+
+    def export_trace(self):
+        path = filedialog.asksaveasfilename(title='Export Trace', defaultextension='.json', filetypes=[('Chrome trace','*.json')])
+        if not path:
+            return
+        try:
+            n = tracing.export_chrome(path)
+            self._set_status(f'Exported {n} spans to {path} (open in chrome://tracing or Perfetto)')
+        except Exception as ex:
+            messagebox.showerror('Export Trace', str(ex))
+
+    def export_costs(self):
+        path = filedialog.asksaveasfilename(title='Export Costs', defaultextension='.json', filetypes=[('JSON','*.json')])
+        if not path:
+            return
+        try:
+            cost.export(path)
+            self._set_status(f'Exported Firestore usage to {path}')
+        except Exception as ex:
+            messagebox.showerror('Export Costs', str(ex))
+
     def _on_type_change(self, e=None):
         t = self.activity_type.get()
-        if t == 'Transport':
-            opts = ['Car (per mile)','Bus (per mile)','Train (per mile)','Bike (per mile)','Walk (per mile)','Electric Vehicle (per mile)']
-        elif t == 'Meal':
-            opts = ['Beef Meal','Chicken Meal','Vegetarian Meal','Vegan Meal']
-        else:
-            opts = ['Electricity (per kWh)','Natural Gas (per therm)']
+        opts = ACTIVITY_DETAILS.get(t) or ACTIVITY_DETAILS['Energy']
         self.activity_detail['values'] = opts
         if opts:
             self.activity_detail.current(0)
@@ -526,13 +675,16 @@ class EcoTrackApp(tb.Window):
             'amount': amount,
             'description': self.desc_var.get() or '',
             'co2_impact': impact,
+            'factor_version': FACTOR_VERSION,
             'timestamp': datetime.now(),
             'user_id': (self.current_user.get('uid') if self.current_user else 'default_user')
         }
-        db.collection('logs').add(data)
+        doc_id = self.journal.add_log(data)
+        self._week_update(doc_id, (data['timestamp'], impact))
+        if getattr(self, 'logs_filter_user', None) in (None, data['user_id']):
+            self.log_view.prepend(doc_id, self._log_values(data))
         self._clear_inputs()
-        self.load_logs_async()
-        self.load_leaderboard_async()
+        self._show_pending()
 
     def _update_log(self):
         try:
@@ -548,13 +700,18 @@ class EcoTrackApp(tb.Window):
             'amount': amount,
             'description': self.desc_var.get() or '',
             'co2_impact': impact,
+            'factor_version': FACTOR_VERSION,
         }
-        db.collection('logs').document(self.selected_doc_id).update(data)
+        self.journal.update_log(self.selected_doc_id, data)
+        old = self._own_logs.get(self.selected_doc_id)
+        self._week_update(self.selected_doc_id, (old[0], impact) if old else None)
+        shown = self.log_view.get(self.selected_doc_id)
+        if shown:
+            self.log_view.replace(self.selected_doc_id, (detail, amount, impact, data['description']) + tuple(shown[4:]))
         self.selected_doc_id = None
         self.add_btn.config(text='Add Log')
         self._clear_inputs()
-        self.load_logs_async()
-        self.load_leaderboard_async()
+        self._show_pending()
 
     def on_tree_select(self, e):
         sel = self.tree.selection()
@@ -598,73 +755,321 @@ class EcoTrackApp(tb.Window):
             return
         doc_id = sel[0]
         if messagebox.askyesno('Confirm','Delete selected log?'):
-            db.collection('logs').document(doc_id).delete()
+            self.journal.delete_log(doc_id)
+            self._week_update(doc_id)
+            self.log_view.remove(doc_id)
+            self._show_pending()
+
+    def _refresh_after_write(self):
+        # with live replicas the snapshot listener delivers the change
+        if self.logs_replica is not None:
+            return
+        self._log_pagers.clear()
+        self.load_logs_async()
+        self.load_leaderboard_async()
+
+    # --- Write journal ---
+    def _show_pending(self):
+        n = self.journal.pending_count()
+        if n:
+            self._set_status(f'{n} change(s) waiting to sync')
+
+    def _after_flush(self):
+        # queued writes reached the store; reload the views from it
+        n = self.journal.pending_count()
+        self._refresh_after_write()
+        if n:
+            self._set_status(f'{n} change(s) waiting to sync')
+
+    def _show_journal_error(self, ex, wait):
+        print(f'[EcoTrack] write flush failed: {ex}')
+        n = self.journal.pending_count()
+        if n:
+            self._set_status(f'Offline: {n} change(s) saved locally, retrying in {wait}s')
+
+    def _show_dead_letters(self):
+        # writes the store rejected wait, out of the queue, for a retry or discard
+        n = len(self.journal.dead_letters())
+        try:
+            if n:
+                self.failed_btn.config(text=f'⚠ {n} failed change(s)')
+                self.failed_btn.pack(side='right', padx=8)
+            else:
+                self.failed_btn.pack_forget()
+        except Exception:
+            pass
+        if n:
+            self._set_status(f'{n} change(s) could not be saved')
+
+    def show_failed_changes(self):
+        win = tk.Toplevel(self)
+        win.title('Failed changes')
+        win.transient(self)
+        cols = ('when', 'change', 'log', 'error')
+        tree = ttk.Treeview(win, columns=cols, show='headings', height=10)
+        for c, title, width in zip(cols, ('When', 'Change', 'Log / user', 'Error'), (120, 90, 160, 380)):
+            tree.heading(c, text=title)
+            tree.column(c, width=width, anchor='w')
+        tree.pack(fill='both', expand=True, padx=10, pady=(10, 6))
+
+        def refresh():
+            tree.delete(*tree.get_children())
+            for e in self.journal.dead_letters():
+                tree.insert('', 'end', iid=e['key'], values=(e['created'].strftime('%b %d %H:%M'), e['op'],
+                                                             e['doc_id'], e['last_error'] or ''))
+            self._show_dead_letters()
+
+        def retry():
+            self.journal.retry_dead(tree.selection() or None)
+            refresh()
+            self._show_pending()
+
+        def discard():
+            keys = tree.selection()
+            if not keys and not messagebox.askyesno('Failed changes', 'Discard all failed changes?', parent=win):
+                return
+            self.journal.discard_dead(keys or None)
+            refresh()
+            self._refresh_after_write()
+
+        btns = ttk.Frame(win)
+        btns.pack(fill='x', padx=10, pady=(0, 10))
+        tb.Button(btns, text='Retry', command=retry, bootstyle='primary').pack(side='left')
+        tb.Button(btns, text='Discard', command=discard, bootstyle='danger').pack(side='left', padx=6)
+        tb.Button(btns, text='Close', command=win.destroy, bootstyle='secondary').pack(side='right')
+        refresh()
+
+    # --- Local cache sync (optional, 'cache' in firebase_config.json) ---
+    def _sync_cache_async(self):
+        self.loader.submit('sync', self._sync_cache, self._after_sync)
+
+    def _sync_cache(self):
+        backend = store.get()
+        if not hasattr(backend, 'sync'):
+            return None
+        try:
+            with cost.operation('cache.sync'):
+                return backend.sync()
+        except Exception as ex:
+            print(f'[EcoTrack] cache sync failed: {ex}')
+            return {}
+
+    def _after_sync(self, counts):
+        if counts is None:
+            return
+        if any(counts.values()):
+            self._log_pagers.clear()
+            profiles.invalidate()
+            self._seed_week()
             self.load_logs_async()
             self.load_leaderboard_async()
+        try:
+            interval = float(config.get('sync_interval', 'ECOTRACK_SYNC_INTERVAL', 60))
+        except (TypeError, ValueError):
+            interval = 60
+        self.after(int(interval * 1000), self._sync_cache_async)
+
+    # --- Realtime replicas (optional, 'realtime' in firebase_config.json) ---
+    def _firestore_backend(self):
+        # the FirestoreStore behind the configured store, if any (worker thread)
+        backend = store.get()
+        if isinstance(backend, CachedStore):
+            backend = backend.remote
+        return backend if isinstance(backend, FirestoreStore) else None
+
+    # The listeners run while a user is signed in: attached on sign-in,
+    # detached on sign-out and when the window closes.
+    def _attach_replicas(self):
+        if self.realtime and self.logs_replica is None:
+            # connect in the background, then attach the listeners on the Tk thread
+            self.loader.submit('replicas', self._firestore_backend, self._start_replicas)
+
+    def _start_replicas(self, backend):
+        # listeners need the Firestore backend
+        if backend is None or self.current_user is None or self.logs_replica is not None:
+            return
+        now = datetime.now()
+        since = (now.replace(day=1) - timedelta(days=365)).replace(day=1)
+        try:
+            self.logs_replica = LogsReplica(backend.db, since).start()
+            self.stats_replica = UserStatsReplica(backend.db).start()
+        except Exception:
+            self._stop_replicas()
+            return
+        self._replica_versions = (-1, -1)
+        self._replica_poll_id = self.after(500, self._poll_replicas)
+
+    def _stop_replicas(self):
+        self.loader.cancel('replicas')
+        if self._replica_poll_id is not None:
+            try:
+                self.after_cancel(self._replica_poll_id)
+            except Exception:
+                pass
+            self._replica_poll_id = None
+        for replica in (self.logs_replica, self.stats_replica):
+            if replica is not None:
+                replica.stop()
+        self.logs_replica = None
+        self.stats_replica = None
+
+    def _replica_ready(self, replica):
+        return replica is not None and replica.ready.is_set()
+
+    def _poll_replicas(self):
+        # runs on the Tk thread; re-render only the views whose data changed
+        try:
+            logs_v = self.logs_replica.version if self._replica_ready(self.logs_replica) else -1
+            stats_v = self.stats_replica.version if self._replica_ready(self.stats_replica) else -1
+            seen_logs, seen_stats = self._replica_versions
+            if logs_v != seen_logs:
+                self.load_logs_async()
+                self.load_summary_async()
+            if stats_v != seen_stats:
+                self.load_leaderboard_async()
+            self._replica_versions = (logs_v, stats_v)
+        except Exception:
+            pass
+        self._replica_poll_id = self.after(500, self._poll_replicas)
 
     def _clear_inputs(self):
         self.amount_var.set('')
         self.desc_var.set('')
 
     def _calc(self, detail, amount):
-        EM = {
-            'Car (per mile)':0.404,'Bus (per mile)':0.089,'Train (per mile)':0.041,
-            'Bike (per mile)':0.0,'Walk (per mile)':0.0,'Electric Vehicle (per mile)':0.15,
-            'Beef Meal':6.61,'Chicken Meal':2.33,'Vegetarian Meal':1.0,'Vegan Meal':0.68,
-            'Electricity (per kWh)':0.92,'Natural Gas (per therm)':5.3
-        }
-        return round(EM.get(detail,0)*amount,2)
+        return calculate_co2_impact(detail, amount)
 
     def load_logs_async(self):
-        threading.Thread(target=self.load_logs, daemon=True).start()
-
-    def load_logs(self):
-        # fetch latest logs and populate treeview
-        try:
-            self.status_label.config(text='Loading logs...')
-        except Exception:
-            pass
-        for i in self.tree.get_children():
-            self.tree.delete(i)
         # support optional per-user filter (set by leaderboard profile view)
         uid_filter = getattr(self, 'logs_filter_user', None)
+        self._set_status('Loading logs...')
+        token = self.log_view.begin()
+        self._logs_paging = None
+        self._logs_more_pending = True
+        pager = self._log_pager(uid_filter)
+        uid = self._week_user
+        self.loader.submit('logs', lambda: self._fetch_logs(pager, token, uid), self._show_logs)
+
+    def _log_pager(self, uid_filter):
+        # keep the pagers of the last few filters so switching back is free
+        pager = self._log_pagers.pop(uid_filter, None) or LogPager(store, uid_filter)
+        self._log_pagers[uid_filter] = pager
+        while len(self._log_pagers) > 8:
+            self._log_pagers.pop(next(iter(self._log_pagers)))
+        return pager
+
+    def _fetch_logs(self, pager, token, uid):
+        # hand the cached pages (at least the first) to the log view; older
+        # pages are fetched by load_more_logs as the user scrolls. uid's
+        # recent logs are returned for the weekly window, which only the
+        # Tk thread touches
+        status = 'Ready'
+        shown = 0
+        own = {}
         try:
-            if uid_filter:
-                docs = db.collection('logs').where('user_id', '==', uid_filter).order_by('timestamp', direction=firestore.Query.DESCENDING).limit(200).stream()
+            if self._replica_ready(self.logs_replica):
+                # the replica already holds the last 13 months in memory
+                self._put_logs(token, self.logs_replica.latest(None, pager.user_id), uid, own)
+                pager = None
             else:
-                docs = db.collection('logs').order_by('timestamp', direction=firestore.Query.DESCENDING).limit(200).stream()
-        except Exception:
-            # fallback to simple stream if ordering with where fails
-            try:
-                docs = db.collection('logs').stream()
-            except Exception:
-                docs = []
-        for doc in docs:
-            d = doc.to_dict()
+                with cost.operation('logs.page'):
+                    for i in range(max(1, len(pager.pages))):
+                        self._put_logs(token, pager.page(i), uid, own)
+                        shown = i + 1
+                if pager.degraded:
+                    print(f'[EcoTrack] ordered log query failed: {pager.error}')
+                    if pager.partial:
+                        status = (f'Limited view: ordered log query failed, showing {DEGRADED_LIMIT} logs '
+                                  'in no particular order, not necessarily the newest')
+                    else:
+                        status = f'Limited view: ordered log query failed, showing the newest {DEGRADED_LIMIT} logs'
+        except Exception as ex:
+            status = f'Could not load logs: {ex}'
+        return (uid, own), status, (token, pager, shown)
+
+    def _put_logs(self, token, docs, uid, own):
+        # queue docs for the log view; uid's logs from the last 8 days go in own
+        chunk = []
+        cutoff = datetime.now() - timedelta(days=8)
+        for doc_id, d in docs:
             timestamp = d.get('timestamp')
-            t = timestamp.strftime('%b %d %H:%M') if hasattr(timestamp,'strftime') else ''
-            # include owner uid as hidden last column
-            values = (d.get('activity_detail'), d.get('amount'), d.get('co2_impact'), d.get('description'), t, d.get('user_id','default_user'))
-            # use document id as item id
-            self.tree.insert('', 'end', iid=doc.id, values=values)
+            if d.get('user_id') == uid and hasattr(timestamp, 'timestamp') and timestamp.timestamp() >= cutoff.timestamp():
+                own[doc_id] = (timestamp, d.get('co2_impact'))
+            # document id is the item id
+            chunk.append((doc_id, self._log_values(d)))
+            if len(chunk) >= 500:
+                self.log_view.put(token, chunk)
+                chunk = []
+        if chunk:
+            self.log_view.put(token, chunk)
+
+    def _log_values(self, d):
+        timestamp = d.get('timestamp')
+        t = timestamp.strftime('%b %d %H:%M') if hasattr(timestamp,'strftime') else ''
+        # include owner uid as hidden last column
+        return (d.get('activity_detail'), d.get('amount'), d.get('co2_impact'), d.get('description'), t, d.get('user_id','default_user'))
+
+    def _show_logs(self, result):
+        own, status, self._logs_paging = result
+        startup_profile.mark('first logs shown')
+        self._logs_more_pending = False
+        self._remember_own_logs(*own)
         self.update_weekly_progress()
+        self._set_status(status)
+
+    def _remember_own_logs(self, uid, own):
+        # (timestamp, co2) of the signed-in user's recent logs, so local edits
+        # can adjust the weekly window; a local write since the fetch wins
+        if uid != self._week_user:
+            return
+        for doc_id, entry in own.items():
+            self._own_logs.setdefault(doc_id, entry)
+
+    def load_more_logs(self):
+        # the log view scrolled near its last row: fetch the next page
+        paging = self._logs_paging
+        if paging is None or self._logs_more_pending:
+            return
+        token, pager, shown = paging
+        if pager is None or (pager.done and shown >= len(pager.pages)):
+            return
+        self._logs_more_pending = True
+        self._set_status('Loading older logs...')
+        uid = self._week_user
+        self.loader.submit('logs_more', lambda: self._fetch_more_logs(token, pager, shown, uid), self._show_more_logs)
+
+    def _fetch_more_logs(self, token, pager, shown, uid):
+        own = {}
         try:
-            self.status_label.config(text='Ready')
-        except Exception:
-            pass
+            with cost.operation('logs.page'):
+                self._put_logs(token, pager.page(shown), uid, own)
+            return token, pager, shown + 1, 'Ready', (uid, own)
+        except Exception as ex:
+            return token, pager, shown, f'Could not load older logs: {ex}', (uid, own)
 
-    def load_user_profile_async(self):
-        threading.Thread(target=self.load_user_profile, daemon=True).start()
+    def _show_more_logs(self, result):
+        token, pager, shown, status, own = result
+        self._remember_own_logs(*own)
+        if token != self.log_view.token:
+            return
+        self._logs_paging = (token, pager, shown)
+        self._logs_more_pending = False
+        self._set_status(status)
 
-    def load_user_profile(self):
-        # fetch user doc with personal settings (like weekly goal)
+    def load_user_profile_async(self):
         if not self.current_user:
             return
+        uid = self.current_user.get('uid')
+        self.loader.submit('profile', lambda: self._fetch_profile(uid), self._apply_user_profile)
+
+    def _fetch_profile(self, uid):
+        with cost.operation('profile.load'):
+            return profiles.get(store, uid)
+
+    def _apply_user_profile(self, d):
+        # personal settings (like weekly goal) from the user doc
         try:
-            uid = self.current_user.get('uid')
-            doc = db.collection('users').document(uid).get()
-            if doc.exists:
-                d = doc.to_dict()
+            if d:
                 goal = d.get('weekly_goal_kg')
                 if goal:
                     self.user_goal = goal
@@ -678,7 +1083,6 @@ class EcoTrackApp(tb.Window):
                         self.location_var.set(loc)
                 except Exception:
                     pass
-            # update UI on main thread
             try:
                 self.goal_label.config(text=f'Goal: {self.user_goal} kg')
             except Exception:
@@ -701,7 +1105,8 @@ class EcoTrackApp(tb.Window):
             return
         try:
             uid = self.current_user.get('uid')
-            db.collection('users').document(uid).set({'weekly_goal_kg': float(val)}, merge=True)
+            self.journal.set_profile(uid, {'weekly_goal_kg': float(val)})
+            profiles.update(uid, {'weekly_goal_kg': float(val)})
             self.user_goal = float(val)
             self.goal_label.config(text=f'Goal: {self.user_goal} kg')
             self.update_weekly_progress()
@@ -719,107 +1124,86 @@ class EcoTrackApp(tb.Window):
                 'display_name': self.display_name_var.get() or None,
                 'location': self.location_var.get() or None,
             }
-            db.collection('users').document(uid).set(payload, merge=True)
+            self.journal.set_profile(uid, payload)
+            profiles.update(uid, payload)
             messagebox.showinfo('Profile', 'Profile saved')
         except Exception as ex:
             messagebox.showerror('Profile', str(ex))
 
     def export_csv(self):
-        # fetch logs and write CSV (with display_name) or per-user CSVs
-        docs = db.collection('logs').order_by('timestamp', direction=firestore.Query.DESCENDING).stream()
-        rows = []
-        user_cache = {}
-        for doc in docs:
-            d = doc.to_dict()
-            ts = d.get('timestamp')
-            t = ts.strftime('%Y-%m-%d %H:%M:%S') if hasattr(ts, 'strftime') else ''
-            uid = d.get('user_id','')
-            display_name = ''
-            if uid:
-                if uid in user_cache:
-                    display_name = user_cache[uid]
-                else:
-                    try:
-                        udoc = db.collection('users').document(uid).get()
-                        if udoc.exists:
-                            udata = udoc.to_dict()
-                            display_name = udata.get('display_name') or ''
-                    except Exception:
-                        display_name = ''
-                    user_cache[uid] = display_name
-            rows.append({
-                'id': doc.id,
-                'activity_type': d.get('activity_type'),
-                'activity_detail': d.get('activity_detail'),
-                'amount': d.get('amount'),
-                'co2_impact': d.get('co2_impact'),
-                'description': d.get('description'),
-                'timestamp': t,
-                'display_name': display_name,
-                'user_id': uid,
-            })
-
-        if not rows:
-            messagebox.showinfo('Export CSV', 'No logs to export')
-            return
-
+        # ask for the destination first, then stream logs to CSV page by page
+        # on a worker thread (single file, or one file per user)
         per_user = messagebox.askyesno('Export CSV', 'Export separate CSV files per user? (Yes = separate files, No = single CSV)')
         if per_user:
-            folder = filedialog.askdirectory(title='Select folder to save per-user CSVs')
-            if not folder:
-                return
-            # group rows by uid
-            groups = {}
-            for r in rows:
-                uid = r.get('user_id') or 'unknown'
-                groups.setdefault(uid, []).append(r)
-
-            def _safe_name(s):
-                s = s or ''
-                name = ''.join(c for c in s if c.isalnum() or c in (' ', '-', '_')).rstrip()
-                name = name.replace(' ', '_') or 'user'
-                return name
-
-            count = 0
-            for uid, group in groups.items():
-                display = user_cache.get(uid) or uid
-                fname = f"{_safe_name(display)}_{uid[:8] if uid else 'anon'}.csv"
-                path = os.path.join(folder, fname)
-                try:
-                    with open(path, 'w', newline='', encoding='utf-8') as f:
-                        fieldnames = ['id','activity_type','activity_detail','amount','co2_impact','description','timestamp','display_name','user_id']
-                        writer = csv.DictWriter(f, fieldnames=fieldnames)
-                        writer.writeheader()
-                        for r in group:
-                            writer.writerow({k: r.get(k, '') for k in fieldnames})
-                    count += 1
-                except Exception as ex:
-                    messagebox.showerror('Export CSV', f'Failed to write {path}: {ex}')
-            messagebox.showinfo('Export CSV', f'Exported {count} files to {folder}')
+            dest = filedialog.askdirectory(title='Select folder to save per-user CSVs')
+        else:
+            dest = filedialog.asksaveasfilename(title='Save CSV', defaultextension='.csv', filetypes=[('CSV files','*.csv')])
+        if not dest:
             return
+        threading.Thread(target=self._export_csv_worker, args=(per_user, dest), daemon=True).start()
+
+    def _export_csv_worker(self, per_user, dest):
+        def progress(rows, elapsed, rate):
+            try:
+                self.after(0, lambda: self.status_label.config(text=f'Exporting... {rows} rows ({rate:,.0f} rows/s)'))
+            except Exception:
+                pass
 
-        # single CSV: ask file path
-        fpath = filedialog.asksaveasfilename(title='Save CSV', defaultextension='.csv', filetypes=[('CSV files','*.csv')])
-        if not fpath:
-            return
         try:
-            with open(fpath, 'w', newline='', encoding='utf-8') as f:
-                fieldnames = ['id','activity_type','activity_detail','amount','co2_impact','description','timestamp','display_name','user_id']
-                writer = csv.DictWriter(f, fieldnames=fieldnames)
-                writer.writeheader()
-                for r in rows:
-                    writer.writerow({k: r.get(k, '') for k in fieldnames})
-            messagebox.showinfo('Export CSV', f'Exported {len(rows)} rows to {fpath}')
+            with cost.operation('export.csv'):
+                if per_user:
+                    rows, files = csv_export.export_per_user(store, dest, progress=progress)
+                    done = f'Exported {rows} rows in {files} files to {dest}'
+                else:
+                    rows = csv_export.export_single(store, dest, progress=progress)
+                    done = f'Exported {rows} rows to {dest}'
         except Exception as ex:
-            messagebox.showerror('Export CSV', str(ex))
+            err = str(ex)
+            self.after(0, lambda: (self.status_label.config(text='Export failed'), messagebox.showerror('Export CSV', err)))
+            return
+        if not rows:
+            done = 'No logs to export'
+        self.after(0, lambda: (self.status_label.config(text=done), messagebox.showinfo('Export CSV', done)))
 
     def update_weekly_progress(self):
-        week_ago = datetime.now() - timedelta(days=7)
-        docs = db.collection('logs').where('timestamp','>=',week_ago).stream()
-        total = 0
-        for doc in docs:
-            d = doc.to_dict()
-            total += abs(d.get('co2_impact',0))
+        total = self._weekly_total()
+        if total is not None:
+            self._show_weekly(total)
+
+    def _weekly_total(self):
+        # no reads: the window is seeded once per sign-in
+        week = self.week
+        return week.total() if week is not None else None
+
+    def _seed_week(self):
+        uid = self.current_user.get('uid') if self.current_user else 'default_user'
+        self.week = None
+        self._week_user = uid
+        self._own_logs = {}
+        self.loader.submit('week', lambda: self._fetch_week(uid), self._set_week)
+
+    def _fetch_week(self, uid):
+        with cost.operation('weekly.seed'):
+            return DailyWindow(uid).seed(store)
+
+    def _set_week(self, week):
+        self.week = week
+        self.update_weekly_progress()
+
+    def _week_update(self, doc_id, new=None):
+        # apply a local write to the weekly window; new is (timestamp, co2) or None
+        week = self.week
+        if week is None:
+            return
+        old = self._own_logs.pop(doc_id, None)
+        if old is not None:
+            week.remove(*old)
+        if new is not None and week.covers(new[0]):
+            week.add(*new)
+            self._own_logs[doc_id] = new
+        self.update_weekly_progress()
+
+    def _show_weekly(self, total):
         self.total_label.config(text=f'Total CO2 This Week: {round(total,2)} kg')
         goal = getattr(self, 'user_goal', WEEKLY_GOAL_KG) or WEEKLY_GOAL_KG
         try:
@@ -829,108 +1213,65 @@ class EcoTrackApp(tb.Window):
         self.progress['value'] = pct
 
     def load_leaderboard_async(self):
-        threading.Thread(target=self.load_leaderboard, daemon=True).start()
+        current_user = self.current_user
+        self._set_status('Loading leaderboard...')
+        self.loader.submit('leaderboard', lambda: self._fetch_leaderboard(current_user), self._show_leaderboard)
+
+    def _fetch_leaderboard(self, current_user):
+        cached = self._leaderboard_cache
+        if (cached is not None and cost.over_budget('leaderboard.refresh')
+                and time.time() - cached[0] < LEADERBOARD_REUSE_SECONDS):
+            return cached[1], cached[2], 'Leaderboard is over its read budget; showing the last result'
+
+        with cost.operation('leaderboard.refresh'):
+            # per-user totals are maintained incrementally in user_stats
+            if self._replica_ready(self.stats_replica):
+                totals = self.stats_replica.totals()
+            else:
+                totals = store.user_totals()
 
-    def load_leaderboard(self):
-        try:
-            self.status_label.config(text='Loading leaderboard...')
-        except Exception:
-            pass
-        # clear previous leaderboard listbox entries
-        try:
-            if getattr(self, 'leaderboard_listbox', None) is not None:
-                self.leaderboard_listbox.delete(0, 'end')
-        except Exception:
-            pass
-        all_docs = db.collection('logs').stream()
-        totals = {}
-        total_community = 0
-        for doc in all_docs:
-            d = doc.to_dict()
-            uid = d.get('user_id','Unknown')
-            kg = abs(d.get('co2_impact',0))
-            totals[uid] = totals.get(uid,0)+kg
-            total_community += kg
-        # Resolve display names where available (users collection), with caching
-        label_map = {}
-        user_cache = {}
-        for uid in totals.keys():
-            if uid == 'default_user':
-                label_map[uid] = 'Anonymous'
-                continue
-            if self.current_user and uid == self.current_user.get('uid'):
-                label_map[uid] = f"You ({self.current_user.get('email')})"
-                continue
-            # try cache first
-            if uid in user_cache:
-                name = user_cache.get(uid)
-                label_map[uid] = name or uid
-                continue
-            try:
-                doc = db.collection('users').document(uid).get()
-                if doc.exists:
-                    d = doc.to_dict()
-                    name = d.get('display_name')
-                    user_cache[uid] = name
-                    if name:
-                        label_map[uid] = name
-                        continue
-            except Exception:
-                pass
-            label_map[uid] = uid
+            # Resolve display names where available (users collection)
+            rows = aggregations.leaderboard_rows(store, totals, current_user)
 
-        self.community_total.config(text=f'🌍 Total Community Impact: {round(total_community,2)} kg')
+        # keep the loaded rows indexed so search/sort can run locally
+        with tracing.span('agg.leaderboard_index', 'agg', users=len(totals)):
+            index = LeaderboardIndex(rows)
+        self._leaderboard_cache = (time.time(), sum(totals.values()), index)
+        return sum(totals.values()), index, 'Ready'
 
+    def _show_leaderboard(self, result):
+        total_community, self.leaderboard_index, status = result
+        self.community_total.config(text=f'🌍 Total Community Impact: {round(total_community,2)} kg')
+        self._render_leaderboard()
+        self._set_status(status)
+
+    @tracing.traced('tk.leaderboard.render', 'render')
+    def _render_leaderboard(self, e=None):
+        # filter and sort the cached rows; no Firestore access
+        index = getattr(self, 'leaderboard_index', None)
+        if index is None:
+            return
         # Apply search filter (by display name or uid)
         search_term = ''
         try:
             search_term = (self.leaderboard_search_var.get() or '').strip().lower()
         except Exception:
             search_term = ''
-
-        rows = []
-        for uid, kg in totals.items():
-            display_name = label_map.get(uid, uid)
-            rows.append((uid, display_name, kg))
-
-        # store rows for UI interactions
-        try:
-            self.leaderboard_rows = rows
-        except Exception:
-            self.leaderboard_rows = []
-
-        # apply search
-        if search_term:
-            rows = [r for r in rows if search_term in (r[1] or '').lower() or search_term in (r[0] or '').lower()]
-
         # sort
         sort_by = 'Total'
         try:
             sort_by = (self.leaderboard_sort_var.get() or 'Total')
         except Exception:
             sort_by = 'Total'
-        if sort_by == 'Name':
-            rows.sort(key=lambda x: (x[1] or '').lower())
-        else:
-            rows.sort(key=lambda x: x[2], reverse=True)
-
-        # debug: print counts
-        try:
-            print(f'[EcoTrack] leaderboard totals={len(totals)} rows_after_filter={len(rows)}')
-            for r in rows[:8]:
-                print('  ->', r[1], r[2])
-        except Exception:
-            pass
+        # keep a copy of rows for selection actions
+        rows = index.search(search_term, sort_by, limit=200)
+        self.leaderboard_rows = rows
 
         # populate listbox (primary display)
         try:
             if getattr(self, 'leaderboard_listbox', None) is not None:
-                # keep a copy of rows for selection actions
-                try:
-                    self.leaderboard_rows = rows[:200]
-                except Exception:
-                    self.leaderboard_rows = rows
-                for idx, (uid, display_name, kg) in enumerate(self.leaderboard_rows):
+                self.leaderboard_listbox.delete(0, 'end')
+                for idx, (uid, display_name, kg) in enumerate(rows):
                     try:
                         self.leaderboard_listbox.insert('end', f"{display_name} — {round(kg,2)} kg")
                     except Exception:
@@ -955,23 +1296,11 @@ class EcoTrackApp(tb.Window):
                     pass
         except Exception:
             pass
-        try:
-            self.status_label.config(text='Ready')
-        except Exception:
-            pass
 
     # --- Authentication helpers ---
     def _load_firebase_config(self):
-        cfg_path = os.path.join(os.path.dirname(__file__), 'firebase_config.json')
-        if os.path.exists(cfg_path):
-            try:
-                with open(cfg_path, 'r', encoding='utf-8') as f:
-                    cfg = json.load(f)
-                    self.api_key = cfg.get('apiKey')
-            except Exception:
-                self.api_key = None
-        else:
-            self.api_key = os.environ.get('FIREBASE_API_KEY')
+        self.api_key = config.get('apiKey', 'FIREBASE_API_KEY')
+        self.realtime = config.get_bool('realtime', 'ECOTRACK_REALTIME')
 
     def change_theme(self):
         # attempt to switch ttkbootstrap theme at runtime
@@ -992,6 +1321,13 @@ class EcoTrackApp(tb.Window):
                 pass
 
     def register(self):
+        self._authenticate('Register failed', self.identity.sign_up)
+
+    def sign_in(self):
+        self._authenticate('Sign-in failed', self.identity.sign_in)
+
+    def _authenticate(self, title, call):
+        # the identity-toolkit round trip runs on a loader thread
         if not self.api_key:
             messagebox.showwarning('Missing API Key','Add firebase_config.json with apiKey or set FIREBASE_API_KEY env var')
             return
@@ -1000,69 +1336,104 @@ class EcoTrackApp(tb.Window):
         if not email or not pw:
             messagebox.showerror('Error','Email and password required')
             return
-        url = f'https://identitytoolkit.googleapis.com/v1/accounts:signUp?key={self.api_key}'
-        payload = {'email': email, 'password': pw, 'returnSecureToken': True}
-        r = requests.post(url, json=payload)
-        if r.status_code == 200:
-            data = r.json()
-            self.current_user = {'uid': data['localId'], 'email': email, 'idToken': data['idToken']}
-            self.user_label.config(text=f"Signed in: {email}")
-            try:
-                self.header_user_label.config(text=email)
-            except Exception:
-                pass
+        try:
+            self.signin_btn.config(state='disabled')
+            self.register_btn.config(state='disabled')
+        except Exception:
+            pass
+        self._set_status('Signing in...')
+        self.loader.submit('auth', lambda: self._auth_call(call, email, pw), lambda r: self._signed_in(title, r))
+
+    def _auth_call(self, call, *args):
+        # (result, None) or (None, AuthError); the loader only logs exceptions
+        try:
+            return call(*args), None
+        except AuthError as ex:
+            return None, ex
+
+    def _signed_in(self, title, result):
+        user, error = result
+        if error is not None:
             try:
-                self.signout_btn.config(state='normal')
+                self.signin_btn.config(state='normal')
+                self.register_btn.config(state='normal')
             except Exception:
                 pass
-            self.load_leaderboard_async()
-            self.load_logs_async()
-        else:
-            messagebox.showerror('Register failed', r.text)
-
-    def sign_in(self):
-        if not self.api_key:
-            messagebox.showwarning('Missing API Key','Add firebase_config.json with apiKey or set FIREBASE_API_KEY env var')
-            return
-        email = self.email_var.get()
-        pw = self.pw_var.get()
-        if not email or not pw:
-            messagebox.showerror('Error','Email and password required')
+            self._set_status('Ready')
+            messagebox.showerror(title, str(error))
             return
-        url = f'https://identitytoolkit.googleapis.com/v1/accounts:signInWithPassword?key={self.api_key}'
-        payload = {'email': email, 'password': pw, 'returnSecureToken': True}
-        r = requests.post(url, json=payload)
-        if r.status_code == 200:
-            data = r.json()
-            self.current_user = {'uid': data['localId'], 'email': email, 'idToken': data['idToken']}
-            self.user_label.config(text=f"Signed in: {email}")
+        self.current_user = user
+        email = user['email']
+        self.user_label.config(text=f"Signed in: {email}")
+        try:
+            self.header_user_label.config(text=email)
+        except Exception:
+            pass
+        try:
+            self.signout_btn.config(state='normal')
+            self.signin_btn.config(state='disabled')
+            self.register_btn.config(state='disabled')
+            self.email_entry.config(state='disabled')
+            self.pw_entry.config(state='disabled')
+            # enable profile inputs (will be filled by load_user_profile_async)
             try:
-                self.header_user_label.config(text=email)
+                self.display_name_entry.config(state='normal')
+                self.location_entry.config(state='normal')
             except Exception:
                 pass
+        except Exception:
+            pass
+        self._set_status('Ready')
+        self._schedule_token_refresh()
+        self._attach_replicas()
+        # load user profile (goal etc.)
+        self.load_user_profile_async()
+        self._seed_week()
+        self.load_leaderboard_async()
+        self.load_logs_async()
+
+    # ID tokens expire after an hour; a new one is fetched a few minutes before
+    def _schedule_token_refresh(self, delay=None):
+        if self._token_refresh_id is not None:
             try:
-                self.signout_btn.config(state='normal')
-                self.signin_btn.config(state='disabled')
-                self.register_btn.config(state='disabled')
-                self.email_entry.config(state='disabled')
-                self.pw_entry.config(state='disabled')
-                # enable profile inputs (will be filled by load_user_profile)
-                try:
-                    self.display_name_entry.config(state='normal')
-                    self.location_entry.config(state='normal')
-                except Exception:
-                    pass
+                self.after_cancel(self._token_refresh_id)
             except Exception:
                 pass
-            # load user profile (goal etc.)
-            self.load_user_profile_async()
-            self.load_leaderboard_async()
-            self.load_logs_async()
+            self._token_refresh_id = None
+        user = self.current_user
+        if user is None:
+            return
+        if delay is None:
+            delay = self.identity.refresh_in(user)
+        self._token_refresh_id = self.after(int(delay * 1000), self._refresh_token)
+
+    def _refresh_token(self):
+        self._token_refresh_id = None
+        user = self.current_user
+        if user is None:
+            return
+        self.loader.submit('auth.refresh', lambda: self._auth_call(self.identity.refresh, user),
+                           lambda r: self._token_refreshed(user['uid'], r))
+
+    def _token_refreshed(self, uid, result):
+        user, error = result
+        if self.current_user is None or self.current_user.get('uid') != uid:
+            return
+        if error is None:
+            self.current_user = user
+            self._schedule_token_refresh()
+        elif error.transient:
+            print(f'[EcoTrack] token refresh failed, retrying: {error}')
+            self._schedule_token_refresh(TOKEN_RETRY_SECONDS)
         else:
-            messagebox.showerror('Sign-in failed', r.text)
+            self.sign_out()
+            messagebox.showwarning('Signed out', str(error))
 
     def sign_out(self):
         self.current_user = None
+        self.loader.cancel('auth.refresh')
+        self._schedule_token_refresh()
+        self._stop_replicas()
         self.user_label.config(text='Not signed in')
         try:
             self.header_user_label.config(text='Not signed in')
@@ -1093,6 +1464,7 @@ class EcoTrackApp(tb.Window):
             self.location_entry.config(state='disabled')
         except Exception:
             pass
+        self._seed_week()
         self.load_leaderboard_async()
 
     # --- Leaderboard -> Profile helpers ---
@@ -1130,9 +1502,8 @@ class EcoTrackApp(tb.Window):
             goal = None
             try:
                 if uid not in ('default_user', 'Unknown'):
-                    doc = db.collection('users').document(uid).get()
-                    if doc.exists:
-                        d = doc.to_dict()
+                    d = profiles.get(store, uid)
+                    if d:
                         name = d.get('display_name') or name or ''
                         loc = d.get('location') or ''
                         goal = d.get('weekly_goal_kg')
@@ -1192,6 +1563,44 @@ class EcoTrackApp(tb.Window):
         except Exception as ex:
             messagebox.showerror('Export Leaderboard', str(ex))
 
+    def on_close(self):
+        # detach the snapshot listeners before the window goes
+        self._stop_replicas()
+        # drop queued loads so no worker calls back into a dead window
+        self.loader.shutdown()
+        # unsent writes stay on disk for the next start
+        self.journal.stop()
+        self.destroy()
+
+    # --- Startup profiling (--profile-startup [--startup-budget MS]) ---
+    def profile_startup(self, timeout_ms=30000):
+        # report phase timings once the first logs are on screen, then quit
+        self.after_idle(lambda: startup_profile.mark('window shown'))
+        self._profile_status = 0
+        started = datetime.now()
+
+        def _check():
+            done = startup_profile.elapsed_ms('first logs shown') is not None
+            waited = (datetime.now() - started).total_seconds() * 1000
+            if not done and waited < timeout_ms:
+                self.after(50, _check)
+                return
+            startup_profile.report(extra=[('storage init (background)', store.init_seconds)])
+            shown = startup_profile.elapsed_ms('window shown')
+            budget = startup_profile.budget_ms()
+            if budget is not None and (shown is None or shown > budget):
+                print(f'Startup over budget: window shown at {shown or 0:.0f} ms > {budget:.0f} ms', file=sys.stderr)
+                self._profile_status = 1
+            self.on_close()
+
+        self.after(50, _check)
+
+
 if __name__ == '__main__':
     app = EcoTrackApp()
+    startup_profile.mark('window built')
+    if startup_profile.enabled:
+        app.profile_startup()
     app.mainloop()
+    if startup_profile.enabled:
+        sys.exit(app._profile_status)
@@ -0,0 +1,88 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Process-wide cache of `users` documents. Misses are fetched from the store
+# in batches (get_all on Firestore) instead of one document read per uid,
+# entries expire after a TTL and the least recently used ones are evicted
+# past max_entries. Missing profiles are cached as {} so unknown uids don't
+# trigger a read every time.
+
+DEFAULT_TTL_SECONDS = 300
+DEFAULT_MAX_ENTRIES = 50000
+GET_ALL_BATCH = 300
+
+
+class ProfileCache:
+    def __init__(self, ttl=DEFAULT_TTL_SECONDS, max_entries=DEFAULT_MAX_ENTRIES, batch_size=GET_ALL_BATCH):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.batch_size = batch_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _lookup(self, uid, now):
+        entry = self._entries.get(uid)
+        if entry is None:
+            return None
+        expires, profile = entry
+        if expires < now:
+            del self._entries[uid]
+            return None
+        self._entries.move_to_end(uid)
+        return profile
+
+    def _store(self, uid, profile, now):
+        self._entries[uid] = (now + self.ttl, profile)
+        self._entries.move_to_end(uid)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get_many(self, store, uids):
+        # {uid: profile dict} for every uid; {} when the user has no profile
+        out = {}
+        missing = []
+        now = time.monotonic()
+        with self._lock:
+            for uid in dict.fromkeys(uids):
+                if not uid:
+                    continue
+                profile = self._lookup(uid, now)
+                if profile is None:
+                    missing.append(uid)
+                else:
+                    out[uid] = profile
+        for i in range(0, len(missing), self.batch_size):
+            chunk = missing[i:i + self.batch_size]
+            fetched = {uid: {} for uid in chunk}
+            fetched.update(store.get_profiles(chunk))
+            now = time.monotonic()
+            with self._lock:
+                for uid, profile in fetched.items():
+                    self._store(uid, profile, now)
+            out.update(fetched)
+        return out
+
+    def get(self, store, uid):
+        return self.get_many(store, [uid]).get(uid, {})
+
+    def display_names(self, store, uids):
+        return {uid: (p.get('display_name') or '') for uid, p in self.get_many(store, uids).items()}
+
+    def update(self, uid, fields):
+        # merge a local write into the cached profile (if cached) so it shows
+        # before the write reaches the store
+        with self._lock:
+            profile = self._lookup(uid, time.monotonic())
+            if profile is not None:
+                self._store(uid, {**profile, **fields}, time.monotonic())
+
+    def invalidate(self, uid=None):
+        with self._lock:
+            if uid is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(uid, None)
+
+
+profiles = ProfileCache()
@@ -0,0 +1,98 @@
+import argparse
+import sys
+import time
+
+from csv_export import Progress
+from emissions import FACTORS
+from storage import open_store
+import tracing
+
+# Rewrites co2_impact for logs whose emission factor changed:
+#
+#   python recompute_impacts.py                      # details changed in the latest factor version
+#   python recompute_impacts.py --detail "Beef Meal"
+#   python recompute_impacts.py --since-version 1 --dry-run
+#
+# Affected logs are streamed page by page; each page's impacts are computed
+# in one vectorised pass (FactorTable.impacts) and only logs whose impact or
+# factor_version differ are sent back, in batched commits
+# (LogStore.recompute_impacts), which also move the user stats and rollups by
+# the difference. Safe to re-run: logs already current are skipped.
+
+PAGE_SIZE = 400
+
+
+def stale(page, table):
+    # doc ids in `page` whose stored impact or version differs from `table`
+    if not page:
+        return []
+    impacts = table.impacts([d.get('activity_detail') for _, d in page], [d.get('amount') or 0 for _, d in page])
+    return [doc_id for (doc_id, d), co2 in zip(page, impacts.tolist())
+            if co2 != d.get('co2_impact') or d.get('factor_version') != table.version]
+
+
+def recompute(store, details, table=FACTORS, page_size=PAGE_SIZE, dry_run=False, progress=None):
+    # returns {'scanned', 'stale', 'rewritten', 'seconds'}
+    meter = Progress(progress)
+    started = time.monotonic()
+    scanned = outdated = rewritten = 0
+    page = []
+
+    def _flush():
+        nonlocal outdated, rewritten
+        ids = stale(page, table)
+        outdated += len(ids)
+        if ids and not dry_run:
+            rewritten += store.recompute_impacts(ids, table)
+        meter.tick(len(page))
+        del page[:]
+
+    for item in store.scan_details(details, page_size):
+        page.append(item)
+        scanned += 1
+        if len(page) >= page_size:
+            _flush()
+    _flush()
+    meter.tick(force=True)
+    return {'scanned': scanned, 'stale': outdated, 'rewritten': rewritten, 'seconds': time.monotonic() - started}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Recompute co2_impact for logs after an emission factor change')
+    ap.add_argument('--detail', action='append', default=[], help='activity detail to recompute (repeatable)')
+    ap.add_argument('--since-version', type=int, default=None,
+                    help='recompute every detail whose factor changed after this version')
+    ap.add_argument('--backend', default=None, help="storage backend (default: config 'backend')")
+    ap.add_argument('--db', default=None, help='SQLite file for the sqlite backend')
+    ap.add_argument('--dry-run', action='store_true', help='count the affected logs without writing')
+    tracing.add_arguments(ap)
+    args = ap.parse_args(argv)
+
+    details = list(args.detail)
+    if not details:
+        since = args.since_version if args.since_version is not None else FACTORS.version - 1
+        details = FACTORS.changed_since(since)
+    unknown = [d for d in details if d not in FACTORS.rates]
+    if unknown:
+        print(f"Unknown activity detail: {', '.join(unknown)}")
+        return 2
+    if not details:
+        print(f'No factors changed; current version is {FACTORS.version}')
+        return 0
+
+    def progress(rows, elapsed, rate):
+        print(f'\r{rows} logs scanned ({rate:,.0f} rows/s)', end='', flush=True)
+
+    print(f"Factor version {FACTORS.version}: {', '.join(details)}")
+    store = open_store(args.backend, args.db)
+    try:
+        r = recompute(store, details, dry_run=args.dry_run, progress=progress)
+    finally:
+        store.close()
+    verb = 'would rewrite' if args.dry_run else 'rewrote'
+    print(f"\nScanned {r['scanned']} logs, {verb} {r['stale'] if args.dry_run else r['rewritten']} in {r['seconds']:.1f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
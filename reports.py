@@ -0,0 +1,232 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import aggregations
+import cost
+import csv_export
+from profile_cache import GET_ALL_BATCH, profiles
+from storage import open_store
+import summary_chart
+import tracing
+
+# Headless reports for cron jobs and scripts, built from the same
+# aggregation code the apps use; imports neither Tk nor Flet:
+#
+#   python reports.py leaderboard --out reports/          # leaderboard.json, leaderboard.csv
+#   python reports.py summary --months 60 --out reports/  # summary.json, summary.png
+#   python reports.py summary --per-user --out reports/   # ... and summary_users.ndjson
+#   python reports.py export --out reports/ --per-user    # logs.csv, or one CSV per user in logs/
+#   python reports.py all --out reports/$(date +%F)       # all three, concurrently
+#
+# Store reads go through a small thread pool: `all` runs its jobs side by
+# side, display names are fetched in parallel get_all batches, and per-user
+# summaries keep at most a few rollup reads in flight. Logs and per-user
+# rows are streamed to disk, so memory grows with the number of users, not
+# the number of logs. JSON and PNG files are written to a temporary name and
+# renamed, so a reader never sees a half-written report.
+
+DEFAULT_WORKERS = 8
+JOBS = ('leaderboard', 'summary', 'export')
+
+
+def _replace(path, write):
+    tmp = path + '.tmp'
+    write(tmp)
+    os.replace(tmp, path)
+
+
+def _write_json(path, data):
+    def write(tmp):
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, default=str)
+    _replace(path, write)
+
+
+def _imap(pool, fn, items, ahead):
+    # pool.map with at most `ahead` calls queued, results in input order
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(fn, item))
+        if len(pending) >= ahead:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def _prefetch_names(store, uids, pool):
+    # warm the profile cache with parallel get_all batches, so
+    # leaderboard_rows then resolves every name without a read
+    uids = list(uids)
+    chunks = [uids[i:i + GET_ALL_BATCH] for i in range(0, len(uids), GET_ALL_BATCH)]
+    op = cost.current()
+
+    def fetch(chunk):
+        # the pool threads book their reads to the caller's operation
+        with cost.attach(op):
+            profiles.get_many(store, chunk)
+
+    for _ in pool.map(fetch, chunks):
+        pass
+
+
+def leaderboard(store, out, pool, top=None):
+    # community ranking; returns the number of users written
+    with cost.operation('report.leaderboard'):
+        totals, community = aggregations.leaderboard_totals(store)
+        _prefetch_names(store, [uid for uid in totals if uid != 'default_user'], pool)
+        rows = aggregations.leaderboard_rows(store, totals)
+    rows.sort(key=lambda r: r[2], reverse=True)
+    if top:
+        rows = rows[:top]
+    ranked = [{'rank': i, 'uid': uid, 'display_name': name, 'kg_co2': round(kg, 2)}
+              for i, (uid, name, kg) in enumerate(rows, 1)]
+
+    def write_csv(tmp):
+        with open(tmp, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=['rank', 'uid', 'display_name', 'kg_co2'])
+            writer.writeheader()
+            writer.writerows(ranked)
+
+    _write_json(os.path.join(out, 'leaderboard.json'), {
+        'generated_at': datetime.now().isoformat(timespec='seconds'),
+        'community_total_kg': round(community, 2),
+        'users': len(totals),
+        'rows': ranked,
+    })
+    _replace(os.path.join(out, 'leaderboard.csv'), write_csv)
+    return len(ranked)
+
+
+def summary(store, out, pool, months=12, per_user=False, png=True, workers=DEFAULT_WORKERS):
+    # community monthly totals (and optionally every user's); returns the
+    # number of per-user rows written
+    now = datetime.now()
+    with cost.operation('report.summary'):
+        totals = aggregations.monthly_totals(store)
+    prepared = summary_chart.prepare(totals, now, months)
+    labels, _, values, _ = prepared
+    _write_json(os.path.join(out, 'summary.json'), {
+        'generated_at': now.isoformat(timespec='seconds'),
+        'months': dict(zip(labels, values)),
+        'total_kg': round(sum(values), 2),
+    })
+    if png:
+        _replace(os.path.join(out, 'summary.png'),
+                 lambda tmp: summary_chart.save_png(prepared, tmp, 'Community CO2 per month'))
+    if not per_user:
+        return 0
+
+    def user_months(uid):
+        with cost.operation('report.summary.user'):
+            kg = store.monthly_totals(uid)
+        return uid, {m: round(kg.get(m, 0), 2) for m in labels}
+
+    with cost.operation('report.summary'):
+        uids = sorted(store.user_totals())
+    n = 0
+
+    def write_ndjson(tmp):
+        nonlocal n
+        with open(tmp, 'w', encoding='utf-8') as f:
+            for uid, by_month in _imap(pool, user_months, uids, 2 * workers):
+                f.write(json.dumps({'user_id': uid, 'months': by_month, 'total_kg': round(sum(by_month.values()), 2)}))
+                f.write('\n')
+                n += 1
+
+    _replace(os.path.join(out, 'summary_users.ndjson'), write_ndjson)
+    return n
+
+
+def export(store, out, per_user=False, progress=None):
+    # every log as CSV, streamed page by page; returns the number of rows
+    with cost.operation('report.export'):
+        if per_user:
+            folder = os.path.join(out, 'logs')
+            os.makedirs(folder, exist_ok=True)
+            rows, _ = csv_export.export_per_user(store, folder, progress=progress)
+            return rows
+        path = os.path.join(out, 'logs.csv')
+        rows = [0]
+
+        def write(tmp):
+            rows[0] = csv_export.export_single(store, tmp, progress=progress)
+
+        _replace(path, write)
+        return rows[0]
+
+
+def run(store, jobs, out, workers=DEFAULT_WORKERS, months=12, per_user=False, top=None, png=True, progress=None):
+    # runs `jobs` side by side; returns {job: count} and the elapsed seconds
+    os.makedirs(out, exist_ok=True)
+    started = time.monotonic()
+    # jobs get their own threads so a long export never starves the
+    # reads that leaderboard and summary hand to the pool
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='report') as pool, \
+            ThreadPoolExecutor(max_workers=len(jobs), thread_name_prefix='report-job') as runner:
+        calls = {
+            'leaderboard': lambda: leaderboard(store, out, pool, top),
+            'summary': lambda: summary(store, out, pool, months, per_user, png, workers),
+            'export': lambda: export(store, out, per_user, progress),
+        }
+        futures = {job: runner.submit(calls[job]) for job in jobs}
+        results = {job: fut.result() for job, fut in futures.items()}
+    return results, time.monotonic() - started
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Write EcoTrack leaderboard, summary and export reports without the UI')
+    ap.add_argument('job', choices=JOBS + ('all',), help='report to produce')
+    ap.add_argument('--out', default='.', help='output folder (created if missing)')
+    ap.add_argument('--months', default='12', help="summary range in months, or 'all' (default 12)")
+    ap.add_argument('--per-user', action='store_true',
+                    help='summary: also write every user\'s months; export: one CSV per user')
+    ap.add_argument('--top', type=int, default=None, help='leaderboard: keep only the first N users')
+    ap.add_argument('--no-png', action='store_true', help='summary: skip the chart')
+    ap.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='parallel store reads')
+    ap.add_argument('--backend', default=None, help="storage backend (default: config 'backend')")
+    ap.add_argument('--db', default=None, help='SQLite file for the sqlite backend')
+    tracing.add_arguments(ap)
+    cost.add_arguments(ap)
+    args = ap.parse_args(argv)
+
+    if args.months == 'all':
+        months = None
+    else:
+        try:
+            months = max(int(args.months), 1)
+        except ValueError:
+            ap.error(f'--months: expected a number or "all", got {args.months!r}')
+    jobs = JOBS if args.job == 'all' else (args.job,)
+
+    def progress(rows, elapsed, rate):
+        print(f'\r{rows} logs exported ({rate:,.0f} rows/s)', end='', file=sys.stderr, flush=True)
+
+    # progress only on a terminal, so cron mail stays short
+    show = 'export' in jobs and sys.stderr.isatty()
+    store = open_store(args.backend, args.db)
+    try:
+        results, seconds = run(store, jobs, args.out, max(args.workers, 1), months, args.per_user,
+                               args.top, not args.no_png, progress if show else None)
+    finally:
+        store.close()
+    if show:
+        print(file=sys.stderr)
+    if 'leaderboard' in results:
+        print(f"Leaderboard: {results['leaderboard']} users")
+    if 'summary' in results:
+        print('Summary written' + (f" ({results['summary']} users)" if args.per_user else ''))
+    if 'export' in results:
+        print(f"Export: {results['export']} logs")
+    print(f'Reports in {os.path.abspath(args.out)} ({seconds:.1f}s)')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
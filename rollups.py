@@ -0,0 +1,185 @@
+import random
+import sys
+from datetime import datetime
+
+import cost
+from columnar import LogColumns
+import tracing
+
+# Daily and monthly CO2 rollups, per user and community-wide.
+#
+#   rollups/{scope}               {'scope', 'months': {'YYYY-MM': kg}}
+#   rollups_daily/{scope}_{YYYY}  {'scope', 'year', 'days': {'MM-DD': kg}}
+#
+# Monthly values are the sums of the daily ones; both are bumped in the same
+# transaction as the log write, so any chart range costs one read per scope.
+# The community scope is split over GLOBAL_SHARDS documents to stay under
+# Firestore's per-document write rate; readers sum the shards.
+
+MONTHLY_COLLECTION = 'rollups'
+DAILY_COLLECTION = 'rollups_daily'
+GLOBAL_SCOPE = '_all'
+GLOBAL_SHARDS = 10
+BATCH_SIZE = 500
+
+
+def local_dt(ts):
+    if ts is None:
+        return None
+    if getattr(ts, 'tzinfo', None) is not None:
+        return ts.astimezone()
+    return ts
+
+
+def bucket(ts):
+    # (YYYY, 'MM-DD', 'YYYY-MM') in local time, or None without a timestamp
+    dt = local_dt(ts)
+    if not hasattr(dt, 'strftime'):
+        return None
+    return dt.strftime('%Y'), dt.strftime('%m-%d'), dt.strftime('%Y-%m')
+
+
+def global_shards():
+    return [f'{GLOBAL_SCOPE}.{i}' for i in range(GLOBAL_SHARDS)]
+
+
+def _deltas(db, scope, doc_scope, ts, kg):
+    from firebase_admin import firestore
+    b = bucket(ts)
+    if b is None or not kg:
+        return []
+    year, day, month = b
+    return [
+        (db.collection(MONTHLY_COLLECTION).document(doc_scope),
+         {'scope': scope, 'months': {month: firestore.Increment(kg)}}),
+        (db.collection(DAILY_COLLECTION).document(f'{doc_scope}_{year}'),
+         {'scope': scope, 'year': int(year), 'days': {day: firestore.Increment(kg)}}),
+    ]
+
+
+def rollup_writes(db, uid, ts, kg):
+    # (ref, merge payload) pairs applying kg to the user's and a global shard's buckets
+    uid = uid or 'Unknown'
+    shard = f'{GLOBAL_SCOPE}.{random.randrange(GLOBAL_SHARDS)}'
+    return _deltas(db, uid, uid, ts, kg) + _deltas(db, GLOBAL_SCOPE, shard, ts, kg)
+
+
+def apply(txn, db, uid, ts, kg):
+    # txn may also be a WriteBatch; returns the number of writes added
+    writes = rollup_writes(db, uid, ts, kg)
+    for ref, payload in writes:
+        txn.set(ref, payload, merge=True)
+    return len(writes)
+
+
+def monthly_totals(db, uid=None):
+    # {'YYYY-MM': kg} for one user, or the community when uid is None
+    scopes = [uid] if uid else global_shards()
+    refs = [db.collection(MONTHLY_COLLECTION).document(s) for s in scopes]
+    totals = {}
+    with tracing.span('firestore.monthly_totals', 'store') as sp:
+        snaps = list(db.get_all(refs))
+        sp.add(docs=len(snaps))
+    cost.record(reads=len(refs))
+    for snap in snaps:
+        if not snap.exists:
+            continue
+        for month, kg in ((snap.to_dict() or {}).get('months') or {}).items():
+            totals[month] = totals.get(month, 0) + (kg or 0)
+    return totals
+
+
+def daily_totals(db, years, uid=None):
+    # {'YYYY-MM-DD': kg} for the given years
+    scopes = [uid] if uid else global_shards()
+    refs = [db.collection(DAILY_COLLECTION).document(f'{s}_{y}') for s in scopes for y in years]
+    totals = {}
+    with tracing.span('firestore.daily_totals', 'store') as sp:
+        snaps = list(db.get_all(refs))
+        sp.add(docs=len(snaps))
+    cost.record(reads=len(refs))
+    for snap in snaps:
+        if not snap.exists:
+            continue
+        d = snap.to_dict() or {}
+        year = d.get('year')
+        for day, kg in (d.get('days') or {}).items():
+            key = f'{year}-{day}'
+            totals[key] = totals.get(key, 0) + (kg or 0)
+    return totals
+
+
+def rebuild_rollups(db):
+    # recompute every rollup from the raw logs; the community totals land in
+    # shard 0 and the remaining shards are cleared
+    cols = LogColumns.from_logs((doc.id, doc.to_dict() or {}) for doc in db.collection('logs').stream())
+    per_scope = cols.sum_by_day(by_user=True)
+    per_scope[f'{GLOBAL_SCOPE}.0'] = cols.sum_by_day()
+    daily = {}
+    for scope, days in per_scope.items():
+        for key, kg in days.items():
+            daily.setdefault((scope, key[:4]), {})[key[5:]] = kg
+
+    monthly = {}
+    for (scope, year), days in daily.items():
+        months = monthly.setdefault(scope, {})
+        for day, kg in days.items():
+            key = f'{year}-{day[:2]}'
+            months[key] = months.get(key, 0) + kg
+
+    writes = []
+    for (scope, year), days in daily.items():
+        base = GLOBAL_SCOPE if scope.startswith(GLOBAL_SCOPE + '.') else scope
+        writes.append((db.collection(DAILY_COLLECTION).document(f'{scope}_{year}'),
+                       {'scope': base, 'year': int(year), 'days': days}))
+    for scope, months in monthly.items():
+        base = GLOBAL_SCOPE if scope.startswith(GLOBAL_SCOPE + '.') else scope
+        writes.append((db.collection(MONTHLY_COLLECTION).document(scope), {'scope': base, 'months': months}))
+    keep_daily = {f'{scope}_{year}' for scope, year in daily}
+    keep_monthly = set(monthly)
+
+    batch = db.batch()
+    pending = 0
+    for ref, payload in writes:
+        batch.set(ref, payload)
+        pending += 1
+        if pending >= BATCH_SIZE:
+            batch.commit()
+            batch = db.batch()
+            pending = 0
+    for name, keep in ((DAILY_COLLECTION, keep_daily), (MONTHLY_COLLECTION, keep_monthly)):
+        for doc in db.collection(name).stream():
+            if doc.id not in keep:
+                batch.delete(doc.reference)
+                pending += 1
+                if pending >= BATCH_SIZE:
+                    batch.commit()
+                    batch = db.batch()
+                    pending = 0
+    if pending:
+        batch.commit()
+    return len(monthly)
+
+
+def month_keys(now=None, months=12):
+    # the last `months` calendar months as 'YYYY-MM', oldest first
+    now = now or datetime.now()
+    y, m = now.year, now.month
+    keys = []
+    for _ in range(months):
+        keys.append(f'{y:04d}-{m:02d}')
+        m -= 1
+        if m == 0:
+            y, m = y - 1, 12
+    keys.reverse()
+    return keys
+
+
+if __name__ == '__main__':
+    if '--rebuild' not in sys.argv[1:]:
+        print('usage: python rollups.py --rebuild')
+        sys.exit(2)
+    from storage import open_store
+    store = open_store()
+    n = store.rebuild_rollups()
+    print(f'Rebuilt rollups ({store.name}) for {n} scopes')
@@ -0,0 +1,47 @@
+import sys
+import time
+
+# Phase timings for `--profile-startup`. The clock starts when this module
+# is first imported, so import it before anything heavy.
+
+STARTED = time.perf_counter()
+enabled = '--profile-startup' in sys.argv[1:]
+_marks = []
+
+
+def mark(phase):
+    # record the time `phase` finished (first time only)
+    if not any(p == phase for p, _ in _marks):
+        _marks.append((phase, time.perf_counter()))
+
+
+def elapsed_ms(phase):
+    for p, t in _marks:
+        if p == phase:
+            return (t - STARTED) * 1000
+    return None
+
+
+def report(extra=(), out=None):
+    # per-phase and cumulative wall time; extra is (label, seconds) pairs
+    # for work that ran off the main thread
+    out = out or sys.stderr
+    prev = STARTED
+    print(f"{'phase':<28}{'+ms':>10}{'at ms':>10}", file=out)
+    for phase, t in _marks:
+        print(f'{phase:<28}{(t - prev) * 1000:>10.1f}{(t - STARTED) * 1000:>10.1f}', file=out)
+        prev = t
+    for label, seconds in extra:
+        if seconds is not None:
+            print(f'{label:<28}{seconds * 1000:>10.1f}{"":>10}', file=out)
+
+
+def budget_ms(default=None):
+    # --startup-budget MS: fail the profile run if the window took longer
+    args = sys.argv[1:]
+    if '--startup-budget' in args:
+        try:
+            return float(args[args.index('--startup-budget') + 1])
+        except (IndexError, ValueError):
+            pass
+    return default
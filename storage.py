@@ -0,0 +1,948 @@
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+import config
+import cost
+import rollups
+from columnar import LogColumns
+import tracing
+import user_stats
+
+# Storage backends behind the operations the apps use. FirestoreStore talks
+# to the live project; SqliteStore keeps the same data in a local SQLite file
+# (or ':memory:') so the apps, load tests and benchmarks can run offline.
+#
+# Logs are exchanged as (doc_id, dict) pairs using the Firestore field names;
+# 'timestamp' is always a datetime.
+
+LOG_FIELDS = ('activity_type', 'activity_detail', 'amount', 'description', 'co2_impact', 'timestamp', 'user_id',
+              'factor_version')
+
+# most writes one journal entry adds to a WriteBatch (log, stats, 4 rollups)
+BATCH_WRITES_PER_ENTRY = 6
+
+
+class LogStore:
+    name = 'base'
+
+    def add_log(self, data, doc_id=None):
+        raise NotImplementedError
+
+    def add_logs(self, items):
+        # bulk insert of (doc_id or None, data) pairs; returns the count
+        n = 0
+        for doc_id, data in items:
+            self.add_log(data, doc_id)
+            n += 1
+        return n
+
+    def apply_writes(self, entries, on_commit=None):
+        # replay write-journal entries ({'key', 'op', 'doc_id', 'payload'})
+        # in order; on_commit(keys) runs as each group lands. Every op is
+        # idempotent, so entries may be replayed after a failure.
+        for entry in entries:
+            self._apply_entry(entry)
+            if on_commit is not None:
+                on_commit([entry['key']])
+
+    def _apply_entry(self, entry):
+        op, doc_id, payload = entry['op'], entry['doc_id'], entry['payload']
+        if op == 'add_log':
+            if self.get_log(doc_id) is None:
+                self.add_log(payload, doc_id)
+        elif op == 'update_log':
+            try:
+                self.update_log(doc_id, payload)
+            except KeyError:
+                # deleted since; nothing left to update
+                pass
+        elif op == 'delete_log':
+            self.delete_log(doc_id)
+        elif op == 'set_profile':
+            self.set_profile(doc_id, payload)
+        else:
+            raise ValueError(f'Unknown journal op: {op}')
+
+    def update_log(self, doc_id, data):
+        raise NotImplementedError
+
+    def delete_log(self, doc_id):
+        raise NotImplementedError
+
+    def get_log(self, doc_id):
+        raise NotImplementedError
+
+    def query_logs(self, user_id=None, since=None, until=None, order=None, limit=None):
+        # order: None (unordered), 'asc' or 'desc' by timestamp
+        raise NotImplementedError
+
+    def page_logs(self, user_id=None, order='desc', limit=500, cursor=None):
+        # one keyset page ordered by (timestamp, doc id): returns
+        # ([(doc_id, data), ...], next_cursor); next_cursor is None at the end
+        raise NotImplementedError
+
+    def scan_logs(self, user_id=None, order='desc', page_size=1000):
+        # every matching log, fetched page by page
+        cursor = None
+        while True:
+            page, cursor = self.page_logs(user_id=user_id, order=order, limit=page_size, cursor=cursor)
+            yield from page
+            if cursor is None:
+                return
+
+    def scan_details(self, details, page_size=500):
+        # every log whose activity_detail is one of `details`, in doc id order
+        raise NotImplementedError
+
+    def recompute_impacts(self, doc_ids, table):
+        # recompute co2_impact of these logs from their detail and amount with
+        # emissions.FactorTable `table`, stamping table.version; stats and
+        # rollups follow. Returns the number of logs rewritten
+        n = 0
+        for doc_id in doc_ids:
+            d = self.get_log(doc_id)
+            if d is None:
+                continue
+            co2 = table.impact(d.get('activity_detail'), d.get('amount') or 0)
+            if co2 != d.get('co2_impact') or d.get('factor_version') != table.version:
+                self.update_log(doc_id, {'co2_impact': co2, 'factor_version': table.version})
+                n += 1
+        return n
+
+    def log_columns(self, user_id=None, since=None, until=None):
+        # the matching logs decoded into a columnar.LogColumns
+        return LogColumns.from_logs(self.query_logs(user_id=user_id, since=since, until=until))
+
+    def get_profiles(self, uids):
+        # {uid: profile dict} for the uids that have a profile
+        raise NotImplementedError
+
+    def get_profile(self, uid):
+        return self.get_profiles([uid]).get(uid, {})
+
+    def set_profile(self, uid, fields):
+        # merge fields into the user's profile
+        raise NotImplementedError
+
+    def user_totals(self):
+        raise NotImplementedError
+
+    def rebuild_user_stats(self):
+        raise NotImplementedError
+
+    def monthly_totals(self, user_id=None):
+        # {'YYYY-MM': kg} from the rollups; community-wide when user_id is None
+        raise NotImplementedError
+
+    def daily_totals(self, since, user_id=None):
+        # {'YYYY-MM-DD': kg} from the rollups for days on or after `since`
+        raise NotImplementedError
+
+    def rebuild_rollups(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class FirestoreStore(LogStore):
+    name = 'firestore'
+
+    def __init__(self, db):
+        self.db = db
+
+    def add_log(self, data, doc_id=None):
+        return user_stats.add_log(self.db, data, doc_id)
+
+    def update_log(self, doc_id, data):
+        user_stats.update_log(self.db, doc_id, data)
+
+    def delete_log(self, doc_id):
+        user_stats.delete_log(self.db, doc_id)
+
+    def get_log(self, doc_id):
+        with tracing.span('firestore.get_log', 'store') as sp:
+            snap = self.db.collection('logs').document(doc_id).get()
+            sp.add(docs=1)
+        cost.record(reads=1)
+        return snap.to_dict() if snap.exists else None
+
+    def add_logs(self, items):
+        # WriteBatches rather than a transaction per log; logs that already
+        # exist are skipped, so a chunk may be written again after a failure
+        entries = []
+        for doc_id, data in items:
+            doc_id = doc_id or self.db.collection('logs').document().id
+            entries.append({'key': doc_id, 'op': 'add_log', 'doc_id': doc_id, 'payload': data})
+        self.apply_writes(entries)
+        return len(entries)
+
+    def apply_writes(self, entries, on_commit=None):
+        # adds and profile writes go out in WriteBatches of up to
+        # BATCH_SIZE writes; edits and deletes read the old log, so they run
+        # in their own transactions, in journal order
+        from firebase_admin import firestore
+        from google.api_core.exceptions import Conflict
+        group = []
+        batch = self.db.batch()
+        writes = 0
+
+        def _commit():
+            nonlocal batch, writes
+            if not group:
+                return
+            try:
+                batch.commit()
+                # len(batch) counts distinct documents, not writes
+                cost.record(writes=writes)
+            except Conflict:
+                # a log in this batch already exists (an earlier flush landed
+                # but its reply was lost); replay the group one by one
+                for entry in group:
+                    self._apply_entry(entry)
+            if on_commit is not None:
+                on_commit([e['key'] for e in group])
+            del group[:]
+            batch = self.db.batch()
+            writes = 0
+
+        for entry in entries:
+            op = entry['op']
+            if op not in ('add_log', 'set_profile'):
+                _commit()
+                self._apply_entry(entry)
+                if on_commit is not None:
+                    on_commit([entry['key']])
+                continue
+            if writes + BATCH_WRITES_PER_ENTRY > user_stats.BATCH_SIZE:
+                _commit()
+            if op == 'add_log':
+                writes += user_stats.batch_add_log(batch, self.db, entry['doc_id'], entry['payload'])
+            else:
+                batch.set(self.db.collection('users').document(entry['doc_id']),
+                          dict(entry['payload'], updated_at=firestore.SERVER_TIMESTAMP), merge=True)
+                writes += 1
+            group.append(entry)
+        _commit()
+
+    def _logs_query(self, user_id=None, since=None, until=None, order=None, limit=None):
+        from firebase_admin import firestore
+        q = self.db.collection('logs')
+        if user_id:
+            q = q.where('user_id', '==', user_id)
+        if since is not None:
+            q = q.where('timestamp', '>=', since)
+        if until is not None:
+            q = q.where('timestamp', '<', until)
+        if order:
+            direction = firestore.Query.DESCENDING if order == 'desc' else firestore.Query.ASCENDING
+            q = q.order_by('timestamp', direction=direction)
+        if limit:
+            q = q.limit(limit)
+        return q
+
+    def query_logs(self, user_id=None, since=None, until=None, order=None, limit=None):
+        # the span covers the whole stream, including time the consumer holds it
+        with tracing.span('firestore.query_logs', 'store', limit=limit) as sp:
+            n = 0
+            for doc in self._logs_query(user_id, since, until, order, limit).stream():
+                d = doc.to_dict() or {}
+                if sp:
+                    sp.add(docs=1, nbytes=tracing.size_of(d))
+                cost.record(reads=1)
+                n += 1
+                yield doc.id, d
+            if not n:
+                # an empty query is still billed one read
+                cost.record(reads=1)
+
+    def page_logs(self, user_id=None, order='desc', limit=500, cursor=None):
+        from firebase_admin import firestore
+        direction = firestore.Query.DESCENDING if order == 'desc' else firestore.Query.ASCENDING
+        q = self._logs_query(user_id, order=order).order_by('__name__', direction=direction)
+        if cursor is not None:
+            # cursor is the last DocumentSnapshot of the previous page
+            q = q.start_after(cursor)
+        with tracing.span('firestore.page_logs', 'store', limit=limit) as sp:
+            snaps = list(q.limit(limit).stream())
+            page = [(s.id, s.to_dict() or {}) for s in snaps]
+            if sp:
+                sp.add(docs=len(page), nbytes=tracing.size_of(page))
+        cost.record(reads=max(len(snaps), 1))
+        return page, (snaps[-1] if len(snaps) == limit else None)
+
+    def scan_details(self, details, page_size=500):
+        # 'in' takes at most 30 values; equality on one field ordered by
+        # document id needs no composite index
+        details = list(details)
+        for i in range(0, len(details), 30):
+            q = self.db.collection('logs').where('activity_detail', 'in', details[i:i + 30]).order_by('__name__')
+            last = None
+            while True:
+                with tracing.span('firestore.scan_details', 'store') as sp:
+                    snaps = list((q.start_after(last) if last is not None else q).limit(page_size).stream())
+                    sp.add(docs=len(snaps))
+                cost.record(reads=max(len(snaps), 1))
+                for s in snaps:
+                    yield s.id, s.to_dict() or {}
+                if len(snaps) < page_size:
+                    break
+                last = snaps[-1]
+
+    def recompute_impacts(self, doc_ids, table):
+        # one transaction per chunk of logs that fits a 500-write commit
+        doc_ids = list(doc_ids)
+        step = user_stats.BATCH_SIZE // BATCH_WRITES_PER_ENTRY
+        return sum(user_stats.recompute_impacts(self.db, doc_ids[i:i + step], table)
+                   for i in range(0, len(doc_ids), step))
+
+    def get_profiles(self, uids):
+        users = self.db.collection('users')
+        refs = [users.document(uid) for uid in uids]
+        out = {}
+        cost.record(reads=len(refs))
+        with tracing.span('firestore.get_profiles', 'store') as sp:
+            for snap in self.db.get_all(refs):
+                sp.add(docs=1)
+                if snap.exists:
+                    out[snap.id] = snap.to_dict() or {}
+            if sp:
+                sp.add(nbytes=tracing.size_of(out))
+        return out
+
+    def set_profile(self, uid, fields):
+        from firebase_admin import firestore
+        self.db.collection('users').document(uid).set(dict(fields, updated_at=firestore.SERVER_TIMESTAMP), merge=True)
+        cost.record(writes=1)
+
+    # incremental sync: documents written at or after `since` (everything
+    # when None); writes stamp updated_at and deletes leave a tombstone
+    def _changed(self, collection, field, since):
+        q = self.db.collection(collection)
+        if since is not None:
+            q = q.where(field, '>=', since)
+        with tracing.span(f'firestore.changed.{collection}', 'store') as sp:
+            n = 0
+            for doc in q.stream():
+                d = doc.to_dict() or {}
+                if sp:
+                    sp.add(docs=1, nbytes=tracing.size_of(d))
+                cost.record(reads=1)
+                n += 1
+                yield doc.id, d
+            if not n:
+                cost.record(reads=1)
+
+    def changed_logs(self, since=None):
+        return self._changed('logs', 'updated_at', since)
+
+    def deleted_logs(self, since=None):
+        return self._changed(user_stats.TOMBSTONE_COLLECTION, 'deleted_at', since)
+
+    def changed_profiles(self, since=None):
+        return self._changed('users', 'updated_at', since)
+
+    def user_totals(self):
+        return user_stats.load_user_totals(self.db)
+
+    def rebuild_user_stats(self):
+        return user_stats.rebuild_user_stats(self.db)
+
+    def monthly_totals(self, user_id=None):
+        return rollups.monthly_totals(self.db, user_id)
+
+    def daily_totals(self, since, user_id=None):
+        years = range(since.year, datetime.now().year + 1)
+        first = since.strftime('%Y-%m-%d')
+        return {k: v for k, v in rollups.daily_totals(self.db, years, user_id).items() if k >= first}
+
+    def rebuild_rollups(self):
+        return rollups.rebuild_rollups(self.db)
+
+
+def _to_epoch(ts):
+    if ts is None:
+        return None
+    if hasattr(ts, 'timestamp'):
+        return ts.timestamp()
+    return float(ts)
+
+
+class SqliteStore(LogStore):
+    name = 'sqlite'
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS logs (
+            id TEXT PRIMARY KEY,
+            user_id TEXT,
+            timestamp REAL,
+            activity_type TEXT,
+            activity_detail TEXT,
+            amount REAL,
+            description TEXT,
+            co2_impact REAL,
+            factor_version INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS logs_timestamp ON logs (timestamp);
+        CREATE INDEX IF NOT EXISTS logs_user_timestamp ON logs (user_id, timestamp);
+        CREATE TABLE IF NOT EXISTS users (
+            uid TEXT PRIMARY KEY,
+            profile TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS user_stats (
+            user_id TEXT PRIMARY KEY,
+            total_kg REAL NOT NULL DEFAULT 0,
+            log_count INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS rollups_daily (
+            scope TEXT NOT NULL,
+            day TEXT NOT NULL,
+            kg REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (scope, day)
+        );
+    '''
+
+    def __init__(self, path=':memory:'):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self._lock = threading.RLock()
+        with self._lock:
+            if path != ':memory:':
+                self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.executescript(self.SCHEMA)
+            columns = {r['name'] for r in self.conn.execute('PRAGMA table_info(logs)')}
+            if 'factor_version' not in columns:
+                # files created before factor versions were recorded
+                self.conn.execute('ALTER TABLE logs ADD COLUMN factor_version INTEGER')
+
+    def _row(self, row):
+        d = {k: row[k] for k in LOG_FIELDS if k != 'timestamp'}
+        ts = row['timestamp']
+        d['timestamp'] = datetime.fromtimestamp(ts) if ts is not None else None
+        return row['id'], d
+
+    def _bump_stats(self, uid, kg, count):
+        self.conn.execute(
+            'INSERT INTO user_stats (user_id, total_kg, log_count) VALUES (?, ?, ?) '
+            'ON CONFLICT(user_id) DO UPDATE SET total_kg = total_kg + excluded.total_kg, '
+            'log_count = log_count + excluded.log_count',
+            (uid or 'Unknown', kg, count))
+
+    def _bump_rollups(self, uid, ts, kg):
+        b = rollups.bucket(ts)
+        if b is None or not kg:
+            return
+        day = f'{b[0]}-{b[1]}'
+        for scope in (uid or 'Unknown', rollups.GLOBAL_SCOPE):
+            self.conn.execute(
+                'INSERT INTO rollups_daily (scope, day, kg) VALUES (?, ?, ?) '
+                'ON CONFLICT(scope, day) DO UPDATE SET kg = kg + excluded.kg',
+                (scope, day, kg))
+
+    def add_log(self, data, doc_id=None):
+        doc_id = doc_id or uuid.uuid4().hex[:20]
+        uid = data.get('user_id', 'Unknown')
+        with self._lock, self.conn:
+            self.conn.execute(
+                'INSERT INTO logs (id, user_id, timestamp, activity_type, activity_detail, amount, description, co2_impact, '
+                'factor_version) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (doc_id, uid, _to_epoch(data.get('timestamp')), data.get('activity_type'), data.get('activity_detail'),
+                 data.get('amount'), data.get('description'), data.get('co2_impact'), data.get('factor_version')))
+            self._bump_stats(uid, user_stats.log_impact(data), 1)
+            self._bump_rollups(uid, data.get('timestamp'), user_stats.log_impact(data))
+        return doc_id
+
+    def add_logs(self, items, chunk_size=10000):
+        n = 0
+        chunk = []
+        for doc_id, data in items:
+            chunk.append((doc_id or uuid.uuid4().hex[:20], data))
+            if len(chunk) >= chunk_size:
+                n += self._insert_chunk(chunk)
+                chunk = []
+        if chunk:
+            n += self._insert_chunk(chunk)
+        return n
+
+    def _insert_chunk(self, chunk):
+        with self._lock, self.conn:
+            return self._insert_rows(chunk)
+
+    def _insert_rows(self, chunk):
+        deltas = {}
+        days = {}
+        rows = []
+        for doc_id, data in chunk:
+            uid = data.get('user_id', 'Unknown') or 'Unknown'
+            impact = user_stats.log_impact(data)
+            kg, count = deltas.get(uid, (0.0, 0))
+            deltas[uid] = (kg + impact, count + 1)
+            b = rollups.bucket(data.get('timestamp'))
+            if b is not None:
+                day = f'{b[0]}-{b[1]}'
+                for scope in (uid, rollups.GLOBAL_SCOPE):
+                    days[(scope, day)] = days.get((scope, day), 0) + impact
+            rows.append((doc_id, uid, _to_epoch(data.get('timestamp')), data.get('activity_type'),
+                         data.get('activity_detail'), data.get('amount'), data.get('description'), data.get('co2_impact'),
+                         data.get('factor_version')))
+        self.conn.executemany(
+            'INSERT INTO logs (id, user_id, timestamp, activity_type, activity_detail, amount, description, co2_impact, '
+            'factor_version) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        for uid, (kg, count) in deltas.items():
+            self._bump_stats(uid, kg, count)
+        self.conn.executemany(
+            'INSERT INTO rollups_daily (scope, day, kg) VALUES (?, ?, ?) '
+            'ON CONFLICT(scope, day) DO UPDATE SET kg = kg + excluded.kg',
+            [(scope, day, kg) for (scope, day), kg in days.items()])
+        return len(rows)
+
+    def put_logs(self, items, chunk_size=2000):
+        # insert or overwrite logs under known ids (cache sync); returns the count
+        n = 0
+        chunk = {}
+        for doc_id, data in items:
+            chunk[doc_id] = data
+            if len(chunk) >= chunk_size:
+                n += self._put_chunk(chunk)
+                chunk = {}
+        if chunk:
+            n += self._put_chunk(chunk)
+        return n
+
+    def _put_chunk(self, chunk):
+        with self._lock, self.conn:
+            for doc_id in chunk:
+                self._delete_row(doc_id)
+            return self._insert_rows(list(chunk.items()))
+
+    def delete_logs(self, doc_ids):
+        with self._lock, self.conn:
+            return sum(self._delete_row(doc_id) for doc_id in doc_ids)
+
+    def update_log(self, doc_id, data):
+        with self._lock, self.conn:
+            row = self.conn.execute('SELECT * FROM logs WHERE id = ?', (doc_id,)).fetchone()
+            if row is None:
+                raise KeyError(doc_id)
+            _, old = self._row(row)
+            new = dict(old)
+            new.update({k: v for k, v in data.items() if k in LOG_FIELDS})
+            self.conn.execute(
+                'UPDATE logs SET user_id = ?, timestamp = ?, activity_type = ?, activity_detail = ?, '
+                'amount = ?, description = ?, co2_impact = ?, factor_version = ? WHERE id = ?',
+                (new.get('user_id'), _to_epoch(new.get('timestamp')), new.get('activity_type'), new.get('activity_detail'),
+                 new.get('amount'), new.get('description'), new.get('co2_impact'), new.get('factor_version'), doc_id))
+            delta = user_stats.log_impact(new) - user_stats.log_impact(old)
+            if delta:
+                self._bump_stats(old.get('user_id'), delta, 0)
+            self._bump_rollups(old.get('user_id'), old.get('timestamp'), -user_stats.log_impact(old))
+            self._bump_rollups(old.get('user_id'), new.get('timestamp'), user_stats.log_impact(new))
+
+    def delete_log(self, doc_id):
+        with self._lock, self.conn:
+            self._delete_row(doc_id)
+
+    def _delete_row(self, doc_id):
+        row = self.conn.execute('SELECT * FROM logs WHERE id = ?', (doc_id,)).fetchone()
+        if row is None:
+            return 0
+        _, old = self._row(row)
+        self.conn.execute('DELETE FROM logs WHERE id = ?', (doc_id,))
+        self._bump_stats(old.get('user_id'), -user_stats.log_impact(old), -1)
+        self._bump_rollups(old.get('user_id'), old.get('timestamp'), -user_stats.log_impact(old))
+        return 1
+
+    def get_log(self, doc_id):
+        with self._lock:
+            row = self.conn.execute('SELECT * FROM logs WHERE id = ?', (doc_id,)).fetchone()
+        return self._row(row)[1] if row is not None else None
+
+    def _where(self, user_id=None, since=None, until=None):
+        where = []
+        args = []
+        if user_id:
+            where.append('user_id = ?')
+            args.append(user_id)
+        if since is not None:
+            where.append('timestamp >= ?')
+            args.append(_to_epoch(since))
+        if until is not None:
+            where.append('timestamp < ?')
+            args.append(_to_epoch(until))
+        return (' WHERE ' + ' AND '.join(where) if where else ''), args
+
+    def scan_details(self, details, page_size=500):
+        marks = ', '.join('?' * len(details))
+        last = ''
+        while True:
+            with self._lock:
+                rows = self.conn.execute(f'SELECT * FROM logs WHERE activity_detail IN ({marks}) AND id > ? ORDER BY id LIMIT ?',
+                                         list(details) + [last, int(page_size)]).fetchall()
+            for r in rows:
+                yield self._row(r)
+            if len(rows) < page_size:
+                return
+            last = rows[-1]['id']
+
+    def recompute_impacts(self, doc_ids, table):
+        # whole chunk in one transaction, impacts computed column-wise
+        doc_ids = list(doc_ids)
+        n = 0
+        with self._lock, self.conn:
+            for i in range(0, len(doc_ids), 900):
+                chunk = doc_ids[i:i + 900]
+                rows = self.conn.execute(f"SELECT * FROM logs WHERE id IN ({', '.join('?' * len(chunk))})", chunk).fetchall()
+                if not rows:
+                    continue
+                new = table.impacts([r['activity_detail'] for r in rows], [r['amount'] or 0 for r in rows])
+                for row, co2 in zip(rows, new.tolist()):
+                    if co2 == row['co2_impact'] and row['factor_version'] == table.version:
+                        continue
+                    _, old = self._row(row)
+                    self.conn.execute('UPDATE logs SET co2_impact = ?, factor_version = ? WHERE id = ?',
+                                      (co2, table.version, row['id']))
+                    delta = abs(co2) - user_stats.log_impact(old)
+                    if delta:
+                        self._bump_stats(old.get('user_id'), delta, 0)
+                        self._bump_rollups(old.get('user_id'), old.get('timestamp'), delta)
+                    n += 1
+        return n
+
+    def log_columns(self, user_id=None, since=None, until=None):
+        # decode straight from the raw columns, skipping per-row datetimes
+        where, args = self._where(user_id, since, until)
+        with self._lock, tracing.span('sqlite.log_columns', 'store') as sp:
+            cur = self.conn.execute('SELECT timestamp, co2_impact, user_id FROM logs' + where, args)
+            cur.row_factory = None
+            cols = LogColumns.from_rows(cur)
+            sp.add(docs=len(cols))
+            return cols
+
+    def page_logs(self, user_id=None, order='desc', limit=500, cursor=None):
+        # logs without a timestamp sort first ascending and last descending;
+        # they are paged as a segment of their own, by id, so every query can
+        # still seek on the timestamp index and none drop out of a full scan
+        where, args = self._where(user_id)
+        where += ' AND ' if where else ' WHERE '
+        cmp, direction = ('<', 'DESC') if order == 'desc' else ('>', 'ASC')
+        segments = [False, True] if order == 'desc' else [True, False]
+        if cursor is not None:
+            # cursor is the (timestamp, id) of the last row of the previous page
+            segments = segments[segments.index(cursor[0] is None):]
+        rows = []
+        with self._lock, tracing.span('sqlite.page_logs', 'store') as sp:
+            for untimed in segments:
+                if cursor is None or untimed != (cursor[0] is None):
+                    cond, extra = ('timestamp IS NULL' if untimed else 'timestamp IS NOT NULL'), []
+                elif untimed:
+                    cond, extra = f'timestamp IS NULL AND id {cmp} ?', [cursor[1]]
+                else:
+                    # the leading range term lets SQLite seek on the timestamp index
+                    cond = f'timestamp {cmp}= ? AND (timestamp {cmp} ? OR id {cmp} ?)'
+                    extra = [cursor[0], cursor[0], cursor[1]]
+                sql = f'SELECT * FROM logs{where}{cond} ORDER BY timestamp {direction}, id {direction} LIMIT ?'
+                rows += self.conn.execute(sql, args + extra + [int(limit) - len(rows)]).fetchall()
+                if len(rows) >= limit:
+                    break
+            sp.add(docs=len(rows))
+        with tracing.span('decode.rows', 'decode', rows=len(rows)):
+            page = [self._row(r) for r in rows]
+        return page, ((rows[-1]['timestamp'], rows[-1]['id']) if len(rows) == limit else None)
+
+    def query_logs(self, user_id=None, since=None, until=None, order=None, limit=None):
+        where, args = self._where(user_id, since, until)
+        sql = 'SELECT * FROM logs' + where
+        if order:
+            sql += ' ORDER BY timestamp DESC, id DESC' if order == 'desc' else ' ORDER BY timestamp ASC, id ASC'
+        if limit:
+            sql += ' LIMIT ?'
+            args.append(int(limit))
+        with self._lock, tracing.span('sqlite.query_logs', 'store') as sp:
+            rows = self.conn.execute(sql, args).fetchall()
+            sp.add(docs=len(rows))
+        for row in rows:
+            yield self._row(row)
+
+    def get_profiles(self, uids):
+        uids = [u for u in dict.fromkeys(uids) if u]
+        out = {}
+        with self._lock:
+            for i in range(0, len(uids), 500):
+                chunk = uids[i:i + 500]
+                marks = ','.join('?' * len(chunk))
+                for row in self.conn.execute(f'SELECT uid, profile FROM users WHERE uid IN ({marks})', chunk):
+                    out[row['uid']] = json.loads(row['profile'])
+        return out
+
+    def set_profile(self, uid, fields):
+        with self._lock, self.conn:
+            row = self.conn.execute('SELECT profile FROM users WHERE uid = ?', (uid,)).fetchone()
+            profile = json.loads(row['profile']) if row else {}
+            profile.update(fields)
+            self.conn.execute('INSERT OR REPLACE INTO users (uid, profile) VALUES (?, ?)', (uid, json.dumps(profile, default=str)))
+
+    def user_totals(self):
+        with self._lock, tracing.span('sqlite.user_totals', 'store') as sp:
+            rows = self.conn.execute('SELECT user_id, total_kg FROM user_stats WHERE log_count > 0').fetchall()
+            sp.add(docs=len(rows))
+        return {r['user_id']: max(r['total_kg'], 0.0) for r in rows}
+
+    def rebuild_user_stats(self):
+        with self._lock, self.conn:
+            self.conn.execute('DELETE FROM user_stats')
+            self.conn.execute(
+                "INSERT INTO user_stats (user_id, total_kg, log_count) "
+                "SELECT COALESCE(user_id, 'Unknown'), SUM(ABS(COALESCE(co2_impact, 0))), COUNT(*) FROM logs "
+                "GROUP BY COALESCE(user_id, 'Unknown')")
+            return self.conn.execute('SELECT COUNT(*) FROM user_stats').fetchone()[0]
+
+    @tracing.traced('sqlite.monthly_totals', 'store')
+    def monthly_totals(self, user_id=None):
+        with self._lock:
+            rows = self.conn.execute(
+                'SELECT substr(day, 1, 7) AS month, SUM(kg) AS kg FROM rollups_daily WHERE scope = ? GROUP BY month',
+                (user_id or rollups.GLOBAL_SCOPE,)).fetchall()
+        return {r['month']: r['kg'] for r in rows}
+
+    @tracing.traced('sqlite.daily_totals', 'store')
+    def daily_totals(self, since, user_id=None):
+        with self._lock:
+            rows = self.conn.execute(
+                'SELECT day, kg FROM rollups_daily WHERE scope = ? AND day >= ?',
+                (user_id or rollups.GLOBAL_SCOPE, since.strftime('%Y-%m-%d'))).fetchall()
+        return {r['day']: r['kg'] for r in rows}
+
+    def rebuild_rollups(self):
+        cols = self.log_columns()
+        rows = [(rollups.GLOBAL_SCOPE, day, kg) for day, kg in cols.sum_by_day().items()]
+        per_user = cols.sum_by_day(by_user=True)
+        for uid, days in per_user.items():
+            rows.extend((uid, day, kg) for day, kg in days.items())
+        with self._lock, self.conn:
+            self.conn.execute('DELETE FROM rollups_daily')
+            self.conn.executemany('INSERT INTO rollups_daily (scope, day, kg) VALUES (?, ?, ?)', rows)
+        return len(per_user) + (1 if rows else 0)
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+def firestore_client():
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+    if not firebase_admin._apps:
+        cred = credentials.Certificate(config.get('service_account', 'ECOTRACK_SERVICE_ACCOUNT', 'serviceAccountKey.json'))
+        firebase_admin.initialize_app(cred)
+    return firestore.client()
+
+
+class CachedStore(LogStore):
+    # Firestore with an on-disk SQLite copy. Reads are served from the copy,
+    # writes go to Firestore first and are then applied locally, and sync()
+    # pulls only what changed since the previous sync, tracked with one
+    # watermark per collection. The Firestore client is only created when a
+    # write or sync needs it, so the apps can render straight from disk.
+    name = 'cached'
+
+    # seconds re-read on each sync, to cover writes that commit out of order
+    SYNC_OVERLAP = 60
+
+    def __init__(self, remote_factory, path):
+        self._remote_factory = remote_factory
+        self._remote = None
+        self._remote_lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self.local = SqliteStore(path)
+        with self.local._lock, self.local.conn:
+            self.local.conn.execute(
+                'CREATE TABLE IF NOT EXISTS sync_state (collection TEXT PRIMARY KEY, watermark REAL NOT NULL)')
+
+    @property
+    def remote(self):
+        if self._remote is None:
+            with self._remote_lock:
+                if self._remote is None:
+                    self._remote = self._remote_factory()
+        return self._remote
+
+    # --- writes: Firestore, then the local copy ---
+    def add_log(self, data, doc_id=None):
+        doc_id = self.remote.add_log(data, doc_id)
+        self.local.add_log(data, doc_id)
+        return doc_id
+
+    def add_logs(self, items):
+        items = [(doc_id or uuid.uuid4().hex[:20], data) for doc_id, data in items]
+        n = self.remote.add_logs(items)
+        self.local.put_logs(items)
+        return n
+
+    def apply_writes(self, entries, on_commit=None):
+        # the write journal usually applied these locally already; replaying
+        # them once committed is harmless (every op is idempotent) and covers
+        # entries queued before the copy was open
+        by_key = {e['key']: e for e in entries}
+
+        def _committed(keys):
+            for key in keys:
+                self.local._apply_entry(by_key[key])
+            if on_commit is not None:
+                on_commit(keys)
+
+        self.remote.apply_writes(entries, _committed)
+
+    def update_log(self, doc_id, data):
+        self.remote.update_log(doc_id, data)
+        self.local.update_log(doc_id, data)
+
+    def delete_log(self, doc_id):
+        self.remote.delete_log(doc_id)
+        self.local.delete_log(doc_id)
+
+    def set_profile(self, uid, fields):
+        self.remote.set_profile(uid, fields)
+        self.local.set_profile(uid, fields)
+
+    def recompute_impacts(self, doc_ids, table):
+        doc_ids = list(doc_ids)
+        n = self.remote.recompute_impacts(doc_ids, table)
+        self.local.recompute_impacts(doc_ids, table)
+        return n
+
+    def scan_details(self, details, page_size=500):
+        # a maintenance scan; the copy may be behind, so ask Firestore
+        return self.remote.scan_details(details, page_size)
+
+    def rebuild_user_stats(self):
+        return self.remote.rebuild_user_stats()
+
+    def rebuild_rollups(self):
+        return self.remote.rebuild_rollups()
+
+    # --- reads: the local copy ---
+    def get_log(self, doc_id):
+        return self.local.get_log(doc_id)
+
+    def query_logs(self, user_id=None, since=None, until=None, order=None, limit=None):
+        return self.local.query_logs(user_id, since, until, order, limit)
+
+    def page_logs(self, user_id=None, order='desc', limit=500, cursor=None):
+        return self.local.page_logs(user_id, order, limit, cursor)
+
+    def log_columns(self, user_id=None, since=None, until=None):
+        return self.local.log_columns(user_id, since, until)
+
+    def get_profiles(self, uids):
+        return self.local.get_profiles(uids)
+
+    def user_totals(self):
+        return self.local.user_totals()
+
+    def monthly_totals(self, user_id=None):
+        return self.local.monthly_totals(user_id)
+
+    def daily_totals(self, since, user_id=None):
+        return self.local.daily_totals(since, user_id)
+
+    # --- sync ---
+    def _watermark(self, collection):
+        with self.local._lock:
+            row = self.local.conn.execute('SELECT watermark FROM sync_state WHERE collection = ?', (collection,)).fetchone()
+        return row['watermark'] if row else None
+
+    def _set_watermark(self, collection, value):
+        with self.local._lock, self.local.conn:
+            self.local.conn.execute('INSERT OR REPLACE INTO sync_state (collection, watermark) VALUES (?, ?)', (collection, value))
+
+    def _pull(self, collection, changes, field, apply):
+        started = time.time()
+        mark = self._watermark(collection)
+        since = datetime.fromtimestamp(mark - self.SYNC_OVERLAP, timezone.utc) if mark is not None else None
+        newest = [None]
+
+        def _stamped():
+            for key, d in changes(since):
+                ts = d.pop(field, None)
+                if hasattr(ts, 'timestamp'):
+                    newest[0] = max(newest[0] or 0, ts.timestamp())
+                yield key, d
+
+        n = apply(_stamped())
+        if newest[0] is not None:
+            self._set_watermark(collection, max(newest[0], mark or 0))
+        elif mark is None:
+            # first sync of data written before updated_at existed
+            self._set_watermark(collection, started)
+        return n
+
+    def _put_profiles(self, items):
+        n = 0
+        for uid, profile in items:
+            self.local.set_profile(uid, profile)
+            n += 1
+        return n
+
+    def sync(self):
+        # pull logs, deletions and profiles changed since the last sync;
+        # returns {collection: documents applied}
+        with self._sync_lock:
+            return {
+                'logs': self._pull('logs', self.remote.changed_logs, 'updated_at', self.local.put_logs),
+                'log_tombstones': self._pull(user_stats.TOMBSTONE_COLLECTION, self.remote.deleted_logs, 'deleted_at',
+                                             lambda items: self.local.delete_logs([k for k, _ in items])),
+                'users': self._pull('users', self.remote.changed_profiles, 'updated_at', self._put_profiles),
+            }
+
+    def close(self):
+        self.local.close()
+
+
+class LazyStore:
+    # stands in for a store until its first use, so an app can show its
+    # window before paying for the Firestore client; safe to touch from
+    # worker threads
+    def __init__(self, backend=None, path=None):
+        self._args = (backend, path)
+        self._store = None
+        self._lock = threading.Lock()
+        self.init_seconds = None
+
+    def get(self):
+        if self._store is None:
+            with self._lock:
+                if self._store is None:
+                    t0 = time.perf_counter()
+                    self._store = open_store(*self._args)
+                    self.init_seconds = time.perf_counter() - t0
+        return self._store
+
+    @property
+    def ready(self):
+        return self._store is not None
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+
+def open_store(backend=None, path=None, lazy=False):
+    # backend: 'firestore' (default) or 'sqlite'; path is the SQLite file
+    if lazy:
+        return LazyStore(backend, path)
+    backend = (backend or config.get('backend', 'ECOTRACK_BACKEND', 'firestore')).lower()
+    if backend in ('sqlite', 'local', 'memory'):
+        if backend == 'memory':
+            path = ':memory:'
+        return SqliteStore(path or config.get('sqlite_path', 'ECOTRACK_SQLITE_PATH', 'ecotrack.db'))
+    if backend != 'firestore':
+        raise ValueError(f'Unknown storage backend: {backend}')
+    if config.get_bool('cache', 'ECOTRACK_CACHE', False):
+        # Firestore behind a local SQLite copy kept current by sync()
+        return CachedStore(lambda: FirestoreStore(firestore_client()),
+                           config.get('cache_path', 'ECOTRACK_CACHE_PATH', 'ecotrack_cache.db'))
+    return FirestoreStore(firestore_client())
@@ -0,0 +1,85 @@
+import aggregations
+import tracing
+
+# The Summary tab's monthly bar chart. The Figure, Tk canvas and bar
+# artists are created once; later refreshes only move bar heights
+# (set_height), relabel the x axis when the month window has shifted, and
+# ask for a draw_idle(), so a refresh costs a few artist updates instead of
+# a new figure and widget.
+#
+# prepare() does the data work and is safe to call off the Tk thread;
+# show() must run on the Tk thread. save_png() renders the same chart to a
+# file on an Agg canvas, for headless callers.
+
+FACE = '#F8FCFB'
+BAR = '#2b8cbe'
+EDGE = '#08519c'
+SIZE = (8, 3.2)
+
+
+@tracing.traced('agg.summary_series', 'agg')
+def prepare(totals, now=None, months=12):
+    # (labels, tick labels, values, y limit) for show()
+    labels, values = aggregations.monthly_series(totals, now, months)
+    # thin the month labels on multi-year ranges
+    step = max(1, len(labels) // 12)
+    ticks = [l if i % step == 0 else '' for i, l in enumerate(labels)]
+    return labels, ticks, values, (max(values) * 1.15 if values else 0) or 1
+
+
+def _axes(fig):
+    ax = fig.add_subplot(111, facecolor=FACE)
+    ax.set_ylabel('kg CO2')
+    ax.grid(axis='y', linestyle='--', alpha=0.4)
+    return ax
+
+
+@tracing.traced('render.summary_png', 'render')
+def save_png(prepared, path, title=None):
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    labels, ticks, values, ylim = prepared
+    fig = Figure(figsize=SIZE, dpi=100, facecolor=FACE)
+    FigureCanvasAgg(fig)
+    ax = _axes(fig)
+    if title:
+        ax.set_title(title)
+    ax.bar(range(len(values)), values, color=BAR, edgecolor=EDGE)
+    ax.set_xticks(range(len(values)))
+    ax.set_xlim(-0.6, len(values) - 0.4)
+    ax.set_xticklabels(ticks, rotation=45, ha='right')
+    ax.set_ylim(0, ylim)
+    fig.tight_layout(pad=1.0)
+    fig.savefig(path, format='png', facecolor=FACE)
+
+
+class SummaryChart:
+    def __init__(self, master, plotting):
+        Figure, FigureCanvasTkAgg = plotting
+        self.fig = Figure(figsize=SIZE, dpi=100, facecolor=FACE)
+        self.ax = _axes(self.fig)
+        self.canvas = FigureCanvasTkAgg(self.fig, master=master)
+        self.canvas.get_tk_widget().pack(fill='both', expand=True)
+        self.bars = None
+        self.labels = None
+
+    @tracing.traced('tk.summary.draw', 'render')
+    def show(self, prepared):
+        labels, ticks, values, ylim = prepared
+        if self.bars is None or len(self.bars) != len(values):
+            # first draw, or the range changed length: new bar artists
+            if self.bars is not None:
+                self.bars.remove()
+            self.bars = self.ax.bar(range(len(values)), values, color=BAR, edgecolor=EDGE)
+            self.ax.set_xticks(range(len(values)))
+            self.ax.set_xlim(-0.6, len(values) - 0.4)
+            self.labels = None
+        else:
+            for bar, v in zip(self.bars, values):
+                bar.set_height(v)
+        if labels != self.labels:
+            self.ax.set_xticklabels(ticks, rotation=45, ha='right')
+            self.labels = labels
+            self.fig.tight_layout(pad=1.0)
+        self.ax.set_ylim(0, ylim)
+        self.canvas.draw_idle()
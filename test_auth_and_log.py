@@ -2,10 +2,12 @@ import os
 import time
 import json
 from datetime import datetime
-import requests
 
 from firebase_admin import credentials, initialize_app, firestore, auth
 
+from identity import AuthError, IdentityClient
+import user_stats
+
 
 def load_api_key():
     cfg_path = os.path.join(os.path.dirname(__file__), 'firebase_config.json')
@@ -36,16 +38,13 @@ def main():
     ts = int(time.time())
     email = f'testuser+{ts}@example.local'
     password = 'TestPass123!'
-    signup_url = f'https://identitytoolkit.googleapis.com/v1/accounts:signUp?key={api_key}'
-    payload = {'email': email, 'password': password, 'returnSecureToken': True}
     print('Registering test user:', email)
-    r = requests.post(signup_url, json=payload)
-    if r.status_code != 200:
-        print('Sign-up failed:', r.text)
+    try:
+        user = IdentityClient(api_key).sign_up(email, password)
+    except AuthError as ex:
+        print('Sign-up failed:', ex)
         return
-    data = r.json()
-    uid = data.get('localId')
-    id_token = data.get('idToken')
+    uid = user['uid']
     print('Created UID:', uid)
 
     # add a sample log
@@ -59,8 +58,8 @@ def main():
         'user_id': uid,
     }
     print('Adding test log to Firestore...')
-    ref = db.collection('logs').add(doc)
-    print('Log added, doc id:', ref[1].id if isinstance(ref, tuple) else getattr(ref, 'id', ref))
+    doc_id = user_stats.add_log(db, doc)
+    print('Log added, doc id:', doc_id)
 
     # aggregate user's total
     total = 0
@@ -69,6 +68,11 @@ def main():
         dd = d.to_dict()
         total += abs(dd.get('co2_impact', 0))
     print(f'Aggregated total for user {uid}:', total)
+    stats_total = user_stats.load_user_totals(db).get(uid, 0)
+    print(f'user_stats total for user {uid}:', stats_total)
+
+    # cleanup: remove the log through the same path so user_stats stays consistent
+    user_stats.delete_log(db, doc_id)
 
     # cleanup: delete the auth user we created
     try:
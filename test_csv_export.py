@@ -0,0 +1,37 @@
+import csv
+from datetime import datetime, timedelta
+
+import csv_export
+from storage import SqliteStore
+
+
+def _store(n, untimed_every=10):
+    store = SqliteStore()
+    now = datetime(2026, 3, 1, 12)
+    store.add_logs((f'log{i:05d}', {
+        'user_id': f'user{i % 7}',
+        'activity_type': 'Transport',
+        'activity_detail': 'Car (gasoline)',
+        'amount': 1.0,
+        'co2_impact': 0.2,
+        'timestamp': None if i % untimed_every == 0 else now - timedelta(minutes=i % 400),
+    }) for i in range(n))
+    return store
+
+
+def test_export_writes_every_log(tmp_path):
+    # logs without a timestamp used to drop out after the first page
+    store = _store(2500)
+    path = str(tmp_path / 'logs.csv')
+    rows = csv_export.export_single(store, path, page_size=97)
+    with open(path, newline='', encoding='utf-8') as f:
+        ids = [r['id'] for r in csv.DictReader(f)]
+    total = sum(1 for _ in store.query_logs())
+    assert rows == total == 2500
+    assert len(set(ids)) == total
+
+
+def test_export_per_user_writes_every_log(tmp_path):
+    store = _store(700)
+    rows, _ = csv_export.export_per_user(store, str(tmp_path), page_size=50)
+    assert rows == sum(1 for _ in store.query_logs())
@@ -0,0 +1,45 @@
+import random
+
+import numpy as np
+
+from emissions import FACTOR_VERSIONS, FactorTable
+
+
+def _table():
+    return FactorTable({1: {'Bus': 0.1, 'Car': 0.21, 'Beef': 27.0}, 2: {'Car': 0.17, 'Train': 0.041}})
+
+
+def _columns(details, n, seed=1):
+    rnd = random.Random(seed)
+    names = list(details) + ['Unknown', None]
+    out_details, amounts = [], []
+    for i in range(n):
+        out_details.append(rnd.choice(names))
+        # whole, cent and half-cent style amounts, plus zero
+        amounts.append(rnd.choice([0, rnd.randrange(1000), rnd.randrange(100000) / 100, rnd.randrange(1000) + 0.5,
+                                   rnd.uniform(0, 500)]))
+    return out_details, amounts
+
+
+def test_impacts_match_impact():
+    for table in (_table(), FactorTable(FACTOR_VERSIONS)):
+        details, amounts = _columns(table.rates, 20000)
+        vector = table.impacts(details, amounts)
+        assert vector.dtype == np.float64
+        assert vector.tolist() == [table.impact(d, a) for d, a in zip(details, amounts)]
+
+
+def test_impacts_empty_and_unknown():
+    table = _table()
+    assert table.impacts([], []).tolist() == []
+    assert table.impacts(['Nope', None], [3, 4]).tolist() == [0.0, 0.0]
+
+
+def test_versions_layer_over_each_other():
+    table = _table()
+    assert table.version == 2
+    assert table.rates_at(1) == {'Bus': 0.1, 'Car': 0.21, 'Beef': 27.0}
+    assert table.rates == {'Bus': 0.1, 'Car': 0.17, 'Beef': 27.0, 'Train': 0.041}
+    assert table.changed_since(1) == ['Car', 'Train']
+    assert table.changed_since(2) == []
+
@@ -0,0 +1,80 @@
+import csv
+import os
+
+import pytest
+
+import log_import
+from storage import LogStore, SqliteStore
+
+FIELDS = ['id', 'timestamp', 'user_id', 'activity_type', 'activity_detail', 'amount', 'description']
+
+
+class FailingStore(LogStore):
+    # SqliteStore whose chunk writes start failing after `fail_after` calls
+    def __init__(self, inner, fail_after=None):
+        self.inner = inner
+        self.fail_after = fail_after
+        self.calls = 0
+
+    def put_logs(self, items):
+        self.calls += 1
+        if self.fail_after is not None and self.calls > self.fail_after:
+            raise ConnectionError('offline')
+        return self.inner.put_logs(items)
+
+
+def _write_csv(path, n, bad_every=17):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        for i in range(n):
+            writer.writerow({
+                # every other row relies on the hashed id
+                'id': f'row{i:05d}' if i % 2 else '',
+                'timestamp': f'2026-03-{1 + i % 28:02d} {i % 24:02d}:{i % 60:02d}:00',
+                'user_id': f'user{i % 6}',
+                'activity_type': 'Transport',
+                'activity_detail': 'Bus (per mile)' if i % bad_every else 'Teleport',
+                'amount': str(1 + i % 40),
+                'description': f'trip {i}',
+            })
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_interrupted_import_resumes_from_the_checkpoint(tmp_path, monkeypatch, workers):
+    monkeypatch.setattr(log_import, 'RETRIES', 1)
+    path = str(tmp_path / 'history.csv')
+    _write_csv(path, 1000)
+    rejected = sum(1 for i in range(1000) if i % 17 == 0)
+    db = SqliteStore()
+
+    with pytest.raises(ConnectionError):
+        log_import.import_logs(FailingStore(db, fail_after=5), path, workers=workers, chunk_rows=50)
+    state = log_import.load_checkpoint(path)
+    assert state is not None and 0 < state['rows'] < 1000
+    assert state['written'] == sum(1 for _ in db.query_logs())
+
+    result = log_import.import_logs(FailingStore(db), path, workers=workers, chunk_rows=50)
+    assert result['skipped'] == state['rows']
+    assert result['rows'] == 1000
+    assert result['rejected'] == rejected
+    assert result['written'] == 1000 - rejected
+    # rows written after the last checkpoint are overwritten, not duplicated
+    assert sum(1 for _ in db.query_logs()) == 1000 - rejected
+    assert sum(n for _, n in db.user_totals().items()) == pytest.approx(
+        sum(log_import.to_log(r)[1]['co2_impact'] for r in log_import.read_rows(path) if r['activity_detail'] != 'Teleport'))
+
+
+def test_changed_source_starts_over(tmp_path, monkeypatch):
+    monkeypatch.setattr(log_import, 'RETRIES', 1)
+    path = str(tmp_path / 'history.csv')
+    _write_csv(path, 300)
+    with pytest.raises(ConnectionError):
+        log_import.import_logs(FailingStore(SqliteStore(), fail_after=2), path, workers=1, chunk_rows=50)
+    assert log_import.load_checkpoint(path)['written'] == 100
+    _write_csv(path, 301)
+    os.utime(path, (0, 0))
+    assert log_import.load_checkpoint(path) is None
+    result = log_import.import_logs(FailingStore(SqliteStore()), path, workers=1, chunk_rows=50)
+    assert result['skipped'] == 0
+    assert result['rows'] == 301
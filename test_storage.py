@@ -0,0 +1,97 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from emissions import FactorTable
+from storage import SqliteStore
+import user_stats
+
+
+def _logs(n, users=5, untimed_every=9, seed=1):
+    # a few duplicate timestamps and some logs without one
+    rnd = random.Random(seed)
+    now = datetime(2026, 3, 1, 12)
+    for i in range(n):
+        ts = None if i % untimed_every == 0 else now - timedelta(minutes=rnd.randrange(n // 4 + 1))
+        yield f'log{i:05d}', {
+            'user_id': f'user{i % users}',
+            'activity_type': 'Transport',
+            'activity_detail': 'Car (gasoline)',
+            'amount': 1.0,
+            'co2_impact': round(rnd.uniform(0.1, 5.0), 3),
+            'timestamp': ts,
+        }
+
+
+def test_keyset_paging_returns_every_log_once():
+    store = SqliteStore()
+    store.add_logs(_logs(3000))
+    for order in ('desc', 'asc'):
+        for user_id in (None, 'user2'):
+            expected = sum(1 for _ in store.query_logs(user_id=user_id))
+            for page_size in (1, 97, 1000, 5000):
+                ids = [doc_id for doc_id, _ in store.scan_logs(user_id=user_id, order=order, page_size=page_size)]
+                assert len(ids) == len(set(ids)) == expected, (order, user_id, page_size)
+
+
+def test_keyset_paging_order():
+    store = SqliteStore()
+    store.add_logs(_logs(500))
+    newest = [d.get('timestamp') for _, d in store.scan_logs(order='desc', page_size=37)]
+    timed = [ts for ts in newest if ts is not None]
+    assert timed == sorted(timed, reverse=True)
+    # logs without a timestamp come last, newest first
+    assert newest[len(timed):] == [None] * (len(newest) - len(timed))
+
+
+def _expected(store):
+    # user totals and daily rollups recomputed from the raw logs
+    users, days = {}, {}
+    for _, d in store.query_logs():
+        kg = user_stats.log_impact(d)
+        uid = d.get('user_id') or 'Unknown'
+        users[uid] = users.get(uid, 0.0) + kg
+        ts = d.get('timestamp')
+        if ts is not None:
+            day = ts.strftime('%Y-%m-%d')
+            days[day] = days.get(day, 0.0) + kg
+    return users, days
+
+
+def _check(store):
+    users, days = _expected(store)
+    since = datetime(2000, 1, 1)
+    assert store.user_totals() == pytest.approx(users)
+    live = {day: kg for day, kg in store.daily_totals(since).items() if abs(kg) > 1e-9}
+    assert live == pytest.approx({day: kg for day, kg in days.items() if kg})
+    # the incremental rollups agree with a rebuild from scratch
+    store.rebuild_rollups()
+    assert store.daily_totals(since) == pytest.approx({day: kg for day, kg in days.items() if kg})
+    before = store.user_totals()
+    store.rebuild_user_stats()
+    assert store.user_totals() == pytest.approx(before)
+
+
+def test_rollups_and_stats_follow_every_write():
+    store = SqliteStore()
+    items = list(_logs(400, untimed_every=13))
+    store.add_logs(items[:300])
+    for doc_id, data in items[300:350]:
+        store.add_log(data, doc_id=doc_id)
+    store.put_logs(items[350:])
+    _check(store)
+
+    rnd = random.Random(2)
+    for doc_id, _ in rnd.sample(items, 60):
+        store.update_log(doc_id, {'co2_impact': -rnd.uniform(0, 3), 'timestamp': datetime(2026, 2, rnd.randrange(1, 28), 9)})
+    # overwriting by id replaces a log rather than adding to it
+    store.put_logs(items[:20])
+    store.delete_logs([doc_id for doc_id, _ in items[100:140]])
+    store.delete_log(items[0][0])
+    store.delete_log('missing')
+    _check(store)
+
+    table = FactorTable({1: {'Car (gasoline)': 0.4}})
+    assert store.recompute_impacts([doc_id for doc_id, _ in items], table) > 0
+    _check(store)
@@ -0,0 +1,103 @@
+from datetime import datetime
+
+import pytest
+
+from storage import LogStore, SqliteStore
+import write_journal
+from write_journal import WriteJournal
+
+
+class FlakyStore(LogStore):
+    # SqliteStore whose apply_writes fails on demand: `offline` fails every
+    # call, `reject` fails any call that includes one of those doc ids
+    def __init__(self):
+        self.inner = SqliteStore()
+        self.offline = False
+        self.reject = {}
+        self.calls = 0
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+    def apply_writes(self, entries, on_commit=None):
+        self.calls += 1
+        if self.offline:
+            raise ConnectionError('offline')
+        for entry in entries:
+            if entry['doc_id'] in self.reject:
+                raise self.reject[entry['doc_id']]
+            self.inner._apply_entry(entry)
+            if on_commit is not None:
+                on_commit([entry['key']])
+
+
+def _log(i):
+    return {'user_id': 'u1', 'activity_type': 'Transport', 'activity_detail': 'Bus',
+            'amount': 1.0, 'co2_impact': 0.1 * i, 'timestamp': datetime(2026, 3, 1, 12, i)}
+
+
+def test_flush_commits_in_order_and_empties_the_queue():
+    store = FlakyStore()
+    journal = WriteJournal(store, ':memory:')
+    ids = [journal.add_log(_log(i)) for i in range(5)]
+    journal.update_log(ids[0], {'amount': 2.0})
+    journal.delete_log(ids[1])
+    assert journal.pending_count() == 7
+    assert journal.flush() == 7
+    assert journal.pending_count() == 0
+    assert store.inner.get_log(ids[0])['amount'] == 2.0
+    assert store.inner.get_log(ids[1]) is None
+    assert store.inner.user_totals() == {'u1': pytest.approx(0.1 * (0 + 2 + 3 + 4))}
+
+
+def test_offline_flush_keeps_entries_and_retries_later():
+    store = FlakyStore()
+    journal = WriteJournal(store, ':memory:')
+    journal.add_log(_log(1))
+    store.offline = True
+    for _ in range(write_journal.MAX_ATTEMPTS + 2):
+        with pytest.raises(ConnectionError):
+            journal.flush()
+    # network failures never dead-letter
+    assert journal.pending_count() == 1
+    assert journal.dead_letters() == []
+    store.offline = False
+    assert journal.flush() == 1
+    assert journal.pending_count() == 0
+
+
+def test_rejected_entry_is_dead_lettered_without_blocking_the_rest():
+    store = FlakyStore()
+    dead = []
+    journal = WriteJournal(store, ':memory:', on_dead=dead.extend)
+    journal.add_log(_log(1), doc_id='bad')
+    journal.add_log(_log(2), doc_id='good')
+    store.reject['bad'] = ValueError('rejected')
+    assert journal.flush() == 1
+    assert store.inner.get_log('good') is not None
+    assert journal.pending_count() == 0
+    assert [e['doc_id'] for e in dead] == ['bad']
+    letters = journal.dead_letters()
+    assert [e['doc_id'] for e in letters] == ['bad']
+    assert 'rejected' in letters[0]['last_error']
+
+    # once fixed, a retry sends it
+    del store.reject['bad']
+    assert journal.retry_dead() == 1
+    assert journal.flush() == 1
+    assert journal.dead_letters() == []
+
+
+def test_repeated_unknown_failure_is_dead_lettered_after_max_attempts():
+    store = FlakyStore()
+    journal = WriteJournal(store, ':memory:')
+    journal.add_log(_log(1), doc_id='stuck')
+    store.reject['stuck'] = RuntimeError('odd')
+    for _ in range(write_journal.MAX_ATTEMPTS - 1):
+        with pytest.raises(RuntimeError):
+            journal.flush()
+    assert journal.pending_count() == 1
+    assert journal.flush() == 0
+    assert journal.pending_count() == 0
+    assert journal.discard_dead() == 1
+    assert journal.dead_letters() == []
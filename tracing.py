@@ -0,0 +1,212 @@
+import atexit
+import functools
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+import config
+
+# Lightweight spans for the hot paths: store queries, document decoding,
+# aggregation and UI render steps.
+#
+#   with tracing.span('firestore.page_logs', 'store') as sp:
+#       snaps = list(q.stream())
+#       sp.add(docs=len(snaps), nbytes=...)
+#
+# Finished spans go to a bounded ring buffer (exportable as Chrome trace
+# JSON, for chrome://tracing or Perfetto) and to per-operation latency
+# samples for the diagnostics view. Tracing is off unless 'trace' /
+# ECOTRACK_TRACE or --trace is set, or enable() is called; while off, span()
+# hands back a shared no-op object, so an instrumented call costs one
+# function call and a flag check.
+#
+# --trace-out PATH turns tracing on and writes the Chrome trace on exit.
+
+MAX_EVENTS = 200000
+MAX_SAMPLES = 5000
+
+enabled = '--trace' in sys.argv[1:] or config.get_bool('trace', 'ECOTRACK_TRACE', False)
+_events = deque(maxlen=MAX_EVENTS)
+_samples = {}
+_lock = threading.Lock()
+_origin = time.perf_counter_ns()
+
+
+def enable(on=True):
+    global enabled
+    enabled = on
+
+
+class _NoSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add(self, docs=0, nbytes=0, **args):
+        pass
+
+    def __bool__(self):
+        # lets callers skip work that only feeds the span, e.g. size estimates
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+class Span:
+    __slots__ = ('name', 'cat', 'args', 'docs', 'nbytes', '_start')
+
+    def __init__(self, name, cat, args):
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.docs = 0
+        self.nbytes = 0
+
+    def __enter__(self):
+        self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter_ns()
+        args = dict(self.args) if self.args else {}
+        if self.docs:
+            args['docs'] = self.docs
+        if self.nbytes:
+            args['bytes'] = self.nbytes
+        if exc_type is not None:
+            args['error'] = exc_type.__name__
+        _record(self.name, self.cat, self._start, end, args, self.docs, self.nbytes)
+        return False
+
+    def add(self, docs=0, nbytes=0, **args):
+        self.docs += docs
+        self.nbytes += nbytes
+        if args:
+            self.args = dict(self.args or {}, **args)
+
+    def __bool__(self):
+        return True
+
+
+def span(name, cat='app', **args):
+    if not enabled:
+        return _NO_SPAN
+    return Span(name, cat, args)
+
+
+def traced(name, cat='app'):
+    # decorator form of span(); on a coroutine function the span covers the awaited call
+    def wrap(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def ainner(*a, **kw):
+                if not enabled:
+                    return await fn(*a, **kw)
+                with Span(name, cat, None):
+                    return await fn(*a, **kw)
+            return ainner
+
+        @functools.wraps(fn)
+        def inner(*a, **kw):
+            if not enabled:
+                return fn(*a, **kw)
+            with Span(name, cat, None):
+                return fn(*a, **kw)
+        return inner
+    return wrap
+
+
+def size_of(data):
+    # rough wire size of a document or list of documents, for `nbytes`
+    try:
+        return len(json.dumps(data, default=str))
+    except (TypeError, ValueError):
+        return 0
+
+
+def _record(name, cat, start, end, args, docs, nbytes):
+    thread = threading.current_thread()
+    _events.append((name, cat, start, end, thread.ident, thread.name, args))
+    with _lock:
+        stat = _samples.get(name)
+        if stat is None:
+            stat = _samples[name] = [deque(maxlen=MAX_SAMPLES), 0, 0, 0]
+        stat[0].append((end - start) / 1e6)
+        stat[1] += 1
+        stat[2] += docs
+        stat[3] += nbytes
+
+
+def _percentile(ordered, q):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def stats():
+    # [{'name', 'count', 'p50_ms', 'p95_ms', 'max_ms', 'docs', 'bytes'}] for
+    # this session, slowest p95 first; latencies cover the last MAX_SAMPLES calls
+    with _lock:
+        items = [(name, sorted(s[0]), s[1], s[2], s[3]) for name, s in _samples.items()]
+    out = [{'name': name, 'count': count, 'p50_ms': _percentile(ms, 0.5), 'p95_ms': _percentile(ms, 0.95),
+            'max_ms': ms[-1] if ms else 0.0, 'docs': docs, 'bytes': nbytes}
+           for name, ms, count, docs, nbytes in items]
+    out.sort(key=lambda r: r['p95_ms'], reverse=True)
+    return out
+
+
+def reset():
+    with _lock:
+        _events.clear()
+        _samples.clear()
+
+
+def chrome_trace():
+    # the recorded spans in Chrome's trace event format
+    pid = os.getpid()
+    events = []
+    names = {}
+    for name, cat, start, end, tid, thread_name, args in list(_events):
+        names[tid] = thread_name
+        events.append({'name': name, 'cat': cat, 'ph': 'X', 'pid': pid, 'tid': tid,
+                       'ts': (start - _origin) / 1000, 'dur': (end - start) / 1000, 'args': args})
+    for tid, thread_name in names.items():
+        events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': thread_name}})
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def export_chrome(path):
+    # returns the number of spans written
+    trace = chrome_trace()
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(trace, f, default=str)
+    return sum(1 for e in trace['traceEvents'] if e['ph'] == 'X')
+
+
+def add_arguments(parser):
+    # the flags above are read from sys.argv at import; argparse CLIs accept them too
+    parser.add_argument('--trace', action='store_true', help='record spans')
+    parser.add_argument('--trace-out', metavar='PATH', help='record spans and write a Chrome trace on exit')
+
+
+def _trace_out():
+    # --trace-out PATH or --trace-out=PATH, read before argparse runs
+    args = sys.argv[1:]
+    for i, arg in enumerate(args):
+        if arg == '--trace-out' and i + 1 < len(args):
+            return args[i + 1]
+        if arg.startswith('--trace-out='):
+            return arg.split('=', 1)[1] or None
+    return None
+
+
+if _trace_out():
+    enabled = True
+    atexit.register(export_chrome, _trace_out())
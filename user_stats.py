@@ -0,0 +1,218 @@
+import sys
+
+import cost
+import rollups
+from columnar import LogColumns
+import tracing
+
+# Per-user CO2 aggregates kept next to the raw logs so the leaderboard and
+# community total read one small document per user instead of every log.
+# The same transactions keep the daily/monthly rollups (rollups.py) current.
+STATS_COLLECTION = 'user_stats'
+# deleted log ids, so incremental syncs can drop them from local copies
+TOMBSTONE_COLLECTION = 'log_tombstones'
+BATCH_SIZE = 500
+
+
+def log_impact(data):
+    # the leaderboard has always ranked by absolute impact
+    try:
+        return abs(float((data or {}).get('co2_impact', 0) or 0))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _stats_ref(db, uid):
+    return db.collection(STATS_COLLECTION).document(uid or 'Unknown')
+
+
+def _stats_delta(uid, kg, count):
+    from firebase_admin import firestore
+    return {
+        'user_id': uid or 'Unknown',
+        'total_kg': firestore.Increment(kg),
+        'log_count': firestore.Increment(count),
+        'updated_at': firestore.SERVER_TIMESTAMP,
+    }
+
+
+def add_log(db, data, doc_id=None):
+    # write the log and bump its owner's totals in one transaction; with a
+    # client-chosen doc_id a replayed add is a no-op
+    from firebase_admin import firestore
+    log_ref = db.collection('logs').document(doc_id) if doc_id else db.collection('logs').document()
+    uid = data.get('user_id', 'Unknown')
+
+    # each _run returns its (reads, writes); they are recorded once the
+    # transaction commits, since Firestore may retry _run on contention.
+    # Writes are counted as they are issued: len(txn) counts distinct
+    # documents, and a rollup document can be written more than once
+    @firestore.transactional
+    def _run(txn):
+        reads = 1 if doc_id else 0
+        if doc_id and log_ref.get(transaction=txn).exists:
+            return reads, 0
+        txn.set(log_ref, dict(data, updated_at=firestore.SERVER_TIMESTAMP))
+        txn.set(_stats_ref(db, uid), _stats_delta(uid, log_impact(data), 1), merge=True)
+        return reads, 2 + rollups.apply(txn, db, uid, data.get('timestamp'), log_impact(data))
+
+    reads, writes = _run(db.transaction())
+    cost.record(reads=reads, writes=writes)
+    return log_ref.id
+
+
+def batch_add_log(batch, db, doc_id, data):
+    # add_log's writes on a WriteBatch; create() makes the whole batch fail
+    # if the log already exists, so a replayed batch can't double-count.
+    # Returns the number of writes added.
+    from firebase_admin import firestore
+    uid = data.get('user_id', 'Unknown')
+    batch.create(db.collection('logs').document(doc_id), dict(data, updated_at=firestore.SERVER_TIMESTAMP))
+    batch.set(_stats_ref(db, uid), _stats_delta(uid, log_impact(data), 1), merge=True)
+    return 2 + rollups.apply(batch, db, uid, data.get('timestamp'), log_impact(data))
+
+
+def update_log(db, doc_id, data):
+    from firebase_admin import firestore
+    log_ref = db.collection('logs').document(doc_id)
+
+    @firestore.transactional
+    def _run(txn):
+        snap = log_ref.get(transaction=txn)
+        if not snap.exists:
+            raise KeyError(doc_id)
+        old = snap.to_dict() or {}
+        uid = old.get('user_id', 'Unknown')
+        new = dict(old)
+        new.update(data)
+        txn.update(log_ref, dict(data, updated_at=firestore.SERVER_TIMESTAMP))
+        writes = 1
+        delta = log_impact(new) - log_impact(old)
+        if delta:
+            txn.set(_stats_ref(db, uid), _stats_delta(uid, delta, 0), merge=True)
+            writes += 1
+        if rollups.bucket(old.get('timestamp')) == rollups.bucket(new.get('timestamp')):
+            writes += rollups.apply(txn, db, uid, new.get('timestamp'), delta)
+        else:
+            writes += rollups.apply(txn, db, uid, old.get('timestamp'), -log_impact(old))
+            writes += rollups.apply(txn, db, uid, new.get('timestamp'), log_impact(new))
+        return writes
+
+    try:
+        writes = _run(db.transaction())
+    except KeyError:
+        cost.record(reads=1)
+        raise
+    cost.record(reads=1, writes=writes)
+
+
+def recompute_impacts(db, doc_ids, table):
+    # recompute co2_impact for up to ~80 logs in one transaction, from the
+    # detail and amount they hold at commit time; returns the number rewritten
+    from firebase_admin import firestore
+    refs = [db.collection('logs').document(doc_id) for doc_id in doc_ids]
+
+    @firestore.transactional
+    def _run(txn):
+        n = writes = 0
+        for snap in db.get_all(refs, transaction=txn):
+            if not snap.exists:
+                continue
+            old = snap.to_dict() or {}
+            co2 = table.impact(old.get('activity_detail'), old.get('amount') or 0)
+            if co2 == old.get('co2_impact') and old.get('factor_version') == table.version:
+                continue
+            uid = old.get('user_id', 'Unknown')
+            txn.update(snap.reference, {'co2_impact': co2, 'factor_version': table.version,
+                                        'updated_at': firestore.SERVER_TIMESTAMP})
+            writes += 1
+            delta = abs(co2) - log_impact(old)
+            if delta:
+                txn.set(_stats_ref(db, uid), _stats_delta(uid, delta, 0), merge=True)
+                writes += 1 + rollups.apply(txn, db, uid, old.get('timestamp'), delta)
+            n += 1
+        return n, writes
+
+    n, writes = _run(db.transaction())
+    cost.record(reads=len(refs), writes=writes)
+    return n
+
+
+def delete_log(db, doc_id):
+    from firebase_admin import firestore
+    log_ref = db.collection('logs').document(doc_id)
+
+    @firestore.transactional
+    def _run(txn):
+        snap = log_ref.get(transaction=txn)
+        if not snap.exists:
+            return False, 0
+        old = snap.to_dict() or {}
+        uid = old.get('user_id', 'Unknown')
+        txn.delete(log_ref)
+        txn.set(db.collection(TOMBSTONE_COLLECTION).document(doc_id), {'user_id': uid, 'deleted_at': firestore.SERVER_TIMESTAMP})
+        txn.set(_stats_ref(db, uid), _stats_delta(uid, -log_impact(old), -1), merge=True)
+        return True, 2 + rollups.apply(txn, db, uid, old.get('timestamp'), -log_impact(old))
+
+    deleted, writes = _run(db.transaction())
+    cost.record(reads=1, writes=writes, deletes=1 if deleted else 0)
+
+
+def load_user_totals(db):
+    # {uid: total_kg} for every user with at least one log
+    totals = {}
+    with tracing.span('firestore.user_totals', 'store') as sp:
+        for doc in db.collection(STATS_COLLECTION).stream():
+            d = doc.to_dict() or {}
+            sp.add(docs=1)
+            cost.record(reads=1)
+            if (d.get('log_count') or 0) <= 0:
+                continue
+            totals[d.get('user_id') or doc.id] = max(float(d.get('total_kg') or 0), 0.0)
+    return totals
+
+
+def rebuild_user_stats(db):
+    # one-off backfill: recompute every aggregate from the raw logs and drop
+    # stats documents for users that no longer have any
+    from firebase_admin import firestore
+    cols = LogColumns.from_logs((doc.id, doc.to_dict() or {}) for doc in db.collection('logs').stream())
+    by_user = cols.sum_by_user()
+    totals = {uid: kg for uid, (kg, _) in by_user.items()}
+    counts = {uid: n for uid, (_, n) in by_user.items()}
+
+    batch = db.batch()
+    pending = 0
+    for uid, kg in totals.items():
+        batch.set(_stats_ref(db, uid), {
+            'user_id': uid,
+            'total_kg': kg,
+            'log_count': counts[uid],
+            'updated_at': firestore.SERVER_TIMESTAMP,
+        })
+        pending += 1
+        if pending >= BATCH_SIZE:
+            batch.commit()
+            batch = db.batch()
+            pending = 0
+    for doc in db.collection(STATS_COLLECTION).stream():
+        if doc.id not in totals:
+            batch.delete(doc.reference)
+            pending += 1
+            if pending >= BATCH_SIZE:
+                batch.commit()
+                batch = db.batch()
+                pending = 0
+    if pending:
+        batch.commit()
+    return len(totals)
+
+
+if __name__ == '__main__':
+    if '--rebuild' not in sys.argv[1:]:
+        print('usage: python user_stats.py --rebuild')
+        sys.exit(2)
+    from storage import open_store
+    store = open_store()
+    n = store.rebuild_user_stats()
+    print(f'Rebuilt {STATS_COLLECTION} ({store.name}) for {n} users')
@@ -0,0 +1,220 @@
+import queue
+
+import tracing
+
+# Virtualised ttk.Treeview. The full result set lives in a plain list of
+# (iid, values) tuples and only a window around the visible rows (plus
+# `overscan` rows either side) exists as Treeview items; scrolling near the
+# window's edge re-centres it. The scrollbar is driven from the full list.
+#
+# Rows may be produced on any thread: put() only queues them, and a repeating
+# after() loop on the Tk thread drains the queue in batches, so large loads
+# never stall the UI and no Tk call is made off the Tk thread.
+# begin() starts a new load and returns a token; rows put with an older
+# token are dropped.
+#
+# on_end, if set, is called (on the Tk thread) when the viewport comes within
+# `overscan` rows of the last loaded row, so callers can fetch another page.
+
+OVERSCAN = 50
+BATCH_ROWS = 2000
+DRAIN_MS = 15
+
+
+class VirtualTree:
+    def __init__(self, tree, scrollbar, overscan=OVERSCAN):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.overscan = overscan
+        self.rows = []
+        self.start = 0
+        self.count = 0
+        self._selected = None
+        self.token = 0
+        self._queue = queue.Queue()
+        self._rewindow_pending = False
+        self.on_end = None
+        tree.configure(yscrollcommand=self._on_tree_scroll)
+        scrollbar.configure(command=self._on_scrollbar)
+        tree.bind('<<TreeviewSelect>>', self._remember_selection, add='+')
+        # created on the Tk thread, so the poll loop starts there
+        tree.after(DRAIN_MS, self._poll)
+
+    # --- loading ---
+    def begin(self):
+        # clear the view for a new load (Tk thread)
+        self.token += 1
+        token = self.token
+        self.rows = []
+        self._selected = None
+        self._render(0)
+        return token
+
+    def put(self, token, rows):
+        # queue rows for the view (any thread)
+        self._queue.put((token, rows))
+
+    def _poll(self):
+        # drain, then always reschedule: a failed batch must not stop the loop
+        try:
+            if not self._queue.empty():
+                self._drain()
+        except Exception as ex:
+            print(f'[EcoTrack] logs view drain failed: {ex!r}')
+        finally:
+            try:
+                self.tree.after(1 if not self._queue.empty() else DRAIN_MS, self._poll)
+            except Exception:
+                pass  # widget destroyed
+
+    @tracing.traced('tk.logs.drain', 'render')
+    def _drain(self):
+        taken = 0
+        grew = False
+        while taken < BATCH_ROWS:
+            try:
+                token, rows = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if token != self.token:
+                continue
+            self.rows.extend(rows)
+            taken += len(rows)
+            grew = True
+        if grew:
+            self._fill()
+
+    # --- local edits (Tk thread), e.g. optimistic writes ---
+    def _index(self, iid):
+        for i, (row_iid, _) in enumerate(self.rows):
+            if row_iid == iid:
+                return i
+        return None
+
+    def _top(self):
+        return int(self.start + self.tree.yview()[0] * max(self.count, 1))
+
+    def get(self, iid):
+        i = self._index(iid)
+        return self.rows[i][1] if i is not None else None
+
+    def prepend(self, iid, values):
+        top = self._top()
+        self.rows.insert(0, (iid, values))
+        self._render(top + 1 if top else 0)
+
+    def replace(self, iid, values):
+        i = self._index(iid)
+        if i is None:
+            return
+        self.rows[i] = (iid, values)
+        if self.tree.exists(iid):
+            self.tree.item(iid, values=values)
+
+    def remove(self, iid):
+        i = self._index(iid)
+        if i is None:
+            return
+        top = self._top()
+        del self.rows[i]
+        if self._selected == iid:
+            self._selected = None
+        self._render(top - 1 if i < top else top)
+
+    # --- rendering ---
+    def _visible(self):
+        try:
+            configured = int(self.tree.cget('height'))
+        except Exception:
+            configured = 10
+        try:
+            return max(configured, self.tree.winfo_height() // 20)
+        except Exception:
+            return configured
+
+    def _fill(self):
+        # top the window up with newly arrived rows, or just resync the scrollbar
+        want = self._visible() + 2 * self.overscan
+        end = min(len(self.rows), self.start + want)
+        for iid, values in self.rows[self.start + self.count:end]:
+            self.tree.insert('', 'end', iid=iid, values=values)
+        self.count = end - self.start
+        self._sync_scrollbar()
+        # a short result may not fill the viewport; ask for more straight away
+        if self.rows and self.count < self._visible():
+            self._reached_end()
+
+    @tracing.traced('tk.logs.render', 'render')
+    def _render(self, top):
+        visible = self._visible()
+        n = len(self.rows)
+        top = max(0, min(top, n - visible))
+        start = max(0, top - self.overscan)
+        end = min(n, top + visible + self.overscan)
+        children = self.tree.get_children()
+        if children:
+            self.tree.delete(*children)
+        for iid, values in self.rows[start:end]:
+            self.tree.insert('', 'end', iid=iid, values=values)
+        self.start, self.count = start, end - start
+        if self.count:
+            self.tree.yview_moveto((top - start) / self.count)
+        if self._selected is not None and self.tree.exists(self._selected):
+            self.tree.selection_set(self._selected)
+        self._sync_scrollbar()
+        if n and top + visible >= n - self.overscan:
+            self._reached_end()
+
+    def _sync_scrollbar(self):
+        n = len(self.rows)
+        if not n or not self.count:
+            self.scrollbar.set(0, 1)
+            return
+        first, last = self.tree.yview()
+        self.scrollbar.set((self.start + first * self.count) / n, (self.start + last * self.count) / n)
+
+    def _on_tree_scroll(self, first, last):
+        n = len(self.rows)
+        if not n or not self.count:
+            self.scrollbar.set(0, 1)
+            return
+        top = self.start + float(first) * self.count
+        bottom = self.start + float(last) * self.count
+        self.scrollbar.set(top / n, bottom / n)
+        if bottom >= n - self.overscan:
+            self._reached_end()
+        # re-centre once the view gets within half the overscan of a window edge
+        margin = self.overscan // 2
+        near_top = self.start > 0 and top - self.start < margin
+        near_end = self.start + self.count < n and self.start + self.count - bottom < margin
+        if (near_top or near_end) and not self._rewindow_pending:
+            self._rewindow_pending = True
+            self.tree.after_idle(lambda: self._rewindow(int(top)))
+
+    def _rewindow(self, top):
+        self._rewindow_pending = False
+        self._render(top)
+
+    def _on_scrollbar(self, *args):
+        n = len(self.rows)
+        if not n:
+            return
+        first = self.start + self.tree.yview()[0] * max(self.count, 1)
+        visible = self._visible()
+        if args[0] == 'moveto':
+            top = int(float(args[1]) * n)
+        elif args[0] == 'scroll':
+            step = visible if args[2] == 'pages' else 1
+            top = int(first) + int(args[1]) * step
+        else:
+            return
+        self._render(top)
+
+    def _reached_end(self):
+        if self.on_end is not None:
+            self.tree.after_idle(self.on_end)
+
+    def _remember_selection(self, e=None):
+        sel = self.tree.selection()
+        if sel:
+            self._selected = sel[0]
@@ -0,0 +1,87 @@
+import threading
+from datetime import datetime, timedelta
+
+from rollups import local_dt
+
+# One user's CO2 over the last `days` calendar days (today included), kept
+# as a ring buffer of daily sums plus a running total. Seed it once from the
+# daily rollups (a read or two), then apply local adds, edits and deletes;
+# total() costs no reads and O(1) work apart from clearing days that have
+# rolled out of the window.
+
+
+def _day(ts):
+    dt = local_dt(ts)
+    return dt.toordinal() if hasattr(dt, 'toordinal') else None
+
+
+class DailyWindow:
+    def __init__(self, user_id, days=7):
+        self.user_id = user_id
+        self.days = days
+        self._kg = [0.0] * days
+        self._slot_day = [None] * days
+        self._total = 0.0
+        self._today = None
+        self._lock = threading.Lock()
+
+    def seed(self, store, now=None):
+        now = now or datetime.now()
+        first = (now - timedelta(days=self.days - 1)).replace(hour=0, minute=0, second=0, microsecond=0)
+        daily = store.daily_totals(first, self.user_id)
+        with self._lock:
+            self._advance(now.toordinal())
+            for key, kg in daily.items():
+                try:
+                    day = datetime.strptime(key, '%Y-%m-%d').toordinal()
+                except ValueError:
+                    continue
+                self._add(day, kg or 0.0)
+        return self
+
+    def add(self, ts, kg):
+        day = _day(ts)
+        if day is None:
+            return
+        with self._lock:
+            self._advance(datetime.now().toordinal())
+            self._add(day, abs(kg or 0.0))
+
+    def remove(self, ts, kg):
+        day = _day(ts)
+        if day is None:
+            return
+        with self._lock:
+            self._advance(datetime.now().toordinal())
+            self._add(day, -abs(kg or 0.0))
+
+    def total(self, now=None):
+        with self._lock:
+            self._advance((now or datetime.now()).toordinal())
+            return max(self._total, 0.0)
+
+    def covers(self, ts):
+        day = _day(ts)
+        today = datetime.now().toordinal()
+        return day is not None and today - self.days < day <= today
+
+    def _advance(self, today):
+        if self._today is not None and today <= self._today:
+            return
+        first = today - self.days + 1
+        for i, day in enumerate(self._slot_day):
+            if day is not None and day < first:
+                self._total -= self._kg[i]
+                self._kg[i] = 0.0
+                self._slot_day[i] = None
+        self._today = today
+
+    def _add(self, day, kg):
+        if day > self._today or day <= self._today - self.days:
+            return
+        i = day % self.days
+        if self._slot_day[i] != day:
+            self._slot_day[i] = day
+            self._kg[i] = 0.0
+        self._kg[i] += kg
+        self._total += kg
@@ -0,0 +1,272 @@
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+
+import cost
+
+# Offline-first write path for the apps. Writes are appended to a durable
+# SQLite journal (and, with the local cache, applied to its copy) and return
+# immediately; a background flusher replays them against the store with
+# LogStore.apply_writes, which batches them into Firestore WriteBatches.
+# Entries leave the journal only once committed, so queued writes survive a
+# crash or a dropped connection and are retried with exponential backoff.
+#
+# Each entry carries an idempotency key, and adds use a client-chosen doc
+# id, so replaying an entry that already landed has no further effect.
+#
+# When a batch fails for a reason other than the network, its entries are
+# replayed one by one so a single bad entry can't hold back the rest. An
+# entry the store rejects outright (a denied or invalid write, an edit of a
+# log that no longer exists), or that keeps failing for MAX_ATTEMPTS
+# flushes, is dead-lettered: it stays in the journal, out of the queue,
+# until the user retries or discards it (dead_letters(), retry_dead(),
+# discard_dead()).
+
+FLUSH_DELAY = 0.2
+MAX_ENTRIES_PER_FLUSH = 500
+MAX_BACKOFF = 60
+MAX_ATTEMPTS = 5
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {'__datetime__': value.isoformat()}
+    raise TypeError(f'Cannot journal {type(value).__name__}')
+
+
+def _decode(d):
+    if '__datetime__' in d:
+        return datetime.fromisoformat(d['__datetime__'])
+    return d
+
+
+def _api_errors():
+    try:
+        from google.api_core import exceptions
+    except ImportError:
+        return None
+    return exceptions
+
+
+def _transient(ex):
+    # the network or the service is at fault, not the entry: back off and retry
+    if isinstance(ex, OSError):
+        return True
+    api = _api_errors()
+    return api is not None and isinstance(ex, (api.ServiceUnavailable, api.DeadlineExceeded, api.Aborted,
+                                               api.InternalServerError, api.TooManyRequests, api.RetryError))
+
+
+def _permanent(ex):
+    # the store rejected the entry itself; retrying can't help
+    if isinstance(ex, (KeyError, ValueError, TypeError)):
+        return True
+    api = _api_errors()
+    return api is not None and isinstance(ex, (api.PermissionDenied, api.InvalidArgument, api.NotFound,
+                                               api.FailedPrecondition))
+
+
+class WriteJournal:
+    def __init__(self, store, path, on_flushed=None, on_error=None, on_dead=None):
+        self.store = store
+        self.on_flushed = on_flushed
+        self.on_error = on_error
+        self.on_dead = on_dead
+        self.last_error = None
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self._lock = threading.RLock()
+        with self._lock, self.conn:
+            if path != ':memory:':
+                self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute(
+                'CREATE TABLE IF NOT EXISTS journal ('
+                'seq INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT UNIQUE NOT NULL, op TEXT NOT NULL, '
+                'doc_id TEXT NOT NULL, payload TEXT NOT NULL, created REAL NOT NULL, '
+                'attempts INTEGER NOT NULL DEFAULT 0, last_error TEXT, dead INTEGER NOT NULL DEFAULT 0)')
+            columns = {r['name'] for r in self.conn.execute('PRAGMA table_info(journal)')}
+            if 'dead' not in columns:
+                # journals written before entries could be dead-lettered
+                self.conn.execute('ALTER TABLE journal ADD COLUMN dead INTEGER NOT NULL DEFAULT 0')
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # --- writes (return at local speed) ---
+    def add_log(self, data, doc_id=None):
+        doc_id = doc_id or uuid.uuid4().hex[:20]
+        self._append('add_log', doc_id, data)
+        return doc_id
+
+    def update_log(self, doc_id, data):
+        self._append('update_log', doc_id, data)
+
+    def delete_log(self, doc_id):
+        self._append('delete_log', doc_id, {})
+
+    def set_profile(self, uid, fields):
+        self._append('set_profile', uid, fields)
+
+    def _append(self, op, doc_id, payload):
+        key = uuid.uuid4().hex
+        with self._lock, self.conn:
+            self.conn.execute(
+                'INSERT INTO journal (key, op, doc_id, payload, created) VALUES (?, ?, ?, ?, ?)',
+                (key, op, doc_id, json.dumps(payload, default=_encode), time.time()))
+        self._apply_locally({'key': key, 'op': op, 'doc_id': doc_id, 'payload': payload})
+        self._wake.set()
+        return key
+
+    def _apply_locally(self, entry):
+        # optimistic: with the local cache, reads see the write straight away
+        # (a lazy store that isn't open yet is left alone; the flush covers it)
+        if not getattr(self.store, 'ready', True):
+            return
+        local = getattr(self.store, 'local', None)
+        if local is None:
+            return
+        try:
+            local._apply_entry(entry)
+        except Exception as ex:
+            print(f"[EcoTrack] local apply failed for {entry['op']} {entry['doc_id']}: {ex!r}")
+
+    # --- queue state ---
+    def pending(self, limit=MAX_ENTRIES_PER_FLUSH):
+        with self._lock:
+            rows = self.conn.execute('SELECT key, op, doc_id, payload FROM journal WHERE dead = 0 ORDER BY seq LIMIT ?',
+                                     (limit,)).fetchall()
+        return [{'key': r['key'], 'op': r['op'], 'doc_id': r['doc_id'], 'payload': json.loads(r['payload'], object_hook=_decode)}
+                for r in rows]
+
+    def pending_count(self):
+        with self._lock:
+            return self.conn.execute('SELECT COUNT(*) FROM journal WHERE dead = 0').fetchone()[0]
+
+    def dead_letters(self):
+        # entries set aside after the store rejected them, oldest first
+        with self._lock:
+            rows = self.conn.execute('SELECT key, op, doc_id, payload, created, attempts, last_error FROM journal '
+                                     'WHERE dead = 1 ORDER BY seq').fetchall()
+        return [{'key': r['key'], 'op': r['op'], 'doc_id': r['doc_id'], 'payload': json.loads(r['payload'], object_hook=_decode),
+                 'created': datetime.fromtimestamp(r['created']), 'attempts': r['attempts'], 'last_error': r['last_error']}
+                for r in rows]
+
+    def retry_dead(self, keys=None):
+        # put dead-lettered entries (all of them by default) back in the queue
+        with self._lock, self.conn:
+            if keys is None:
+                n = self.conn.execute('UPDATE journal SET dead = 0, attempts = 0 WHERE dead = 1').rowcount
+            else:
+                n = sum(self.conn.execute('UPDATE journal SET dead = 0, attempts = 0 WHERE dead = 1 AND key = ?', (k,)).rowcount
+                        for k in keys)
+        self._wake.set()
+        return n
+
+    def discard_dead(self, keys=None):
+        with self._lock, self.conn:
+            if keys is None:
+                return self.conn.execute('DELETE FROM journal WHERE dead = 1').rowcount
+            return sum(self.conn.execute('DELETE FROM journal WHERE dead = 1 AND key = ?', (k,)).rowcount for k in keys)
+
+    def _committed(self, keys):
+        with self._lock, self.conn:
+            self.conn.executemany('DELETE FROM journal WHERE key = ?', [(k,) for k in keys])
+
+    def _failed(self, keys, error, count=True):
+        # network failures don't count against an entry's attempts
+        with self._lock, self.conn:
+            self.conn.executemany('UPDATE journal SET attempts = attempts + ?, last_error = ? WHERE key = ?',
+                                  [(1 if count else 0, repr(error), k) for k in keys])
+
+    def _dead_letter(self, entry, error):
+        print(f"[EcoTrack] journal entry set aside: {entry['op']} {entry['doc_id']}: {error!r}")
+        with self._lock, self.conn:
+            self.conn.execute('UPDATE journal SET dead = 1, last_error = ? WHERE key = ?', (repr(error), entry['key']))
+
+    # --- flushing ---
+    def flush(self):
+        # commit everything queued; returns the number of entries committed
+        done = 0
+        while True:
+            entries = self.pending()
+            if not entries:
+                return done
+            landed = []
+
+            def _on_commit(keys):
+                self._committed(keys)
+                landed.extend(keys)
+
+            try:
+                with cost.operation('journal.flush'):
+                    self.store.apply_writes(entries, _on_commit)
+            except Exception as ex:
+                rest = [e for e in entries if e['key'] not in set(landed)]
+                if _transient(ex):
+                    self._failed([e['key'] for e in rest], ex, count=False)
+                    raise
+                dead, error = self._isolate(rest, _on_commit)
+                if dead and self.on_dead is not None:
+                    self.on_dead(dead)
+                if error is not None:
+                    raise error
+            done += len(landed)
+
+    def _isolate(self, entries, on_commit):
+        # replay a failed batch one entry at a time; returns the entries
+        # dead-lettered and the error that stopped the replay (or None)
+        dead = []
+        for entry in entries:
+            try:
+                with cost.operation('journal.flush'):
+                    self.store.apply_writes([entry], on_commit)
+            except Exception as ex:
+                transient = _transient(ex)
+                self._failed([entry['key']], ex, count=not transient)
+                if transient or not (_permanent(ex) or self._attempts(entry['key']) >= MAX_ATTEMPTS):
+                    return dead, ex
+                self._dead_letter(entry, ex)
+                dead.append(entry)
+        return dead, None
+
+    def _attempts(self, key):
+        with self._lock:
+            row = self.conn.execute('SELECT attempts FROM journal WHERE key = ?', (key,)).fetchone()
+        return row['attempts'] if row else 0
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='write-journal', daemon=True)
+            self._thread.start()
+        # anything left over from the last session goes out first
+        self._wake.set()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def _run(self):
+        backoff = 0
+        while not self._stop.is_set():
+            self._wake.wait(timeout=backoff or None)
+            if self._stop.is_set():
+                return
+            # let a burst of clicks land in the same batch
+            time.sleep(FLUSH_DELAY)
+            self._wake.clear()
+            try:
+                n = self.flush()
+            except Exception as ex:
+                self.last_error = ex
+                backoff = min(max(backoff * 2, 1), MAX_BACKOFF)
+                if self.on_error is not None:
+                    self.on_error(ex, backoff)
+                continue
+            self.last_error = None
+            backoff = 0
+            if n and self.on_flushed is not None:
+                self.on_flushed(n)